@@ -0,0 +1,117 @@
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
+
+from app.core.security import verify_admin_token
+from app.models.schemas import AdminStatus
+from app.services.admin_service import (
+    FLEET_CACHES,
+    admin_status,
+    forward_admin_action,
+    invalidate_cache,
+    invalidate_facility,
+)
+from app.services.health_service import start_warmup
+from app.services.sweep_progress import sweep_progress
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(dependencies=[Depends(verify_admin_token)])
+
+
+@router.get("/status", response_model=AdminStatus)
+async def get_admin_status():
+    """
+    Get the health of the service with the statistics of the fleet caches
+
+    Returns:
+        AdminStatus: The snapshot age, circuit state, sweep progress and cache statistics
+    """
+    return admin_status()
+
+
+@router.post("/warmup", response_model=AdminStatus, status_code=202)
+async def warmup(invalidate: bool = Query(False, description="Invalidate the fleet caches first")):
+    """
+    Rebuild the fleet snapshot in the background (a no-op while a warmup is running).
+    Under the preforking server, the master rebuilds it and publishes it to every worker
+
+    Args:
+        invalidate (bool): Invalidate the fleet caches first, so that the whole snapshot is fetched again
+
+    Returns:
+        AdminStatus: The status, with the warmup running
+    """
+    if invalidate:
+        for name in FLEET_CACHES:
+            invalidate_cache(name, rebuild=False)
+    if not forward_admin_action("warmup", invalidate=invalidate):
+        start_warmup(force=True)
+    return admin_status()
+
+
+@router.post("/caches/{name}/invalidate", response_model=AdminStatus)
+async def invalidate_fleet_cache(name: str = Path(..., description="The cache name, or 'all'")):
+    """
+    Invalidate a fleet cache (carpark_ids, carpark_locations or no_update_carparks), or all of them,
+    and rebuild the fleet snapshot in the background (by the master, under the preforking server)
+
+    Args:
+        name (str): The cache name, or "all"
+
+    Returns:
+        AdminStatus: The status after the invalidation
+    """
+    if name != "all" and name not in FLEET_CACHES:
+        raise HTTPException(status_code=404, detail="Unknown cache: {}".format(name))
+    for cache_name in FLEET_CACHES if name == "all" else [name]:
+        invalidate_cache(cache_name, rebuild=False)
+    if not forward_admin_action("invalidate_cache", name=name):
+        start_warmup(force=True)
+    return admin_status()
+
+
+@router.post("/facilities/{facility_id}/invalidate", response_model=AdminStatus)
+async def invalidate_carpark(facility_id: str = Path(..., pattern=r"^\d+$")):
+    """
+    Invalidate what is known about a carpark: its last known details, availability and cached
+    response, and its no-update status (it is served again, and checked by the next no-update sweep)
+
+    Args:
+        facility_id (str): ID of the carpark facility
+
+    Returns:
+        AdminStatus: The status after the invalidation
+    """
+    invalidate_facility(facility_id)
+    forward_admin_action("invalidate_facility", facility_id=facility_id)
+    return admin_status()
+
+
+@router.post("/sweeps/pause", response_model=AdminStatus)
+async def pause_sweeps():
+    """
+    Pause the background sweeps and polling: the fleet results are served from the caches,
+    or the last known results once the caches expire
+
+    Returns:
+        AdminStatus: The status, with the sweeps paused
+    """
+    sweep_progress.pause()
+    forward_admin_action("pause")
+    logger.warning("The background sweeps are paused")
+    return admin_status()
+
+
+@router.post("/sweeps/resume", response_model=AdminStatus)
+async def resume_sweeps():
+    """
+    Resume the background sweeps and polling
+
+    Returns:
+        AdminStatus: The status, with the sweeps running again
+    """
+    sweep_progress.resume()
+    forward_admin_action("resume")
+    logger.info("The background sweeps are resumed")
+    return admin_status()
@@ -1,29 +1,93 @@
 import logging
-from typing import List
+import time
+from datetime import datetime
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response
 
+from app.core.config import NEARBY_BATCH_MAX_ORIGINS
+from app.core.metrics import instrument_endpoint, nearby_results
 from app.core.security import verify_api_key
-from app.models.schemas import Carpark, CarparkDetail
-from app.services.nsw_transport_api import (
+from app.core.timing import TimedRoute, run_profiled_in_threadpool, timed_phase
+from app.models.schemas import (
+    AvailabilityForecast,
+    Carpark,
+    CarparkDetail,
+    FacilityFreshness,
+    FacilityState,
+    FleetChanges,
+    HistoryPoint,
+    NearbyBatchRequest,
+    NearbyBatchResult,
+    OccupancyHistory,
+    ZoneAvailability,
+)
+from app.services.availability_service import (
+    AvailabilityStatus,
+    availability_matcher,
+    availability_store,
     available_status,
+)
+from app.services.change_log import change_log
+from app.services.fleet_snapshot import FleetSnapshot, fleet_snapshots
+from app.services.geocoding_service import GeocodingError, geocoding_service, normalize_address
+from app.services.location_index import LocationIndex
+from app.services.nsw_transport_api import (
     get_carpark_details,
-    get_carpark_locations,
+    get_last_known_details,
     get_no_update_carparks,
+    upstream_breaker,
 )
-from app.utils.distance import haversine_distance
-from app.utils.time_utils import parse_message_date
+from app.services.occupancy_forecast import occupancy_forecaster
+from app.services.occupancy_history import occupancy_history
+from app.services.polling_scheduler import get_polled_details, polling_scheduler
+from app.services.response_cache import (
+    EncodedResponse,
+    detail_responses,
+    etag_matches,
+    no_update_responses,
+)
+from app.services.zone_service import zone_cache
+from app.utils.time_utils import SYDNEY_TZ, parse_message_date
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
+
+# The details the responses of the no-update carparks are built from: none, the response only depends on the ID
+NO_UPDATE_DETAILS: dict = {}
+
+
+async def get_fleet_snapshot() -> Optional[FleetSnapshot]:
+    """
+    Get the current fleet snapshot. A cold process builds it first, which sweeps the NSW API, and
+    new availabilities are republished with the fleet state: both block, so they run in the
+    threadpool to keep serving other requests meanwhile.
+
+    Returns:
+        FleetSnapshot: The snapshot, or None if there are no carpark locations
+    """
+    snapshot = fleet_snapshots.current()
+    if snapshot is None or snapshot.availability_revision != availability_store.revision:
+        return await run_profiled_in_threadpool(fleet_snapshots.get)
+    return fleet_snapshots.get()
 
 
 @router.get("/nearby", response_model=List[Carpark])
+@instrument_endpoint("nearby")
 async def get_nearby_carparks(
-    lat: float = Query(..., description="Latitude of the search point"),
-    lng: float = Query(..., description="Longitude of the search point"),
-    radius_km: float = Query(10, description="Search radius in kilometers", ge=0),
+    lat: Optional[float] = Query(None, description="Latitude of the search point"),
+    lng: Optional[float] = Query(None, description="Longitude of the search point"),
+    radius_km: Optional[float] = Query(
+        None, description="Search radius in kilometers (default 10km, no limit with k)", ge=0
+    ),
+    address: Optional[str] = Query(
+        None, description="Address of the search point, instead of lat and lng", min_length=1, max_length=200
+    ),
+    k: Optional[int] = Query(None, description="Return the k nearest carparks, whatever their distance", ge=1, le=100),
+    min_available: Optional[int] = Query(None, description="Only the carparks with this many available spots", ge=0),
+    status: Optional[List[AvailabilityStatus]] = Query(None, description="Only the carparks with these statuses"),
+    response: Response = None,
     api_key: str = Depends(verify_api_key),
 ):
     """
@@ -32,85 +96,246 @@ async def get_nearby_carparks(
     Parameters:
         lat (float): Latitude of the search point
         lng (float): Longitude of the search point
-        radius_km (float): Search radius in kilometers, default is 10km
+        radius_km (float): Search radius in kilometers, default is 10km (no limit if k is given)
+        address (str): Address of the search point (e.g. "Central Station, Sydney"), instead of lat and lng
+        k (int): Return the k nearest carparks instead of all the carparks within the radius
+        min_available (int): Only return the carparks with at least this many available spots
+        status (List[str]): Only return the carparks with one of these statuses (e.g. Available, Almost Full)
+        response (Response): The response, to flag stale data with the X-Data-Stale header
         api_key (str): API key for authentication
 
     Returns:
-        List[Carpark]: List of carpark objects within the radius
+        List[Carpark]: List of carpark objects within the radius (or the k nearest), nearest first
     """
+    if lat is None or lng is None:
+        if not address:
+            raise HTTPException(status_code=422, detail="Either lat and lng, or address, are required")
+        if not normalize_address(address):
+            # e.g. only punctuation or spaces: never sent to the geocoding provider nor cached
+            raise HTTPException(status_code=422, detail="The address must contain a letter or a digit")
+        try:
+            # The geocoder may call its provider, which blocks
+            coords = await run_profiled_in_threadpool(geocoding_service.geocode, address)
+        except GeocodingError as e:
+            logger.error("Failed to geocode address {}: {}".format(address, e))
+            raise HTTPException(status_code=503, detail="Geocoding service unavailable")
+        if coords is None:
+            raise HTTPException(status_code=404, detail="Address not found: {}".format(address))
+        lat, lng = coords
+
     try:
-        data = get_carpark_locations()
-        if not data:
+        with timed_phase("cache"):
+            snapshot = await get_fleet_snapshot()
+        if snapshot is None:
             return []
+        if snapshot.stale and response is not None:
+            response.headers["X-Data-Stale"] = "true"
 
-        carparks = data.get("carparks", [])
-        if not isinstance(carparks, list):
-            logger.warning("Unexpected structure: carparks is not a list")
-            return []
+        with timed_phase("compute"):
+            # The carparks are filtered by their last known availability during the search
+            include = availability_matcher(snapshot.availability, min_available, status)
+            if k is not None:
+                matches = snapshot.index.nearest(lat, lng, k, radius_km, include)
+            else:
+                matches = snapshot.index.within(lat, lng, 10 if radius_km is None else radius_km, include)
+            nearby_carparks = [
+                Carpark(facility_id=facility_id, name=name, distance_km=round(distance, 2))
+                for distance, facility_id, name in matches
+            ]
 
-        nearby_carparks = []
-        for carpark in carparks:
-            try:
-                carpark_lat = float(carpark.get("location", {}).get("latitude"))
-                carpark_lon = float(carpark.get("location", {}).get("longitude"))
-
-                distance = haversine_distance(lat, lng, carpark_lat, carpark_lon)
-
-                if distance <= radius_km:
-                    nearby_carparks.append(
-                        Carpark(
-                            facility_id=carpark.get("facility_id"),
-                            name=carpark.get("name", "Unknown"),
-                            distance_km=round(distance, 2),
-                        )
-                    )
+        nearby_results.observe(len(nearby_carparks))
+        return nearby_carparks
 
-            except (TypeError, ValueError) as e:
-                logger.error("Error processing carpark {}: {}".format(carpark.get("facility_id"), e))
-                continue
+    except Exception as e:
+        logger.error("Error in get_nearby_carparks: {}".format(str(e)))
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post("/nearby/batch", response_model=List[NearbyBatchResult])
+@instrument_endpoint("nearby_batch")
+async def get_nearby_carparks_batch(
+    request: NearbyBatchRequest,
+    response: Response = None,
+    api_key: str = Depends(verify_api_key),
+):
+    """
+    Get the carparks within the radius of each of many origins (e.g. the stations of a train line),
+    answered in one pass over the location index.
 
-        return sorted(nearby_carparks, key=lambda x: x.distance_km)
+    Parameters:
+        request (NearbyBatchRequest): The origins, each with its own radius
+        response (Response): The response, to flag stale data with the X-Data-Stale header
+        api_key (str): API key for authentication
+
+    Returns:
+        List[NearbyBatchResult]: The origins with their nearby carparks (nearest first), in the request order
+    """
+    if len(request.origins) > NEARBY_BATCH_MAX_ORIGINS:
+        raise HTTPException(status_code=422, detail="At most {} origins are allowed".format(NEARBY_BATCH_MAX_ORIGINS))
+
+    try:
+        with timed_phase("cache"):
+            snapshot = await get_fleet_snapshot()
+        if snapshot is not None and snapshot.stale and response is not None:
+            response.headers["X-Data-Stale"] = "true"
+        index = snapshot.index if snapshot is not None else LocationIndex([])
+
+        with timed_phase("compute"):
+            origins = [(origin.lat, origin.lng, origin.radius_km) for origin in request.origins]
+            results = []
+            for origin, matches in zip(request.origins, index.within_many(origins)):
+                nearby_results.observe(len(matches))
+                results.append(
+                    NearbyBatchResult(
+                        lat=origin.lat,
+                        lng=origin.lng,
+                        radius_km=origin.radius_km,
+                        carparks=[
+                            Carpark(facility_id=facility_id, name=name, distance_km=round(distance, 2))
+                            for distance, facility_id, name in matches
+                        ],
+                    )
+                )
+        return results
 
     except Exception as e:
-        logger.error("Error in get_nearby_carparks: {}".format(str(e)))
+        logger.error("Error in get_nearby_carparks_batch: {}".format(str(e)))
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
-@router.get("/{facility_id}", response_model=CarparkDetail)
-async def get_carpark_available_details(
+@router.get("/changes", response_model=FleetChanges)
+@instrument_endpoint("changes")
+async def get_fleet_changes(
+    since: Optional[str] = Query(
+        None,
+        description="The version cursor of the fleet state the client has, none for the whole fleet",
+        max_length=64,
+    ),
+    api_key: str = Depends(verify_api_key),
+):
+    """
+    Get the facilities whose location, no-update status or availability changed after a version
+    of the fleet state, for the clients mirroring the fleet.
+
+    Parameters:
+        since (str, optional): The version cursor the client has (the `version` of its last response)
+        api_key (str): API key for authentication
+
+    Returns:
+        FleetChanges: The current version cursor and the changed and removed facilities, or the whole
+                      fleet with `full_resync` if the changes since this version are not kept anymore
+                      or the cursor is from before a restart
+    """
+    # A cold process builds (and versions) the fleet state before reading its changes
+    await get_fleet_snapshot()
+    changes = change_log.changes(since)
+    return FleetChanges(
+        version=changes["version"],
+        full_resync=changes["full_resync"],
+        changed=[FacilityState(**state._asdict()) for state in changes["changed"]],
+        removed=changes["removed"],
+    )
+
+
+@router.get("/freshness", response_model=List[FacilityFreshness])
+async def get_carparks_freshness(api_key: str = Depends(verify_api_key)):
+    """
+    Get the freshness of the carpark details refreshed by the background poller
+
+    Args:
+        api_key (str): API key for authentication
+
+    Returns:
+        List[FacilityFreshness]: The last poll time, age and refresh interval of each polled carpark
+    """
+    return polling_scheduler.freshness()
+
+
+@router.get("/{facility_id}/history", response_model=OccupancyHistory)
+async def get_carpark_history(
     facility_id: str = Path(..., pattern=r"^\d+$"),
+    hours: float = Query(24, description="How many hours of history to return", gt=0, le=24 * 31),
+    step_minutes: int = Query(15, description="Downsampling step in minutes", ge=1, le=24 * 60),
     api_key: str = Depends(verify_api_key),
 ):
     """
-    Get detailed information about a specific carpark
+    Get the occupancy history of a carpark, downsampled to one point per step
 
     Args:
         facility_id (str): ID of the carpark facility
+        hours (float): How many hours of history to return, default is 24
+        step_minutes (int): Downsampling step in minutes, default is 15
         api_key (str): API key for authentication
 
     Returns:
-        dict: Carpark details including total spots, available spots,
-              status and last update
-    """
-    # Check if the carpark is no-update
-    no_update_set = get_no_update_carparks()
-    if facility_id in no_update_set:
-        return CarparkDetail(
-            facility_id=facility_id,
-            name="Unknown",
-            total_spots=0,
-            available_spots=0,
-            status="No Data Available",
-            timestamp=None,
-        )
+        OccupancyHistory: The mean, min and max occupancy of each step
+    """
+    until = time.time()
+    points = occupancy_history.downsample(facility_id, until - hours * 3600, until, step_minutes * 60)
+    if points is None:
+        raise HTTPException(status_code=404, detail="No history for carpark with ID {}".format(facility_id))
 
-    # Get the carpark details
-    details = get_carpark_details(facility_id)
+    return OccupancyHistory(
+        facility_id=facility_id,
+        total_spots=occupancy_history.get(facility_id).spots,
+        points=[
+            HistoryPoint(
+                timestamp=datetime.fromtimestamp(point["timestamp"], SYDNEY_TZ),
+                occupancy=round(point["occupancy"], 1),
+                min_occupancy=point["min_occupancy"],
+                max_occupancy=point["max_occupancy"],
+            )
+            for point in points
+        ],
+    )
+
+
+@router.get("/{facility_id}/forecast", response_model=AvailabilityForecast)
+async def get_carpark_forecast(
+    facility_id: str = Path(..., pattern=r"^\d+$"),
+    minutes: int = Query(30, description="How many minutes ahead to forecast", ge=0, le=24 * 60),
+    api_key: str = Depends(verify_api_key),
+):
+    """
+    Forecast the availability of a carpark, from its weekly occupancy profile and recent trend
+
+    Args:
+        facility_id (str): ID of the carpark facility
+        minutes (int): How many minutes ahead to forecast, default is 30
+        api_key (str): API key for authentication
+
+    Returns:
+        AvailabilityForecast: The forecast available spots and status
+    """
+    forecast_time = time.time() + minutes * 60
+    forecast = occupancy_forecaster.forecast(facility_id, forecast_time)
+    if forecast is None:
+        raise HTTPException(status_code=404, detail="No history for carpark with ID {}".format(facility_id))
+
+    total_spots = forecast["spots"]
+    return AvailabilityForecast(
+        facility_id=facility_id,
+        forecast_time=datetime.fromtimestamp(forecast_time, SYDNEY_TZ),
+        total_spots=total_spots,
+        available_spots=max(total_spots - forecast["occupancy"], 0),
+        status=available_status(total_spots, forecast["occupancy"]),
+        samples=forecast["samples"],
+    )
 
-    # If the carpark is not found, return a 404 error
-    if not details:
-        raise HTTPException(status_code=404, detail="Carpark with ID {} not found".format(facility_id))
 
+def build_carpark_detail(facility_id: str, details: dict, stale: bool = False) -> CarparkDetail:
+    """
+    Build the detail response of a carpark from its details
+
+    Args:
+        facility_id (str): ID of the carpark facility
+        details (dict): The carpark details
+        stale (bool): True if the details are the last known ones, the NSW API being unavailable
+
+    Returns:
+        CarparkDetail: Carpark details including total spots, available spots,
+                       status and last update
+    """
     # Get the total spots and occupancy
     try:
         total_spots = int(details.get("spots", 0))
@@ -131,6 +356,18 @@ async def get_carpark_available_details(
     available_spots = max(total_spots - occupancy, 0)
     status = available_status(total_spots, occupancy)
 
+    # The zones are parsed once per details snapshot
+    zones = [
+        ZoneAvailability(
+            zone_id=zone.zone_id,
+            name=zone.name,
+            total_spots=zone.spots,
+            available_spots=max(zone.spots - zone.occupancy, 0),
+            status=available_status(zone.spots, zone.occupancy),
+        )
+        for zone in zone_cache.get(facility_id, details)
+    ]
+
     return CarparkDetail(
         facility_id=facility_id,
         name=details.get("facility_name", "Unknown"),
@@ -138,4 +375,95 @@ async def get_carpark_available_details(
         available_spots=available_spots,
         status=status,
         timestamp=timestamp,
+        stale=stale,
+        zones=zones,
     )
+
+
+def encoded_response(encoded: EncodedResponse, request: Optional[Request] = None) -> Response:
+    """
+    Send an encoded JSON response with its ETag, or 304 Not Modified if the client already has it
+
+    Args:
+        encoded (EncodedResponse): The encoded response
+        request (Request, optional): The request, for its If-None-Match header
+
+    Returns:
+        Response: The response
+    """
+    headers = {"ETag": encoded.etag}
+    if request is not None and etag_matches(request.headers.get("if-none-match"), encoded.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=encoded.body, media_type="application/json", headers=headers)
+
+
+@router.get(
+    "/{facility_id}",
+    response_model=CarparkDetail,
+    responses={304: {"description": "Not Modified: the response has the ETag of the If-None-Match header"}},
+)
+@instrument_endpoint("carpark_details")
+async def get_carpark_available_details(
+    facility_id: str = Path(..., pattern=r"^\d+$"),
+    api_key: str = Depends(verify_api_key),
+    request: Request = None,
+):
+    """
+    Get detailed information about a specific carpark
+
+    The encoded response is cached per details snapshot, so that a hot facility is served
+    without building and encoding it again until its details are refreshed. It is sent with
+    an ETag, and a request whose If-None-Match header has it gets 304 Not Modified.
+
+    Args:
+        facility_id (str): ID of the carpark facility
+        api_key (str): API key for authentication
+        request (Request): The request, for its If-None-Match header
+
+    Returns:
+        Response: Carpark details including total spots, available spots,
+                  status and last update, encoded as JSON
+    """
+    # Check if the carpark is no-update, in the current fleet snapshot, or the cached (or last known)
+    # no-update sweep while the process is cold
+    snapshot = fleet_snapshots.current()
+    if snapshot is not None:
+        no_update = facility_id in snapshot.no_update
+    else:
+        no_update = facility_id in await run_profiled_in_threadpool(get_no_update_carparks)
+    if no_update:
+        encoded = no_update_responses.get(facility_id, NO_UPDATE_DETAILS)
+        if encoded is None:
+            detail = CarparkDetail(
+                facility_id=facility_id,
+                name="Unknown",
+                total_spots=0,
+                available_spots=0,
+                status="No Data Available",
+                timestamp=None,
+            )
+            encoded = no_update_responses.put(facility_id, NO_UPDATE_DETAILS, detail.model_dump_json().encode())
+        return encoded_response(encoded, request)
+
+    # Get the carpark details, from the background poller if they are fresh enough
+    polling_scheduler.record_demand(facility_id)
+    details = get_polled_details(facility_id) or await run_profiled_in_threadpool(get_carpark_details, facility_id)
+
+    # If the NSW API is unavailable, serve the last known details
+    stale = False
+    if not details:
+        details = get_last_known_details(facility_id)
+        stale = details is not None
+
+    if not details:
+        # Do not report a carpark as missing just because the NSW API is down
+        if upstream_breaker.state != upstream_breaker.CLOSED:
+            raise HTTPException(status_code=503, detail="The NSW Transport API is temporarily unavailable")
+        # If the carpark is not found, return a 404 error
+        raise HTTPException(status_code=404, detail="Carpark with ID {} not found".format(facility_id))
+
+    encoded = detail_responses.get(facility_id, details, stale)
+    if encoded is None:
+        detail = build_carpark_detail(facility_id, details, stale)
+        encoded = detail_responses.put(facility_id, details, detail.model_dump_json().encode(), stale)
+    return encoded_response(encoded, request)
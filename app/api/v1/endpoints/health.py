@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Response
+
+from app.models.schemas import HealthStatus
+from app.services.health_service import health_status
+
+router = APIRouter()
+
+
+@router.get("/healthz", response_model=HealthStatus)
+async def get_health():
+    """
+    Liveness probe: the process serves requests
+
+    Returns:
+        HealthStatus: The snapshot age, sweep progress and circuit state
+    """
+    return health_status()
+
+
+@router.get("/readyz", response_model=HealthStatus)
+async def get_readiness(response: Response):
+    """
+    Readiness probe: 503 until the fleet snapshot is loaded, so that the load balancer
+    does not send traffic to a process whose first users would wait on a full sweep
+
+    Args:
+        response (Response): The response, to set the status code
+
+    Returns:
+        HealthStatus: The snapshot age, sweep progress and circuit state
+    """
+    status = health_status()
+    if not status["ready"]:
+        response.status_code = 503
+    return status
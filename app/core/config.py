@@ -1,20 +1,124 @@
 import os
+from typing import Literal
 
 from dotenv import load_dotenv
+from pydantic import BaseModel, Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 # Load environment variables
 load_dotenv()
 
+# The project directory, holding the private data of the app (see CACHE_SQLITE_PATH)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 # API Keys
 NSW_API_KEY = os.getenv("NSW_CARPARK_API_TOKEN")
 PUBLIC_API_TOKEN = os.getenv("PUBLIC_API_TOKEN")
+# Token of the admin endpoints (X-Admin-Token header), the admin API is disabled if unset
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
 
-# Cache settings
+# Cache settings (defaults of every cache, see CacheSettings for the per-cache settings)
 CACHE_TTL = 60 * 60 * 1  # 1 hour
 CACHE_MAXSIZE = 128
+# Cache backend: "memory" (per worker process), "sqlite" (shared by the workers of the host) or "redis"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+# The database directory is created private to the user of the app: a shared location (e.g. /tmp) would let
+# other users of the host write the entries served by the app
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", os.path.join(BASE_DIR, "data", "carpark_cache.sqlite3"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")  # "fake://" for an in-process stand-in
+
+
+class CacheConfig(BaseModel):
+    # Time-to-live of the entries in seconds
+    ttl: float = Field(CACHE_TTL, gt=0)
+    # Maximum number of entries
+    maxsize: int = Field(CACHE_MAXSIZE, gt=0)
+    # Which entry to evict when the cache is full: least recently used, least frequently used,
+    # or soonest to expire (the shared backends always evict the soonest to expire)
+    policy: Literal["lru", "lfu", "ttl"] = "ttl"
+    # Random spread of the TTL (0.1 = +/-10%), so that entries cached together do not expire together
+    jitter: float = Field(0.0, ge=0, lt=1)
+
+
+class CacheSettings(BaseSettings):
+    """
+    Settings of each named cache, read from the environment (or .env), e.g.
+    CACHE_CARPARK_LOCATIONS__TTL=600 or CACHE_NO_UPDATE_CARPARKS__POLICY=lfu
+    """
+
+    model_config = SettingsConfigDict(env_prefix="CACHE_", env_nested_delimiter="__", env_file=".env", extra="ignore")
+
+    carpark_ids: CacheConfig = CacheConfig()
+    carpark_locations: CacheConfig = CacheConfig()
+    no_update_carparks: CacheConfig = CacheConfig()
+
+
+cache_settings = CacheSettings()
+
+# API rate limiting (NSW Transport API throttle limit)
+MAX_REQUESTS_PER_SECOND = int(os.getenv("NSW_MAX_REQUESTS_PER_SECOND", "5"))
+# Requests per second kept for the interactive lookups, the background sweeps only get the rest
+INTERACTIVE_RESERVED_REQUESTS_PER_SECOND = int(os.getenv("NSW_INTERACTIVE_RESERVED_REQUESTS_PER_SECOND", "1"))
+
+# Age after which the locations sweep fetches a facility again, the last known details
+# (e.g. of the no-update sweep) serving its location meanwhile
+LOCATION_MAX_AGE_HOURS = float(os.getenv("LOCATION_MAX_AGE_HOURS", "24"))
+
+# Adaptive background polling of the facility details (share of MAX_REQUESTS_PER_SECOND spent at peak time)
+POLLER_ENABLED = os.getenv("POLLER_ENABLED", "false").lower() == "true"
+POLL_BUDGET_FRACTION = float(os.getenv("POLL_BUDGET_FRACTION", "0.1"))
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", "60"))  # seconds
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", "3600"))  # seconds
+# Maximum age of the polled details served to /carparks/{facility_id}, older ones are fetched again
+POLL_SERVE_MAX_AGE = float(os.getenv("POLL_SERVE_MAX_AGE", "60"))  # seconds
+
+# Occupancy history (readings kept per facility, and the directory to persist them to, empty to disable)
+HISTORY_CAPACITY = int(os.getenv("HISTORY_CAPACITY", "10080"))  # a week of readings at one per minute
+HISTORY_DIR = os.getenv("HISTORY_DIR", "")
+
+# Geocoding of the /nearby addresses: a geocoder library provider (e.g. "osm", "arcgis") or "static"
+# (offline), the region appended to the queries, and the persistent LRU cache of the resolved addresses
+GEOCODER_PROVIDER = os.getenv("GEOCODER_PROVIDER", "osm")
+GEOCODER_REGION = os.getenv("GEOCODER_REGION", "NSW, Australia")
+GEOCODER_TIMEOUT = float(os.getenv("GEOCODER_TIMEOUT", "5"))  # seconds
+GEOCODER_CACHE_SIZE = int(os.getenv("GEOCODER_CACHE_SIZE", "10000"))
+GEOCODER_CACHE_PATH = os.getenv("GEOCODER_CACHE_PATH", "/tmp/carpark_geocoder_cache.json")  # empty: memory only
+
+# Maximum number of origins of a batch nearby query
+NEARBY_BATCH_MAX_ORIGINS = int(os.getenv("NEARBY_BATCH_MAX_ORIGINS", "500"))
+
+# Versions of the fleet state kept by the change log (/carparks/changes), older clients resync the whole fleet
+CHANGE_LOG_CAPACITY = int(os.getenv("CHANGE_LOG_CAPACITY", "1000"))
+
+# Load the fleet snapshot in the background on startup, /readyz reports ready once it is loaded
+SNAPSHOT_WARMUP = os.getenv("SNAPSHOT_WARMUP", "true").lower() == "true"
+
+# Preforking server (serve.py): number of worker processes, and how often the master refreshes the fleet
+# snapshot and re-forks the workers with it (by default before the fleet caches expire in the workers);
+# a refresh sweeps the locations again even if they are cached
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "2"))
+SNAPSHOT_REFRESH_INTERVAL = float(
+    os.getenv(
+        "SNAPSHOT_REFRESH_INTERVAL",
+        0.9 * min(cache_settings.carpark_ids.ttl, cache_settings.carpark_locations.ttl),
+    )
+)  # seconds
+
+# Retries of the requests to the NSW Transport API (exponential backoff with full jitter)
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))  # seconds, doubled on each retry
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "10"))  # seconds
+RETRY_DEADLINE = float(os.getenv("RETRY_DEADLINE", "30"))  # seconds, total budget of a request and its retries
+
+# Circuit breaker around the NSW Transport API
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+CIRCUIT_BREAKER_RESET_TIMEOUT = float(os.getenv("CIRCUIT_BREAKER_RESET_TIMEOUT", "30"))  # seconds
 
-# API rate limiting
-MAX_REQUESTS_PER_SECOND = 5
+# Request profiling (a fraction of requests is sampled, slow ones are written to disk)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # 0 disables profiling
+PROFILE_SLOW_REQUEST_MS = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "1000"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
 
 # Check if required API keys are set
 if not NSW_API_KEY:
@@ -23,8 +127,8 @@ if not PUBLIC_API_TOKEN:
     raise ValueError("PUBLIC_API_TOKEN not found in environment variables")
 
 
-# NSW Transport URL
-NSW_TRANSPORT_BASE_API_URL = "https://api.transport.nsw.gov.au/v1/carpark"
+# NSW Transport URL (can be pointed to a local stand-in, e.g. for load tests)
+NSW_TRANSPORT_BASE_API_URL = os.getenv("NSW_TRANSPORT_BASE_API_URL", "https://api.transport.nsw.gov.au/v1/carpark")
 
 
 # Get NSW Transport API headers
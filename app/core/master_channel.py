@@ -0,0 +1,118 @@
+import json
+import logging
+import os
+import select
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MasterChannel:
+    def __init__(self):
+        """
+        Initialize the channel of the messages sent by the workers of the preforking server
+        (see app.core.prefork) to its master, e.g. the occupancy readings kept by the master only.
+
+        It is a pipe opened by the master before forking. Each message is a JSON line written
+        at once, so that the lines of concurrent workers never interleave. A worker never waits
+        for the master: a message is dropped if the pipe is full.
+        """
+        self._reader: Optional[int] = None
+        self._writer: Optional[int] = None
+        self._worker = False
+        self._pending = b""
+        self.dropped = 0
+
+    def open(self) -> None:
+        """
+        Open the channel, in the master before forking the workers.
+        """
+        self._reader, self._writer = os.pipe()
+        os.set_blocking(self._writer, False)
+
+    def attach_worker(self) -> None:
+        """
+        Use the channel from a forked worker, which only sends.
+        """
+        if self._reader is not None:
+            os.close(self._reader)
+            self._reader = None
+        self._worker = True
+
+    @property
+    def connected(self) -> bool:
+        """
+        Whether the process is a worker sending its messages to the master.
+        """
+        return self._worker and self._writer is not None
+
+    def send(self, kind: str, **fields) -> bool:
+        """
+        Send a message to the master.
+
+        Parameters:
+            kind (str): The message kind, e.g. "reading"
+            fields: The JSON serializable fields of the message
+
+        Returns:
+            bool: True if the message was sent, False if the process is not a worker or the pipe is full
+        """
+        if not self.connected:
+            return False
+        data = (json.dumps({"kind": kind, **fields}, separators=(",", ":")) + "\n").encode()
+        if len(data) > select.PIPE_BUF:
+            logger.error("Dropped a {} message of {} bytes, too large for the master channel".format(kind, len(data)))
+            return False
+        try:
+            os.write(self._writer, data)
+        except BlockingIOError:
+            self.dropped += 1
+            logger.warning("The master channel is full, dropped a {} message".format(kind))
+            return False
+        return True
+
+    def receive(self, timeout: float) -> List[Dict]:
+        """
+        Receive the messages of the workers, in the master.
+
+        Parameters:
+            timeout (float): The time to wait for a message in seconds
+
+        Returns:
+            List[dict]: The messages received, empty if none arrived within the timeout
+        """
+        if self._reader is None:
+            return []
+        ready, _, _ = select.select([self._reader], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self._reader, 65536)
+        # Drain what the workers wrote meanwhile, up to 1 MB per call
+        while len(data) < 1048576 and select.select([self._reader], [], [], 0)[0]:
+            chunk = os.read(self._reader, 65536)
+            if not chunk:
+                break
+            data += chunk
+        lines = (self._pending + data).split(b"\n")
+        self._pending = lines.pop()
+        messages = []
+        for line in lines:
+            try:
+                messages.append(json.loads(line))
+            except ValueError:
+                logger.error("Invalid message on the master channel: {!r}".format(line[:100]))
+        return messages
+
+    def close(self) -> None:
+        """
+        Close the channel, in the master once the workers stopped.
+        """
+        for fd in (self._reader, self._writer):
+            if fd is not None:
+                os.close(fd)
+        self._reader = self._writer = None
+        self._pending = b""
+
+
+# Create a global master channel instance
+master_channel = MasterChannel()
@@ -0,0 +1,387 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+from fastapi import HTTPException
+
+# Default histogram buckets (seconds), covering fast cache hits up to upstream timeouts
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Tuple[str, ...], extra: str = "") -> str:
+    """
+    Format a label set in the Prometheus text exposition format.
+
+    Parameters:
+        labelnames (Sequence[str]): The label names
+        labelvalues (tuple): The label values, in the same order as labelnames
+        extra (str): An extra, already formatted label (e.g. le="0.5")
+
+    Returns:
+        str: The formatted label set, e.g. {cache="carpark_ids",result="hit"}
+    """
+    pairs = []
+    for name, value in zip(labelnames, labelvalues):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """
+        Initialize the metric.
+
+        Parameters:
+            name (str): The metric name
+            documentation (str): The help text of the metric
+            labelnames (Sequence[str]): The names of the labels of the metric
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        """
+        Build the lookup key for a label set.
+        """
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """
+        Increase the counter.
+
+        Parameters:
+            amount (float): The amount to add, must not be negative
+            **labels: The label values of the series to increase
+        """
+        if amount < 0:
+            raise ValueError("Counters can only be increased")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """
+        Get the current value of a series (0 if never increased).
+        """
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        """
+        Set the gauge to a value.
+
+        Parameters:
+            value (float): The current value
+            **labels: The label values of the series to set
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels) -> float:
+        """
+        Get the current value of a series (0 if never set).
+        """
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per series: [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        """
+        Record an observation.
+
+        Parameters:
+            value (float): The observed value
+            **labels: The label values of the series
+        """
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the wall-clock duration (in seconds) of the wrapped block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        """
+        Get the number of observations of a series.
+        """
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            items = [(key, (list(s[0]), s[1], s[2])) for key, s in self._series.items()]
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                le = 'le="{}"'.format("+Inf" if bound == float("inf") else repr(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        Initialize an empty metrics registry.
+        """
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """
+        Create and register a counter.
+        """
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """
+        Create and register a gauge.
+        """
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        """
+        Create and register a histogram.
+        """
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """
+        Render all registered metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics page
+        """
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Create a global metrics registry instance
+registry = MetricsRegistry()
+
+# NSW Transport API (upstream) metrics
+upstream_request_duration_seconds = registry.histogram(
+    "nsw_upstream_request_duration_seconds",
+    "Latency of requests to the NSW Transport API",
+    labelnames=("status",),
+)
+upstream_retries_total = registry.counter(
+    "nsw_upstream_retries_total",
+    "Requests to the NSW Transport API retried, by the status of the failed attempt",
+    labelnames=("status",),
+)
+upstream_short_circuited_total = registry.counter(
+    "nsw_upstream_short_circuited_total",
+    "Requests to the NSW Transport API rejected because the circuit breaker is open",
+)
+circuit_breaker_transitions_total = registry.counter(
+    "circuit_breaker_transitions_total",
+    "Circuit breaker state transitions",
+    labelnames=("breaker", "state"),
+)
+stale_responses_total = registry.counter(
+    "stale_responses_total",
+    "Responses served from the last known snapshot because the NSW Transport API is unavailable",
+    labelnames=("data",),
+)
+staleness_checks_total = registry.counter(
+    "staleness_checks_total",
+    "Facilities checked (fetched) or skipped by the no-update sweep, or located without a request by the locations"
+    " sweep",
+    labelnames=("result",),
+)
+scheduled_polls_total = registry.counter(
+    "scheduled_polls_total",
+    "Facility details refreshed by the background poller, by result",
+    labelnames=("result",),
+)
+throttle_wait_seconds = registry.histogram(
+    "nsw_throttle_wait_seconds",
+    "Time spent waiting for a slot of the NSW throttle limit, by priority lane",
+    labelnames=("priority",),
+)
+
+# Cache metrics
+cache_requests_total = registry.counter(
+    "cache_requests_total",
+    "Cache lookups by cache name and result (hit/miss)",
+    labelnames=("cache", "result"),
+)
+cache_entries = registry.gauge(
+    "cache_entries",
+    "Number of entries of each cache",
+    labelnames=("cache",),
+)
+cache_capacity = registry.gauge(
+    "cache_capacity",
+    "Maximum number of entries of each cache",
+    labelnames=("cache",),
+)
+cache_evictions_total = registry.counter(
+    "cache_evictions_total",
+    "Cache entries removed because the cache was full (capacity) or they expired (expired)",
+    labelnames=("cache", "reason"),
+)
+
+
+# Geocoding metrics
+geocode_requests_total = registry.counter(
+    "geocode_requests_total",
+    "Address lookups by result (hit: cached, miss: resolved by the provider, not_found, error)",
+    labelnames=("result",),
+)
+
+# Fleet change log metrics
+fleet_version = registry.gauge(
+    "fleet_version",
+    "Version of the fleet state published to the change log",
+)
+
+# Inbound rate limiting metrics
+rate_limited_requests_total = registry.counter(
+    "rate_limited_requests_total",
+    "Requests rejected by the per API key rate limiter",
+)
+
+# Endpoint metrics
+endpoint_requests_total = registry.counter(
+    "endpoint_requests_total",
+    "Requests handled by the carpark endpoints by outcome",
+    labelnames=("endpoint", "outcome"),
+)
+endpoint_duration_seconds = registry.histogram(
+    "endpoint_duration_seconds",
+    "Time spent inside the carpark endpoint handlers",
+    labelnames=("endpoint",),
+)
+nearby_results = registry.histogram(
+    "nearby_results",
+    "Number of carparks returned by a nearby query",
+    buckets=(0, 1, 5, 10, 25, 50, 100, 250, 1000),
+)
+
+
+def instrument_endpoint(endpoint: str):
+    """
+    Decorator recording the duration and outcome of an async endpoint handler.
+
+    Parameters:
+        endpoint (str): The endpoint name used as the metrics label
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = "500"
+            try:
+                response = await func(*args, **kwargs)
+                # e.g. 304 for a Response sent as is
+                outcome = str(getattr(response, "status_code", 200))
+                return response
+            except HTTPException as e:
+                outcome = str(e.status_code)
+                raise
+            finally:
+                endpoint_duration_seconds.observe(time.perf_counter() - start, endpoint=endpoint)
+                endpoint_requests_total.inc(endpoint=endpoint, outcome=outcome)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,384 @@
+import gc
+import logging
+import os
+import random
+import signal
+import socket
+import time
+from typing import Dict, Optional
+
+import uvicorn
+
+from app.core.config import HISTORY_DIR, MAX_REQUESTS_PER_SECOND, POLL_BUDGET_FRACTION
+from app.core.master_channel import master_channel
+from app.services import admin_service
+from app.services.availability_service import availability_store
+from app.services.cache_backends import MeteredTTLCache
+from app.services.cache_service import carpark_ids_cache, carpark_locations_cache, no_update_carparks_cache
+from app.services.change_log import change_log
+from app.services.fleet_snapshot import build_fleet_snapshot, fleet_snapshots
+from app.services.nsw_transport_api import get_carpark_locations, record_reading, upstream_throttle
+from app.services.occupancy_forecast import occupancy_forecaster
+from app.services.occupancy_history import occupancy_history
+from app.services.polling_scheduler import polling_scheduler
+from app.services.sweep_progress import sweep_progress
+
+logger = logging.getLogger(__name__)
+
+# Index of the current worker of the preforking server (None in the master, or when not preforking)
+worker_index: Optional[int] = None
+# True once the master loaded the occupancy history, so that the forked workers do not load it again
+preloaded = False
+
+# The caches of the fleet snapshot built by the master
+FLEET_CACHES = (carpark_ids_cache, no_update_carparks_cache, carpark_locations_cache)
+
+
+def runs_background_tasks() -> bool:
+    """
+    Whether the current process runs the background poller:
+    the single process when not preforking, else only the first worker.
+    """
+    return worker_index in (None, 0)
+
+
+def keeps_history() -> bool:
+    """
+    Whether the current process records and saves the occupancy history: the single process when
+    not preforking, else the master (the workers send it their readings, see record_reading).
+    """
+    return worker_index is None
+
+
+def share_upstream_budget(processes: int, requests_per_second: int = MAX_REQUESTS_PER_SECOND) -> int:
+    """
+    Give each process its share of the NSW throttle limit: every process (the master sweeping the
+    fleet, and each worker) has its own throttle, which must not exceed the budget together.
+    The forked workers inherit the share of the master.
+
+    Parameters:
+        processes (int): The number of processes sending requests to the NSW API
+        requests_per_second (int): The NSW budget
+
+    Returns:
+        int: The requests per second of each process
+    """
+    share = max(requests_per_second // processes, 1)
+    if share * processes > requests_per_second:
+        logger.warning(
+            "{} processes exceed the NSW budget of {} requests/s even at 1 request/s each".format(
+                processes, requests_per_second
+            )
+        )
+    upstream_throttle.set_rate(share)
+    polling_scheduler.requests_per_second = share * POLL_BUDGET_FRACTION
+    logger.info("NSW budget: {} requests/s per process ({} processes)".format(share, processes))
+    return share
+
+
+def load_history() -> None:
+    """
+    Load the occupancy history (if HISTORY_DIR is set) and rebuild the forecast profiles from it.
+    """
+    if HISTORY_DIR:
+        logger.info("Loaded the occupancy history of {} facilities".format(occupancy_history.load(HISTORY_DIR)))
+        occupancy_forecaster.rebuild(occupancy_history)
+
+
+def save_history() -> None:
+    """
+    Save the occupancy history (if HISTORY_DIR is set).
+    """
+    if HISTORY_DIR:
+        logger.info("Saved the occupancy history of {} facilities".format(occupancy_history.save(HISTORY_DIR)))
+
+
+def warm_snapshot() -> bool:
+    """
+    Build the fleet snapshot (carpark IDs, no-update sweep and locations) into the caches.
+    The in-process fleet caches are cleared first and the locations are swept again, so that the
+    snapshot is fresh; the carpark IDs and no-update sweep of the shared cache backends (sqlite, redis)
+    are left to their TTL, the workers already share them.
+    Nothing is cleared or fetched while the sweeps are paused (see sweep_progress).
+
+    Returns:
+        bool: True if a fresh snapshot was built, False if the NSW API was unavailable or the sweeps are paused
+    """
+    if sweep_progress.paused:
+        logger.info("The sweeps are paused, the fleet snapshot is not refreshed")
+        return False
+    for cache in FLEET_CACHES:
+        if isinstance(cache, MeteredTTLCache):
+            cache.clear()
+    start = time.monotonic()
+    locations = get_carpark_locations(renew=True)
+    if not locations or locations.get("stale"):
+        logger.warning("Failed to build a fresh fleet snapshot")
+        return False
+    # Published before forking, the workers start with it
+    fleet_snapshots.publish(build_fleet_snapshot(locations))
+    logger.info(
+        "Built the fleet snapshot of {} carparks in {:.1f}s".format(
+            len(locations["carparks"]), time.monotonic() - start
+        )
+    )
+    return True
+
+
+class PreforkServer:
+    def __init__(
+        self,
+        app,
+        host: str = "0.0.0.0",
+        port: int = 8000,
+        workers: int = 2,
+        refresh_interval: float = 3000,
+        startup_grace: float = 2.0,
+        graceful_timeout: float = 30.0,
+    ):
+        """
+        Initialize a preforking server.
+
+        The master process loads the app and warms the fleet snapshot once, then forks
+        the workers, which share the snapshot (copy-on-write) and the listening socket.
+        Every refresh_interval (or on SIGHUP) the master refreshes the snapshot and
+        publishes it by forking a new generation of workers, then gracefully stopping
+        the previous one. Workers that die are replaced.
+
+        The master keeps the occupancy history: the workers send it their readings through
+        the master channel, and each generation is forked with the history recorded so far.
+        The master also counts the versions of the fleet state (see change_log.follow), with the
+        availabilities of these readings. The workers also send it the admin actions (see
+        apply_admin_action), which the master applies and publishes to every worker.
+
+        Parameters:
+            app: The ASGI app, imported in the master
+            host (str): The host to bind
+            port (int): The port to bind
+            workers (int): The number of worker processes
+            refresh_interval (float): The interval between the snapshot refreshes in seconds
+            startup_grace (float): The time given to a new generation to start before stopping the previous one
+            graceful_timeout (float): The time given to a stopping worker to finish its requests
+        """
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.refresh_interval = refresh_interval
+        self.startup_grace = startup_grace
+        self.graceful_timeout = graceful_timeout
+        self.socket: Optional[socket.socket] = None
+        # pid -> worker index, of the running workers
+        self.children: Dict[int, int] = {}
+        self.generation = 0
+        self._stopping = False
+        self._refresh_requested = False
+        self._publish_requested = False
+
+    def bind(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        self.socket = sock
+        return sock
+
+    def _run_worker(self, index: int) -> None:
+        global worker_index
+        worker_index = index
+        master_channel.attach_worker()
+        change_log.follow()
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, signal.SIG_DFL)
+        # The forked workers must not share the random state (e.g. the cache TTL jitter)
+        random.seed()
+        config = uvicorn.Config(self.app, log_config=None, timeout_graceful_shutdown=self.graceful_timeout)
+        uvicorn.Server(config).run(sockets=[self.socket])
+
+    def spawn(self, index: int) -> int:
+        """
+        Fork a worker.
+
+        Parameters:
+            index (int): The worker index, 0 being the worker running the background tasks
+
+        Returns:
+            int: The pid of the worker
+        """
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                self._run_worker(index)
+            except BaseException:
+                logger.exception("Worker {} failed".format(index))
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        self.children[pid] = index
+        logger.info("Started worker {} (pid {}, generation {})".format(index, pid, self.generation))
+        return pid
+
+    def fork_generation(self) -> None:
+        """
+        Fork a new generation of workers with the current snapshot.
+        """
+        self.generation += 1
+        # Move the snapshot out of the garbage collector's reach: collections in the
+        # workers would otherwise write to (and so copy) the pages of every shared object
+        gc.freeze()
+        for index in range(self.workers):
+            self.spawn(index)
+        # The master replaces the snapshot on the next refresh: the objects frozen for this
+        # generation must be collectable again, or every generation would stay in memory
+        gc.unfreeze()
+
+    def retire(self, pids) -> None:
+        """
+        Gracefully stop workers (they finish their requests) and wait for them.
+        """
+        pids = [pid for pid in pids if pid in self.children]
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+            self.children.pop(pid, None)
+
+    def reap(self) -> None:
+        """
+        Collect the workers which exited, and replace them.
+        """
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            index = self.children.pop(pid, None)
+            if index is None or self._stopping:
+                continue
+            logger.warning("Worker {} (pid {}) exited with status {}, restarting it".format(index, pid, status))
+            self.spawn(index)
+
+    def publish(self) -> None:
+        """
+        Replace the workers with a new generation forked from the current snapshot.
+        """
+        self._publish_requested = False
+        previous = dict(self.children)
+        self.fork_generation()
+        time.sleep(self.startup_grace)
+        self.retire(previous)
+
+    def refresh(self) -> None:
+        """
+        Refresh the fleet snapshot, and publish it if the NSW API served a fresh one.
+        """
+        self._refresh_requested = False
+        if warm_snapshot():
+            self.publish()
+
+    def handle_messages(self, messages) -> None:
+        """
+        Handle the messages of the workers (see master_channel).
+
+        Parameters:
+            messages (List[dict]): The messages received
+        """
+        for message in messages:
+            kind = message.get("kind")
+            if kind == "reading":
+                # The availability is versioned by the next refresh of the snapshot (see change_log)
+                availability_store.update(message["facility_id"], message["details"])
+                record_reading(message["facility_id"], message["details"])
+            elif kind == "admin":
+                self.apply_admin_action(message)
+            else:
+                logger.warning("Unknown message from a worker: {}".format(kind))
+
+    def apply_admin_action(self, message: Dict) -> None:
+        """
+        Apply an admin action forwarded by a worker (see admin_service.forward_admin_action), and request
+        the refresh or publication of the snapshot so that every worker gets it. The actions received
+        together are published at once (see run_requested).
+
+        Parameters:
+            message (dict): The admin message, with the action and its parameters
+        """
+        action = message.get("action")
+        logger.info("Applying the {} action of a worker".format(action))
+        if action in ("warmup", "invalidate_cache"):
+            if action == "invalidate_cache":
+                name = message.get("name")
+                names = list(admin_service.FLEET_CACHES) if name == "all" else [name]
+            else:
+                names = list(admin_service.FLEET_CACHES) if message.get("invalidate") else []
+            for name in names:
+                admin_service.invalidate_cache(name, rebuild=False)
+            self._refresh_requested = True
+        elif action == "invalidate_facility":
+            admin_service.invalidate_facility(message["facility_id"])
+            self._publish_requested = True
+        elif action == "pause":
+            sweep_progress.pause()
+            self._publish_requested = True
+        elif action == "resume":
+            sweep_progress.resume()
+            self._publish_requested = True
+        else:
+            logger.warning("Unknown admin action from a worker: {}".format(action))
+
+    def run_requested(self) -> None:
+        """
+        Run the refresh (SIGHUP, refresh interval, admin action) or the publication (admin action) requested.
+        A successful refresh publishes the snapshot, else the publication still runs if it was requested.
+        """
+        if self._refresh_requested:
+            self.refresh()
+        if self._publish_requested:
+            self.publish()
+
+    def _handle_signal(self, signum, frame) -> None:
+        if signum == signal.SIGHUP:
+            self._refresh_requested = True
+        else:
+            self._stopping = True
+
+    def serve(self) -> None:
+        """
+        Run the master: warm, fork, then supervise the workers until SIGTERM or SIGINT.
+        """
+        global preloaded
+        signal.signal(signal.SIGHUP, self._handle_signal)
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+        self.bind()
+        master_channel.open()
+        logger.info("Listening on {}:{} with {} workers".format(self.host, self.port, self.workers))
+        load_history()
+        preloaded = True
+        warm_snapshot()
+        self.fork_generation()
+        next_refresh = time.monotonic() + self.refresh_interval
+        while not self._stopping:
+            self.handle_messages(master_channel.receive(timeout=1))
+            self.reap()
+            if self._refresh_requested or time.monotonic() >= next_refresh:
+                self._refresh_requested = True
+                next_refresh = time.monotonic() + self.refresh_interval
+            self.run_requested()
+        logger.info("Stopping the workers")
+        self.retire(list(self.children))
+        # The readings sent by the workers before they stopped
+        self.handle_messages(master_channel.receive(timeout=0))
+        save_history()
+        master_channel.close()
+        self.socket.close()
@@ -5,6 +5,8 @@ from typing import Deque, Dict
 from fastapi import Request
 from fastapi.responses import JSONResponse
 
+from app.core.metrics import rate_limited_requests_total
+
 
 class SimpleRateLimiter:
     def __init__(self, requests_per_second: int = 5):
@@ -66,6 +68,7 @@ async def rate_limit_middleware(request: Request, call_next):
         return await call_next(request)
 
     if rate_limiter.is_rate_limited(api_key):
+        rate_limited_requests_total.inc()
         return JSONResponse(status_code=429, content={"detail": "Too many requests. Please try again in a second."})
 
     response = await call_next(request)
@@ -1,9 +1,12 @@
+import secrets
+
 from fastapi import HTTPException, Security
 from fastapi.security.api_key import APIKeyHeader
 
-from app.core.config import PUBLIC_API_TOKEN
+from app.core.config import ADMIN_API_TOKEN, PUBLIC_API_TOKEN
 
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=True)
+admin_token_header = APIKeyHeader(name="X-Admin-Token", auto_error=True)
 
 
 async def verify_api_key(api_key_header: str = Security(api_key_header)) -> str:
@@ -24,3 +27,24 @@ async def verify_api_key(api_key_header: str = Security(api_key_header)) -> str:
     if api_key_header != PUBLIC_API_TOKEN:
         raise HTTPException(status_code=403, detail="The API Key is invalid.")
     return api_key_header
+
+
+async def verify_admin_token(admin_token_header: str = Security(admin_token_header)) -> str:
+    """
+    Validates the admin token provided in the X-Admin-Token header against the
+    ADMIN_API_TOKEN. This function is used as a dependency to protect the admin endpoints.
+
+    Parameters:
+        admin_token_header (str): The admin token extracted from the X-Admin-Token header.
+
+    Returns:
+        str: The validated admin token if successful.
+
+    Raises:
+        HTTPException: 403 Forbidden error if the admin API is disabled or the token is invalid.
+    """
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=403, detail="The admin API is disabled.")
+    if not secrets.compare_digest(admin_token_header.encode(), ADMIN_API_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="The admin token is invalid.")
+    return admin_token_header
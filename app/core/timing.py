@@ -0,0 +1,300 @@
+import asyncio
+import functools
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from fastapi import Request
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import (
+    PROFILE_DIR,
+    PROFILE_INTERVAL_MS,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_SLOW_REQUEST_MS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTimings:
+    def __init__(self):
+        """
+        Initialize the phase timings of one request.
+
+        Phases are timed exclusively: the time spent in a nested phase
+        (e.g. upstream inside cache) is only counted once, in the nested phase.
+        """
+        self.phases: Dict[str, float] = {}
+        # Stack of [phase, start time, time spent in nested phases]
+        self._stack: List[list] = []
+        self.endpoint_done: Optional[float] = None
+
+    def add(self, phase: str, seconds: float) -> None:
+        """
+        Add time to a phase.
+
+        Parameters:
+            phase (str): The phase name, e.g. "upstream"
+            seconds (float): The time spent in the phase
+        """
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def start(self, phase: str) -> None:
+        self._stack.append([phase, time.perf_counter(), 0.0])
+
+    def stop(self) -> None:
+        phase, start, nested = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        self.add(phase, elapsed - nested)
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    def server_timing(self, total: float) -> str:
+        """
+        Build the Server-Timing header value.
+
+        Parameters:
+            total (float): The total request duration in seconds
+
+        Returns:
+            str: e.g. "upstream;dur=120.5, compute;dur=1.2, total;dur=125.0"
+        """
+        entries = [f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in self.phases.items()]
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def timed_phase(phase: str):
+    """
+    Record the time spent in the wrapped block as a phase of the current request.
+    Does nothing outside of a request (e.g. in background sweeps).
+
+    Parameters:
+        phase (str): The phase name, e.g. "upstream", "cache", "compute"
+    """
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    timings.start(phase)
+    try:
+        yield
+    finally:
+        timings.stop()
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float):
+        """
+        Initialize a statistical profiler which periodically samples the stacks
+        of the profiled request.
+
+        The threads of the process (the event loop, the threadpool) serve other
+        requests concurrently: only the stacks running through a frame tracked by
+        the request (its middleware and endpoint, see track) are sampled.
+
+        Parameters:
+            interval (float): The sampling interval in seconds
+        """
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._frames = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def track(self, frame) -> None:
+        """
+        Sample the stacks running through a frame of the request (e.g. its endpoint, on the
+        event loop or in a threadpool thread), until it is untracked.
+        """
+        self._frames.add(frame)
+
+    def untrack(self, frame) -> None:
+        self._frames.discard(frame)
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                tracked = False
+                while frame is not None:
+                    tracked = tracked or frame in self._frames
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if tracked:
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop sampling, and wait for the sampler thread (not to be called from the event loop).
+        """
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path: str) -> None:
+        """
+        Write the samples in the collapsed stack format ("frame;frame;frame count"),
+        which can be loaded by flamegraph.pl or speedscope.
+
+        Parameters:
+            path (str): The file to write to
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+_current_profiler: ContextVar[Optional[SamplingProfiler]] = ContextVar("request_profiler", default=None)
+
+
+@contextmanager
+def profiled_frame(frame):
+    """
+    Sample the stacks running through a frame while in the wrapped block, if the current request is profiled.
+
+    Parameters:
+        frame: The frame of the caller, e.g. sys._getframe()
+    """
+    profiler = _current_profiler.get()
+    if profiler is None:
+        yield
+        return
+    profiler.track(frame)
+    try:
+        yield
+    finally:
+        profiler.untrack(frame)
+
+
+def _call_profiled(func, *args, **kwargs):
+    with profiled_frame(sys._getframe()):
+        return func(*args, **kwargs)
+
+
+async def run_profiled_in_threadpool(func, *args, **kwargs):
+    """
+    Run a blocking function in the threadpool (see run_in_threadpool), profiled with the current request.
+
+    Parameters:
+        func: The function, called with the other arguments
+
+    Returns:
+        The result of the function
+    """
+    return await run_in_threadpool(_call_profiled, func, *args, **kwargs)
+
+
+def _profile_path(request: Request) -> str:
+    name = request.url.path.strip("/").replace("/", "_") or "root"
+    return os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{os.getpid()}.collapsed")
+
+
+async def timing_middleware(request: Request, call_next):
+    """
+    Middleware to record the phase timings of a request and return them in
+    the Server-Timing header. A sample of the requests (PROFILE_SAMPLE_RATE) is
+    profiled, and the profile is written to PROFILE_DIR if the request is slow.
+
+    Parameters:
+        request: The incoming request.
+        call_next: The next middleware function to call.
+    """
+    timings = RequestTimings()
+    token = _current_timings.set(timings)
+
+    profiler = None
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        profiler = SamplingProfiler(PROFILE_INTERVAL_MS / 1000)
+        profiler.start()
+    profiler_token = _current_profiler.set(profiler)
+
+    start = time.perf_counter()
+    try:
+        with profiled_frame(sys._getframe()):
+            response = await call_next(request)
+    finally:
+        total = time.perf_counter() - start
+        _current_timings.reset(token)
+        _current_profiler.reset(profiler_token)
+        if profiler:
+            # Joining the sampler and writing the profile would block the event loop
+            await run_in_threadpool(profiler.stop)
+            if total * 1000 >= PROFILE_SLOW_REQUEST_MS:
+                path = _profile_path(request)
+                await run_in_threadpool(profiler.write, path)
+                logger.info(
+                    "Slow request {} took {:.0f} ms, profile written to {}".format(request.url.path, total * 1000, path)
+                )
+
+    response.headers["Server-Timing"] = timings.server_timing(total)
+    return response
+
+
+class TimedRoute(APIRoute):
+    """
+    APIRoute which records the time between the endpoint returning and the
+    response being ready (response model validation and JSON encoding) as
+    the "serialize" phase, and profiles its endpoint if the request is sampled.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if asyncio.iscoroutinefunction(endpoint):
+            endpoint = self._mark_endpoint_done(endpoint)
+        else:
+            endpoint = self._profile_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    @staticmethod
+    def _mark_endpoint_done(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            with profiled_frame(sys._getframe()):
+                result = await endpoint(*args, **kwargs)
+            timings = _current_timings.get()
+            if timings is not None:
+                timings.endpoint_done = time.perf_counter()
+            return result
+
+        return wrapper
+
+    @staticmethod
+    def _profile_endpoint(endpoint):
+        # A sync endpoint runs in a threadpool thread, with the context of the request
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            return _call_profiled(endpoint, *args, **kwargs)
+
+        return wrapper
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_route_handler(request: Request):
+            response = await handler(request)
+            timings = _current_timings.get()
+            if timings is not None and timings.endpoint_done is not None:
+                timings.add("serialize", time.perf_counter() - timings.endpoint_done)
+            return response
+
+        return timed_route_handler
@@ -1,17 +1,52 @@
+from contextlib import asynccontextmanager
+
 import yaml
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import PlainTextResponse, RedirectResponse
 
-from app.api.v1.endpoints import carpark
+from app.api.v1.endpoints import admin, carpark, health
+from app.core import prefork
+from app.core.config import POLLER_ENABLED, SNAPSHOT_WARMUP
 from app.core.logging_config import setup_logging
+from app.core.metrics import registry
 from app.core.rate_limit import rate_limit_middleware
+from app.core.timing import timing_middleware
+from app.services.geocoding_service import geocoding_service
+from app.services.health_service import start_warmup
+from app.services.polling_scheduler import background_poller
 
 # Initialize logging
 logger = setup_logging()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start the background poller (if enabled) with the app, and stop it on shutdown.
+    The occupancy history is loaded on startup (rebuilding the forecast profiles) and saved on shutdown
+    if HISTORY_DIR is set.
+    Under the preforking server (serve.py), the master keeps the history (loaded before forking, saved
+    on shutdown) and only the first worker runs the poller.
+    The fleet snapshot is loaded in the background (if SNAPSHOT_WARMUP), /readyz reports ready once it is.
+    The pending save of the geocoder cache is run on shutdown.
+    """
+    if not prefork.preloaded:
+        prefork.load_history()
+    if SNAPSHOT_WARMUP:
+        start_warmup()
+    if POLLER_ENABLED and prefork.runs_background_tasks():
+        background_poller.start()
+    yield
+    background_poller.stop()
+    geocoding_service.flush()
+    if prefork.keeps_history():
+        prefork.save_history()
+
+
 # FastAPI entry point
 app = FastAPI(
+    lifespan=lifespan,
     title="Carpark Finder API",
     description="It is an API service to find nearby carparks (Park&Ride) in NSW",
     version="1.0.0",
@@ -39,13 +74,19 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["X-API-Key"],
+    expose_headers=["Server-Timing"],
 )
 
 # Add rate limit middleware
 app.middleware("http")(rate_limit_middleware)
 
+# Add request timing middleware (outermost, so that it covers the rate limiter too)
+app.middleware("http")(timing_middleware)
+
 # Include routers
 app.include_router(carpark.router, prefix="/carparks", tags=["carparks"])
+app.include_router(health.router, tags=["health"])
+app.include_router(admin.router, prefix="/admin", tags=["admin"])
 
 # Custom OpenAPI schema
 app.openapi = custom_openapi
@@ -58,6 +99,12 @@ def read_root():
     return RedirectResponse(url="/docs")
 
 
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    """Expose the in-process metrics in the Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 # if __name__ == "__main__":
 #     import uvicorn
 #     uvicorn.run(app, host="0.0.0.0", port=8000)
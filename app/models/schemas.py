@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class Carpark(BaseModel):
@@ -10,6 +10,33 @@ class Carpark(BaseModel):
     distance_km: float
 
 
+class NearbyOrigin(BaseModel):
+    lat: float
+    lng: float
+    radius_km: float = Field(10, ge=0)
+
+
+class NearbyBatchRequest(BaseModel):
+    origins: List[NearbyOrigin]
+
+
+class NearbyBatchResult(BaseModel):
+    # The origin of the search
+    lat: float
+    lng: float
+    radius_km: float
+    # The carparks within the radius, nearest first
+    carparks: List[Carpark]
+
+
+class ZoneAvailability(BaseModel):
+    zone_id: str
+    name: str
+    total_spots: int
+    available_spots: int
+    status: str
+
+
 class CarparkDetail(BaseModel):
     facility_id: str
     name: str
@@ -17,3 +44,107 @@ class CarparkDetail(BaseModel):
     available_spots: int
     status: str
     timestamp: Optional[datetime]
+    # True if served from the last known snapshot while the NSW API is unavailable
+    stale: bool = False
+    # Availability per zone (e.g. level) of the carpark
+    zones: List[ZoneAvailability] = []
+
+
+class FacilityState(BaseModel):
+    facility_id: str
+    name: str
+    # None if the facility is not located (e.g. a no-update facility)
+    latitude: Optional[float]
+    longitude: Optional[float]
+    # True if the facility stopped updating its occupancy
+    no_update: bool
+    # None if the availability of the facility is unknown
+    available_spots: Optional[int]
+    status: Optional[str]
+
+
+class FleetChanges(BaseModel):
+    # The cursor of the current version of the fleet state, "<boot ID>:<version>", to pass as `since`
+    # in the next request
+    version: str
+    # True if the client must replace its whole state with `changed` (it is too far behind, or its cursor is
+    # of another process)
+    full_resync: bool
+    changed: List[FacilityState]
+    removed: List[str]
+
+
+class FacilityFreshness(BaseModel):
+    facility_id: str
+    # When the background poller last refreshed the details, None if never
+    polled_at: Optional[datetime]
+    age_seconds: Optional[float]
+    # The refresh interval assigned by the polling scheduler
+    interval_seconds: float
+    next_poll_at: datetime
+    # Occupancy change as a fraction of the capacity per hour (EWMA)
+    change_rate: float
+    # Recent lookups (exponentially decayed)
+    demand: float
+
+
+class HistoryPoint(BaseModel):
+    # The start of the bucket
+    timestamp: datetime
+    # Mean, min and max occupancy of the readings in the bucket
+    occupancy: float
+    min_occupancy: int
+    max_occupancy: int
+
+
+class OccupancyHistory(BaseModel):
+    facility_id: str
+    total_spots: int
+    points: List[HistoryPoint]
+
+
+class AvailabilityForecast(BaseModel):
+    facility_id: str
+    # The time the forecast is for
+    forecast_time: datetime
+    total_spots: int
+    available_spots: int
+    status: str
+    # The number of readings of the weekly profile slot, 0 if the forecast is the last reading
+    samples: int
+
+
+class SweepStatus(BaseModel):
+    running: bool
+    # Facilities visited by the current (or last) sweep, out of the fleet size
+    done: int
+    total: int
+    started_at: Optional[float]
+    last_duration_seconds: Optional[float]
+    # Whether the last finished sweep went through all the facilities
+    last_completed: Optional[bool]
+
+
+class HealthStatus(BaseModel):
+    # True once the fleet snapshot is loaded
+    ready: bool
+    snapshot_age_seconds: Optional[float]
+    # State of the circuit breaker around the NSW API: closed, open or half_open
+    circuit_state: str
+    # Whether the background sweeps were paused through the admin API
+    sweeps_paused: bool
+    sweeps: Dict[str, SweepStatus]
+
+
+class CacheStats(BaseModel):
+    entries: int
+    maxsize: int
+    # Entries evicted because the cache was full, and entries which expired
+    evictions: int
+    expirations: int
+
+
+class AdminStatus(HealthStatus):
+    # Statistics of the fleet caches, per cache name
+    caches: Dict[str, CacheStats]
+    warmup_running: bool
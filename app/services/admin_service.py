@@ -0,0 +1,113 @@
+import logging
+from typing import Dict
+
+from app.core.master_channel import master_channel
+from app.services.availability_service import availability_store
+from app.services.cache_service import (
+    carpark_ids_cache,
+    carpark_locations_cache,
+    last_known_details,
+    last_known_fleet,
+    no_update_carparks_cache,
+)
+from app.services.fleet_snapshot import fleet_snapshots
+from app.services.health_service import health_status, start_warmup, warmup_running
+from app.services.polling_scheduler import polling_scheduler
+from app.services.response_cache import detail_responses, no_update_responses
+from app.services.staleness_tracker import staleness_tracker
+from app.services.zone_service import zone_cache
+
+logger = logging.getLogger(__name__)
+
+# The fleet caches, by name
+FLEET_CACHES = {
+    "carpark_ids": carpark_ids_cache,
+    "carpark_locations": carpark_locations_cache,
+    "no_update_carparks": no_update_carparks_cache,
+}
+
+
+def invalidate_cache(name: str, rebuild: bool = True) -> int:
+    """
+    Drop the entries of a fleet cache, and rebuild the fleet snapshot from the NSW API in the background
+    (see start_warmup), the current snapshot being served meanwhile.
+    The last known results are kept, to be served if the NSW API is unavailable.
+
+    Parameters:
+        name (str): The cache name, e.g. "carpark_locations"
+        rebuild (bool): Rebuild the fleet snapshot, False to invalidate other caches first
+
+    Returns:
+        int: The number of dropped entries
+
+    Raises:
+        KeyError: If there is no fleet cache with this name
+    """
+    cache = FLEET_CACHES[name]
+    entries = len(cache)
+    cache.clear()
+    logger.info("Invalidated the {} cache ({} entries)".format(name, entries))
+    if rebuild:
+        start_warmup(force=True)
+    return entries
+
+
+def invalidate_facility(facility_id: str) -> None:
+    """
+    Forget what is known about a facility: its last known details (also served by the
+    background poller) and availability, its parsed zones and encoded response and its no-update status.
+    The fleet snapshot is republished without its no-update status and availability, and the no-update
+    cache is dropped so that the next (incremental) no-update sweep checks it again.
+
+    Parameters:
+        facility_id (str): The facility ID
+    """
+    facility_id = str(facility_id)
+    last_known_details.delete(facility_id)
+    availability_store.forget(facility_id)
+    staleness_tracker.forget(facility_id)
+    zone_cache.forget(facility_id)
+    detail_responses.forget(facility_id)
+    no_update_responses.forget(facility_id)
+    polling_scheduler.mark_due(facility_id)
+
+    last_known = last_known_fleet.get("no_update_carparks")
+    if last_known is not None and facility_id in last_known.value:
+        last_known_fleet.put("no_update_carparks", set(last_known.value) - {facility_id})
+    no_update_carparks_cache.clear()
+    fleet_snapshots.forget_facility(facility_id)
+    logger.info("Invalidated facility {}".format(facility_id))
+
+
+def forward_admin_action(action: str, **fields) -> bool:
+    """
+    Send an admin action applied by a worker of the preforking server to the master, which applies
+    it too and publishes it to every worker (see PreforkServer.apply_admin_action): the other workers
+    would otherwise keep their own caches and state.
+
+    Parameters:
+        action (str): The action, e.g. "invalidate_facility"
+        fields: The parameters of the action, e.g. facility_id
+
+    Returns:
+        bool: True if the master applies the action, False in the single process
+    """
+    forwarded = master_channel.send("admin", action=action, **fields)
+    if forwarded:
+        logger.info("Forwarded the {} action to the master".format(action))
+    return forwarded
+
+
+def admin_status() -> Dict:
+    """
+    Get the health of the service with the statistics of the fleet caches.
+
+    Returns:
+        dict: The health status (see health_status), the cache statistics per cache name,
+              and whether a warmup is running
+    """
+    return {
+        **health_status(),
+        "caches": {name: cache.stats() for name, cache in FLEET_CACHES.items()},
+        "warmup_running": warmup_running(),
+    }
@@ -0,0 +1,243 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, Literal, Mapping, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# The available statuses of a carpark, see available_status
+AvailabilityStatus = Literal["Available", "Almost Full", "Full"]
+AVAILABILITY_STATUSES = ("Available", "Almost Full", "Full")
+
+
+def available_status(spots: int, occupancy: int) -> str:
+    """
+    Get the available status of a carpark
+
+    Parameters:
+        spots (int): The total number of spots
+        occupancy (int): The number of occupied spots
+
+    Returns:
+        str: The available status of the carpark
+        API response example:
+            "Full"
+            "Almost Full"
+            "Available"
+    """
+    available_spots = spots - occupancy
+    if available_spots <= 0:
+        return "Full"
+    elif available_spots <= spots * 0.1:
+        return "Almost Full"
+    else:
+        return "Available"
+
+
+class Availability(NamedTuple):
+    available_spots: int
+    status: str
+    # When the details were fetched
+    updated_at: float
+
+
+def availability_matcher(
+    availability: Mapping[str, Availability],
+    min_available: Optional[int] = None,
+    statuses: Optional[Iterable[str]] = None,
+) -> Optional[Callable[[str], bool]]:
+    """
+    Get the filter of the facilities matching availability conditions.
+    The facilities whose availability is unknown never match.
+
+    Parameters:
+        availability (dict): The availability per facility ID
+        min_available (int, optional): The minimum number of available spots
+        statuses (list, optional): The accepted statuses, e.g. ["Available", "Almost Full"]
+
+    Returns:
+        Callable[[str], bool]: Whether a facility ID matches, or None if there is no condition
+    """
+    if min_available is None and not statuses:
+        return None
+    min_available = min_available or 0
+    statuses = frozenset(statuses or AVAILABILITY_STATUSES)
+
+    def matches(facility_id: str) -> bool:
+        entry = availability.get(facility_id)
+        return entry is not None and entry.available_spots >= min_available and entry.status in statuses
+
+    return matches
+
+
+class AvailabilitySnapshot(Mapping):
+    """
+    The availability per facility ID published with a fleet snapshot, never modified: a base mapping
+    and the changes made since it was copied (None for a forgotten facility), so that publishing new
+    availabilities copies the changes only (see updated), not the whole fleet.
+    """
+
+    __slots__ = ("_base", "_changes")
+
+    def __init__(self, base: Dict[str, Availability], changes: Optional[Dict[str, Optional[Availability]]] = None):
+        self._base = base
+        self._changes = changes or {}
+
+    def __getitem__(self, facility_id: str) -> Availability:
+        if facility_id in self._changes:
+            availability = self._changes[facility_id]
+            if availability is None:
+                raise KeyError(facility_id)
+            return availability
+        return self._base[facility_id]
+
+    def get(self, facility_id: str, default=None):
+        if facility_id in self._changes:
+            availability = self._changes[facility_id]
+            return default if availability is None else availability
+        return self._base.get(facility_id, default)
+
+    def __iter__(self) -> Iterator[str]:
+        for facility_id in self._base:
+            if facility_id not in self._changes:
+                yield facility_id
+        for facility_id, availability in self._changes.items():
+            if availability is not None:
+                yield facility_id
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def updated(self, changes: Dict[str, Optional[Availability]]) -> "AvailabilitySnapshot":
+        """
+        Get the snapshot with more changes (see AvailabilityStore.changes_since).
+        The changes are merged into a new base once they outnumber the square root of its size,
+        so that a publication copies O(changes + sqrt(fleet)) entries, the merges included.
+
+        Parameters:
+            changes (dict): The availability per changed facility ID, None if it was forgotten
+
+        Returns:
+            AvailabilitySnapshot: The new snapshot, this one being unchanged
+        """
+        merged = {**self._changes, **changes}
+        if len(merged) <= max(64, math.isqrt(len(self._base))):
+            return AvailabilitySnapshot(self._base, merged)
+        base = dict(self._base)
+        for facility_id, availability in merged.items():
+            if availability is None:
+                base.pop(facility_id, None)
+            else:
+                base[facility_id] = availability
+        return AvailabilitySnapshot(base)
+
+
+class AvailabilityStore:
+    def __init__(self):
+        """
+        Initialize the availability snapshot of the fleet: the available spots and status
+        of each facility, parsed once per details refresh (by the sweeps, the background
+        poller and the details requests), so that the nearby queries can filter the
+        carparks of the location index with a dictionary lookup.
+        """
+        self._entries: Dict[str, Availability] = {}
+        # Incremented on every change, to tell the readers of the whole snapshot that it changed
+        self.revision = 0
+        # The revision of the last change per facility ID, the most recent last (see changes_since),
+        # and the revision before which it is incomplete (cleared)
+        self._changes: "OrderedDict[str, int]" = OrderedDict()
+        self._changes_start = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def update(self, facility_id: str, details: Dict, now: float = None) -> Optional[Availability]:
+        """
+        Record the availability of fetched details.
+
+        Parameters:
+            facility_id (str): The facility ID
+            details (dict): The carpark details
+            now (float, optional): The epoch time the details were fetched
+
+        Returns:
+            Availability: The recorded availability, or None if the spots or occupancy are invalid
+        """
+        try:
+            spots = int(details.get("spots", 0))
+            occupancy = int((details.get("occupancy") or {}).get("total", 0))
+        except (AttributeError, TypeError, ValueError) as e:
+            logger.warning("Invalid spot or occupancy data for carpark {}: {}".format(facility_id, e))
+            return None
+        availability = Availability(
+            available_spots=max(spots - occupancy, 0),
+            status=available_status(spots, occupancy),
+            updated_at=time.time() if now is None else now,
+        )
+        facility_id = str(facility_id)
+        with self._lock:
+            previous = self._entries.get(facility_id)
+            self._entries[facility_id] = availability
+            if previous is None or previous[:2] != availability[:2]:
+                self._changed(facility_id)
+        return availability
+
+    def _changed(self, facility_id: str) -> None:
+        self.revision += 1
+        self._changes[facility_id] = self.revision
+        self._changes.move_to_end(facility_id)
+
+    def get(self, facility_id: str) -> Optional[Availability]:
+        return self._entries.get(str(facility_id))
+
+    def forget(self, facility_id: str) -> None:
+        facility_id = str(facility_id)
+        with self._lock:
+            if self._entries.pop(facility_id, None) is not None:
+                self._changed(facility_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.revision += 1
+            self._changes.clear()
+            self._changes_start = self.revision
+
+    def copy(self) -> Dict[str, Availability]:
+        return dict(self._entries)
+
+    def changes_since(self, revision: int) -> Tuple[int, Optional[Dict[str, Optional[Availability]]]]:
+        """
+        Get the facilities changed after a revision, walking back the changes from the most recent one.
+
+        Parameters:
+            revision (int): The revision, e.g. of a fleet snapshot
+
+        Returns:
+            Tuple[int, dict]: The current revision, and the current availability per facility ID changed
+                              after the revision (None if forgotten), or None if the store was cleared since
+        """
+        with self._lock:
+            if revision < self._changes_start:
+                return self.revision, None
+            changes = {}
+            for facility_id in reversed(self._changes):
+                if self._changes[facility_id] <= revision:
+                    break
+                changes[facility_id] = self._entries.get(facility_id)
+            return self.revision, changes
+
+    def matcher(
+        self, min_available: Optional[int] = None, statuses: Optional[Iterable[str]] = None
+    ) -> Optional[Callable[[str], bool]]:
+        """
+        Get the filter of the facilities matching availability conditions, see availability_matcher.
+        """
+        return availability_matcher(self._entries, min_available, statuses)
+
+
+# Create a global availability store instance
+availability_store = AvailabilityStore()
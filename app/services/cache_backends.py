@@ -0,0 +1,429 @@
+import fnmatch
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from app.core.metrics import cache_capacity, cache_entries, cache_evictions_total, cache_requests_total
+
+try:
+    import redis
+except ImportError:  # the redis backend is optional
+    redis = None
+
+
+def _to_json(value):
+    # JSON has no tuples (the cachetools keys) nor sets (e.g. the no-update carparks): they are tagged
+    if isinstance(value, tuple):
+        return {"__tuple__": [_to_json(item) for item in value]}
+    if isinstance(value, (set, frozenset)):
+        return {"__set__": sorted((_to_json(item) for item in value), key=repr)}
+    if isinstance(value, list):
+        return [_to_json(item) for item in value]
+    if isinstance(value, dict):
+        if not all(isinstance(key, str) for key in value):
+            raise TypeError("Only dictionaries with string keys can be cached")
+        return {key: _to_json(item) for key, item in value.items()}
+    return value
+
+
+def _from_json(value: Dict):
+    if len(value) == 1 and "__tuple__" in value:
+        return tuple(value["__tuple__"])
+    if len(value) == 1 and "__set__" in value:
+        return set(value["__set__"])
+    return value
+
+
+def dumps(value) -> str:
+    """
+    Serialize a cached key or value (plain data: dicts with string keys, lists, tuples, sets, strings,
+    numbers, booleans and None) as JSON. Unlike pickle, loading the entries of a shared backend
+    never runs code, whoever wrote them.
+
+    Raises:
+        TypeError: If the value is not plain data
+    """
+    return json.dumps(_to_json(value), sort_keys=True, separators=(",", ":"))
+
+
+def loads(data) -> Any:
+    """
+    Deserialize a cached key or value serialized by dumps.
+
+    Raises:
+        ValueError: If the data is not valid JSON
+    """
+    return json.loads(data, object_hook=_from_json)
+
+
+class CacheBackend(MutableMapping):
+    """
+    Base class of the cache backends used with cachetools.cached.
+
+    A backend is a mapping whose entries expire after `ttl` seconds (spread by
+    +/- `jitter` so that entries cached together do not expire together).
+    Lookups are counted as hits and misses in the cache_requests_total metric.
+    Subclasses implement _get (raising KeyError on a miss), __setitem__,
+    __delitem__, __iter__, __len__ and clear.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, jitter: float = 0.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.jitter = jitter
+        self.evictions = 0
+        self.expirations = 0
+        cache_capacity.set(maxsize, cache=name)
+
+    def _entry_ttl(self) -> float:
+        if not self.jitter:
+            return self.ttl
+        return self.ttl * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _record_evictions(self, evicted: int = 0, expired: int = 0) -> None:
+        if evicted:
+            self.evictions += evicted
+            cache_evictions_total.inc(evicted, cache=self.name, reason="capacity")
+        if expired:
+            self.expirations += expired
+            cache_evictions_total.inc(expired, cache=self.name, reason="expired")
+
+    def _get(self, key) -> Any:
+        raise NotImplementedError
+
+    def __getitem__(self, key) -> Any:
+        try:
+            value = self._get(key)
+        except KeyError:
+            cache_requests_total.inc(cache=self.name, result="miss")
+            raise
+        cache_requests_total.inc(cache=self.name, result="hit")
+        return value
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        """
+        Get the live statistics of the cache, for tuning its size and TTL.
+
+        Returns:
+            dict: The number of entries, the capacity and the number of evictions and expirations
+        """
+        return {
+            "entries": len(self),
+            "maxsize": self.maxsize,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class MeteredTTLCache(CacheBackend):
+    POLICIES = ("lru", "lfu", "ttl")
+
+    def __init__(self, name: str, maxsize: int, ttl: float, policy: str = "ttl", jitter: float = 0.0):
+        """
+        Initialize an in-process TTL cache which records its hits, misses and evictions.
+        Each worker process has its own entries.
+
+        Parameters:
+            name (str): The cache name, used as the metrics label
+            maxsize (int): The maximum number of entries
+            ttl (float): The time-to-live of the entries in seconds
+            policy (str): The entry evicted when the cache is full: "lru" (least recently used),
+                          "lfu" (least frequently used) or "ttl" (soonest to expire)
+            jitter (float): The random spread of the TTL, as a fraction of it
+        """
+        if policy not in self.POLICIES:
+            raise ValueError("Unknown eviction policy: {}".format(policy))
+        super().__init__(name, maxsize, ttl, jitter)
+        self.policy = policy
+        # key -> [value, expires, hits], in least recently used first order
+        self._entries: "OrderedDict[Any, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                raise KeyError(key)
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                self._record_evictions(expired=1)
+                self._update_size()
+                raise KeyError(key)
+            entry[2] += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _expire(self, now: float) -> None:
+        expired = [key for key, entry in self._entries.items() if entry[1] <= now]
+        for key in expired:
+            del self._entries[key]
+        self._record_evictions(expired=len(expired))
+
+    def _victim(self):
+        if self.policy == "lru":
+            return next(iter(self._entries))
+        if self.policy == "lfu":
+            return min(self._entries, key=lambda key: self._entries[key][2])
+        return min(self._entries, key=lambda key: self._entries[key][1])
+
+    def _update_size(self) -> None:
+        cache_entries.set(len(self._entries), cache=self.name)
+
+    def __setitem__(self, key, value) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if key in self._entries:
+                del self._entries[key]
+            elif len(self._entries) >= self.maxsize:
+                self._expire(now)
+                evicted = 0
+                while len(self._entries) >= self.maxsize:
+                    del self._entries[self._victim()]
+                    evicted += 1
+                self._record_evictions(evicted=evicted)
+            self._entries[key] = [value, now + self._entry_ttl(), 0]
+            self._update_size()
+
+    def __delitem__(self, key) -> None:
+        with self._lock:
+            del self._entries[key]
+            self._update_size()
+
+    def __contains__(self, key) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[1] > time.monotonic()
+
+    def __iter__(self) -> Iterator:
+        now = time.monotonic()
+        return iter([key for key, entry in list(self._entries.items()) if entry[1] > now])
+
+    def __len__(self) -> int:
+        now = time.monotonic()
+        return sum(1 for entry in list(self._entries.values()) if entry[1] > now)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._update_size()
+
+
+class SQLiteCache(CacheBackend):
+    def __init__(self, name: str, maxsize: int, ttl: float, path: str, jitter: float = 0.0):
+        """
+        Initialize a cache stored in a SQLite database, shared by all the worker
+        processes of the host (the database can be put on a tmpfs such as /dev/shm).
+        Keys and values are stored as JSON (see dumps), the directory of the database
+        is created private to the user.
+
+        Parameters:
+            name (str): The cache name, also the namespace of its entries in the database
+            maxsize (int): The maximum number of entries, the soonest to expire are evicted first
+            ttl (float): The time-to-live of the entries in seconds
+            path (str): The path of the SQLite database
+            jitter (float): The random spread of the TTL, as a fraction of it
+        """
+        super().__init__(name, maxsize, ttl, jitter)
+        self.path = path
+        self._connect()
+        # A SQLite connection must not be used across a fork: the forked workers open their own
+        os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self) -> None:
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "name TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires REAL NOT NULL, "
+                "PRIMARY KEY (name, key))"
+            )
+
+    def _query(self, sql: str, parameters: Tuple = ()) -> list:
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def _execute(self, sql: str, parameters: Tuple = ()) -> int:
+        with self._lock:
+            return self._connection.execute(sql, parameters).rowcount
+
+    def _get(self, key) -> Any:
+        rows = self._query(
+            "SELECT value FROM entries WHERE name = ? AND key = ? AND expires > ?",
+            (self.name, dumps(key), time.time()),
+        )
+        if not rows:
+            raise KeyError(key)
+        try:
+            return loads(rows[0][0])
+        except ValueError:
+            # Not written by this backend: a miss, rebuilt and overwritten
+            raise KeyError(key)
+
+    def __setitem__(self, key, value) -> None:
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                expired = self._connection.execute(
+                    "DELETE FROM entries WHERE name = ? AND expires <= ?", (self.name, now)
+                ).rowcount
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO entries (name, key, value, expires) VALUES (?, ?, ?, ?)",
+                    (self.name, dumps(key), dumps(value), now + self._entry_ttl()),
+                )
+                evicted = self._connection.execute(
+                    "DELETE FROM entries WHERE name = ? AND key NOT IN "
+                    "(SELECT key FROM entries WHERE name = ? ORDER BY expires DESC LIMIT ?)",
+                    (self.name, self.name, self.maxsize),
+                ).rowcount
+                size = self._connection.execute("SELECT COUNT(*) FROM entries WHERE name = ?", (self.name,)).fetchone()[
+                    0
+                ]
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        self._record_evictions(evicted=evicted, expired=expired)
+        cache_entries.set(size, cache=self.name)
+
+    def __delitem__(self, key) -> None:
+        if not self._execute("DELETE FROM entries WHERE name = ? AND key = ?", (self.name, dumps(key))):
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator:
+        rows = self._query("SELECT key FROM entries WHERE name = ? AND expires > ?", (self.name, time.time()))
+        return iter([loads(row[0]) for row in rows])
+
+    def __len__(self) -> int:
+        rows = self._query("SELECT COUNT(*) FROM entries WHERE name = ? AND expires > ?", (self.name, time.time()))
+        return rows[0][0]
+
+    def clear(self) -> None:
+        self._execute("DELETE FROM entries WHERE name = ?", (self.name,))
+
+
+class RedisCache(CacheBackend):
+    def __init__(self, name: str, maxsize: int, ttl: float, client, jitter: float = 0.0):
+        """
+        Initialize a cache stored in Redis (or any server speaking the Redis protocol),
+        shared by all the worker processes and hosts. Keys and values are stored as JSON (see dumps), and expire
+        through the Redis TTL; maxsize is left to the Redis eviction policy.
+
+        Parameters:
+            name (str): The cache name, used in the key prefix
+            maxsize (int): The maximum number of entries (informational)
+            ttl (float): The time-to-live of the entries in seconds
+            client: A redis.Redis client (or a FakeRedis)
+            jitter (float): The random spread of the TTL, as a fraction of it
+        """
+        super().__init__(name, maxsize, ttl, jitter)
+        self.client = client
+        self.prefix = "carpark:{}:".format(name)
+
+    def _get(self, key) -> Any:
+        value = self.client.get(self.prefix + dumps(key))
+        if value is None:
+            raise KeyError(key)
+        try:
+            return loads(value)
+        except ValueError:
+            # Not written by this backend: a miss, rebuilt and overwritten
+            raise KeyError(key)
+
+    def __setitem__(self, key, value) -> None:
+        self.client.set(self.prefix + dumps(key), dumps(value), ex=max(int(self._entry_ttl()), 1))
+
+    def __delitem__(self, key) -> None:
+        if not self.client.delete(self.prefix + dumps(key)):
+            raise KeyError(key)
+
+    def _keys(self):
+        return list(self.client.scan_iter(match=self.prefix + "*"))
+
+    def __iter__(self) -> Iterator:
+        keys = [key.decode() if isinstance(key, bytes) else key for key in self._keys()]
+        return iter([loads(key.replace(self.prefix, "", 1)) for key in keys])
+
+    def __len__(self) -> int:
+        return len(self._keys())
+
+    def clear(self) -> None:
+        keys = self._keys()
+        if keys:
+            self.client.delete(*keys)
+
+
+class FakeRedis:
+    """
+    An in-memory stand-in for the subset of the redis.Redis client used by RedisCache,
+    for tests and local development without a Redis server.
+    """
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def _alive(self, key: str) -> bool:
+        entry = self._data.get(key)
+        if entry is None:
+            return False
+        if entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return False
+        return True
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._data[key][0] if self._alive(key) else None
+
+    def set(self, key: str, value: bytes, ex: int = None) -> bool:
+        with self._lock:
+            self._data[key] = (value, time.time() + ex if ex else None)
+        return True
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            return sum(1 for key in keys if self._alive(key) and self._data.pop(key, None) is not None)
+
+    def scan_iter(self, match: str = "*"):
+        with self._lock:
+            keys = [key for key in list(self._data) if self._alive(key) and fnmatch.fnmatchcase(key, match)]
+        return iter(keys)
+
+    def flushdb(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+def create_redis_client(url: str):
+    """
+    Create the Redis client of the redis backend.
+
+    Parameters:
+        url (str): The Redis URL, or "fake://" for an in-process FakeRedis
+
+    Returns:
+        The client
+
+    Raises:
+        RuntimeError: If the redis package is not installed
+    """
+    if url.startswith("fake://"):
+        return FakeRedis()
+    if redis is None:
+        raise RuntimeError("CACHE_BACKEND=redis requires the redis package (pip install redis)")
+    return redis.Redis.from_url(url)
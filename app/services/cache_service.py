@@ -1,8 +1,73 @@
-from cachetools import TTLCache
+import time
+from typing import Any, Dict, NamedTuple, Optional
+
+from app.core.config import CACHE_BACKEND, CACHE_SQLITE_PATH, REDIS_URL, CacheConfig, cache_settings
+from app.services.cache_backends import MeteredTTLCache, RedisCache, SQLiteCache, create_redis_client
+
+# The Redis client shared by the caches of the redis backend
+_redis_client = None
+
+
+def create_cache(name: str, config: CacheConfig = None, backend: str = CACHE_BACKEND):
+    """
+    Create a cache of the configured backend.
+
+    Parameters:
+        name (str): The cache name
+        config (CacheConfig, optional): The TTL, size, eviction policy and jitter of the cache,
+                                        defaults to the settings of the cache name
+        backend (str): "memory" (per worker process), "sqlite" (shared by the workers of the host)
+                       or "redis" (shared by all the workers)
+
+    Returns:
+        The cache, a mapping usable with cachetools.cached
+    """
+    global _redis_client
+    config = config or getattr(cache_settings, name, None) or CacheConfig()
+    if backend == "memory":
+        return MeteredTTLCache(name, maxsize=config.maxsize, ttl=config.ttl, policy=config.policy, jitter=config.jitter)
+    if backend == "sqlite":
+        return SQLiteCache(name, maxsize=config.maxsize, ttl=config.ttl, path=CACHE_SQLITE_PATH, jitter=config.jitter)
+    if backend == "redis":
+        if _redis_client is None:
+            _redis_client = create_redis_client(REDIS_URL)
+        return RedisCache(name, maxsize=config.maxsize, ttl=config.ttl, client=_redis_client, jitter=config.jitter)
+    raise ValueError("Unknown CACHE_BACKEND: {}".format(backend))
 
-from app.core.config import CACHE_MAXSIZE, CACHE_TTL
 
 # Create cache instances
-carpark_ids_cache = TTLCache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL)
-carpark_locations_cache = TTLCache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL)
-no_update_carparks_cache = TTLCache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL)
+carpark_ids_cache = create_cache("carpark_ids")
+carpark_locations_cache = create_cache("carpark_locations")
+no_update_carparks_cache = create_cache("no_update_carparks")
+
+
+class Snapshot(NamedTuple):
+    value: Any
+    fetched_at: float
+
+
+class SnapshotStore:
+    def __init__(self):
+        """
+        Initialize a store of the last known good value per key, kept without
+        expiry so that it can be served (as stale) while the NSW Transport API
+        is unavailable.
+        """
+        self._snapshots: Dict[str, Snapshot] = {}
+
+    def put(self, key: str, value: Any) -> None:
+        self._snapshots[key] = Snapshot(value, time.time())
+
+    def get(self, key: str) -> Optional[Snapshot]:
+        return self._snapshots.get(key)
+
+    def delete(self, key: str) -> bool:
+        return self._snapshots.pop(key, None) is not None
+
+    def clear(self) -> None:
+        self._snapshots.clear()
+
+
+# Last known good data (per facility details, and fleet-wide results)
+last_known_details = SnapshotStore()
+last_known_fleet = SnapshotStore()
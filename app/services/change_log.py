@@ -0,0 +1,213 @@
+import logging
+import threading
+import uuid
+from collections import deque
+from typing import Deque, Dict, FrozenSet, NamedTuple, Optional
+
+from app.core.config import CHANGE_LOG_CAPACITY
+from app.core.metrics import fleet_version
+
+logger = logging.getLogger(__name__)
+
+
+class FacilityState(NamedTuple):
+    facility_id: str
+    name: str
+    # None if the facility is not located (e.g. a no-update facility)
+    latitude: Optional[float]
+    longitude: Optional[float]
+    # True if the facility stopped updating its occupancy (see the no-update sweep)
+    no_update: bool
+    # None if the availability of the facility is unknown
+    available_spots: Optional[int]
+    status: Optional[str]
+
+
+class Change(NamedTuple):
+    version: int
+    # The facilities added or changed, and removed, by this version
+    changed: FrozenSet[str]
+    removed: FrozenSet[str]
+
+
+def fleet_states(snapshot) -> Dict[str, FacilityState]:
+    """
+    Get the state of every facility of a fleet snapshot: its location, its no-update status
+    and its last known availability.
+
+    Parameters:
+        snapshot (FleetSnapshot): The fleet snapshot
+
+    Returns:
+        dict: The state per facility ID
+    """
+    located = {}
+    for carpark in snapshot.carparks:
+        location = carpark.get("location") or {}
+        located[str(carpark.get("facility_id"))] = (
+            carpark.get("name"),
+            location.get("latitude"),
+            location.get("longitude"),
+        )
+
+    states = {}
+    for facility_id in set(snapshot.carpark_ids) | set(located) | snapshot.no_update:
+        facility_id = str(facility_id)
+        name, latitude, longitude = located.get(facility_id, (None, None, None))
+        availability = snapshot.availability.get(facility_id)
+        states[facility_id] = FacilityState(
+            facility_id=facility_id,
+            name=name or snapshot.carpark_ids.get(facility_id) or "Unknown",
+            latitude=latitude,
+            longitude=longitude,
+            no_update=facility_id in snapshot.no_update,
+            available_spots=availability.available_spots if availability else None,
+            status=availability.status if availability else None,
+        )
+    return states
+
+
+class ChangeLog:
+    def __init__(self, capacity: int = 1000):
+        """
+        Initialize the versioned change log of the fleet state, for the clients mirroring it.
+
+        Each fleet snapshot refresh (see FleetSnapshotStore.publish) which changes the state of
+        facilities (location, no-update status or availability) gets the next version, and
+        records the changed facilities. Only the last `capacity` versions are kept: a client which is further
+        behind is told to resync the whole fleet.
+
+        The versions are counted by a single process for the whole fleet of workers: the master of the
+        preforking server, whose workers follow its versions (see follow), else the single process.
+        The clients get them as cursors "<boot ID>:<version>": a cursor from before a restart is answered
+        with a full resync, never with the deltas of an unrelated version.
+
+        Parameters:
+            capacity (int): The number of versions kept
+        """
+        self.version = 0
+        self.new_boot_id()
+        self._log: Deque[Change] = deque(maxlen=capacity)
+        self._states: Dict[str, FacilityState] = {}
+        self._lock = threading.Lock()
+        # True in the workers of the preforking server, which serve the versions they were forked with
+        self.following = False
+
+    def new_boot_id(self) -> None:
+        """
+        Identify the versions of this process by a new boot ID.
+        """
+        self.boot_id = uuid.uuid4().hex[:12]
+
+    def follow(self) -> None:
+        """
+        Follow the versions of the master of the preforking server, in a forked worker: the worker serves
+        the versions it was forked with (and the master's boot ID), and never creates a version, so that
+        every worker answers a cursor alike. The next generation of workers gets the next versions.
+        """
+        self.following = True
+
+    def cursor(self, version: Optional[int] = None) -> str:
+        """
+        Get the cursor of a version (the current one by default), "<boot ID>:<version>".
+        """
+        return "{}:{}".format(self.boot_id, self.version if version is None else version)
+
+    def parse_cursor(self, cursor: Optional[str]) -> Optional[int]:
+        """
+        Get the version of a cursor of this process.
+
+        Returns:
+            int: The version, or None if the cursor is empty, invalid or of another process
+        """
+        boot_id, _, version = (cursor or "").partition(":")
+        if boot_id != self.boot_id or not version.isdigit():
+            return None
+        return int(version)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.version = 0
+            self.new_boot_id()
+            self._log.clear()
+            self._states = {}
+            self.following = False
+
+    def publish(self, states: Dict[str, FacilityState]) -> int:
+        """
+        Publish the fleet state: if any facility changed, the state gets the next version.
+        A following worker (see follow) keeps the current version.
+
+        Parameters:
+            states (dict): The state per facility ID, see fleet_states
+
+        Returns:
+            int: The current version
+        """
+        if self.following:
+            return self.version
+        with self._lock:
+            changed = frozenset(
+                facility_id for facility_id, state in states.items() if self._states.get(facility_id) != state
+            )
+            removed = frozenset(facility_id for facility_id in self._states if facility_id not in states)
+            if changed or removed:
+                self.version += 1
+                self._log.append(Change(self.version, changed, removed))
+                self._states = states
+                fleet_version.set(self.version)
+                logger.info(
+                    "Fleet version {}: {} facilities changed, {} removed".format(
+                        self.version, len(changed), len(removed)
+                    )
+                )
+            return self.version
+
+    def changes(self, since: Optional[str]) -> Dict:
+        """
+        Get the changes of the fleet state after a version.
+
+        Parameters:
+            since (str, optional): The cursor of the version the client has, None for none
+
+        Returns:
+            dict: {
+                "version": str, the cursor of the current version,
+                "full_resync": bool, True if the changes since this version are not kept anymore
+                               (or the cursor is from before a restart, or none): "changed" is then
+                               the whole fleet, which replaces the client state,
+                "changed": List[FacilityState], the facilities added or changed,
+                "removed": List[str], the facility IDs removed
+            }
+        """
+        version = self.parse_cursor(since)
+        if self.following and version is not None and version > self.version:
+            # The cursor of a worker of the next generation, forked while this one stops: the client is ahead
+            return {"version": since, "full_resync": False, "changed": [], "removed": []}
+        with self._lock:
+            states = self._states
+            cursor = self.cursor()
+            # The oldest version the log has the changes from
+            base = self._log[0].version - 1 if self._log else self.version
+            if version is None or version > self.version or version < base:
+                return {
+                    "version": cursor,
+                    "full_resync": True,
+                    "changed": [states[facility_id] for facility_id in sorted(states)],
+                    "removed": [],
+                }
+            changed, removed = set(), set()
+            for change in self._log:
+                if change.version > version:
+                    changed |= change.changed
+                    removed |= change.removed
+        return {
+            "version": cursor,
+            "full_resync": False,
+            "changed": [states[facility_id] for facility_id in sorted(changed) if facility_id in states],
+            "removed": sorted(facility_id for facility_id in changed | removed if facility_id not in states),
+        }
+
+
+# Create a global change log instance
+change_log = ChangeLog(capacity=CHANGE_LOG_CAPACITY)
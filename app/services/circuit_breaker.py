@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+
+from app.core.metrics import circuit_breaker_transitions_total
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Initialize the circuit breaker.
+
+        The circuit opens after `failure_threshold` consecutive failures and then
+        rejects every request. After `reset_timeout` seconds a single probe request
+        is let through (half open): a success closes the circuit, a failure opens it again.
+
+        Parameters:
+            name (str): The name of the protected dependency, used in logs and metrics
+            failure_threshold (int): The number of consecutive failures which opens the circuit
+            reset_timeout (float): The number of seconds to wait before probing again
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Close the circuit and forget the failures.
+        """
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        """
+        The current state: closed, open or half_open.
+        Once the reset timeout has elapsed, an open circuit is reported as half_open.
+        """
+        if self._state == self.OPEN and time.time() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """
+        True if requests are currently rejected without a probe being due.
+        """
+        return self.state == self.OPEN
+
+    def _transition(self, state: str) -> None:
+        if state != self._state:
+            logger.warning("Circuit breaker {} is now {}".format(self.name, state))
+            circuit_breaker_transitions_total.inc(breaker=self.name, state=state)
+        self._state = state
+
+    def allow_request(self) -> bool:
+        """
+        Check if a request may be sent.
+
+        Returns:
+            bool: True if the circuit is closed, or if this request is the probe of a half open circuit
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.time() - self._opened_at < self.reset_timeout:
+                    return False
+                self._transition(self.HALF_OPEN)
+            # Half open: only one probe at a time
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        """
+        Record a successful request, closing the circuit.
+        """
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            self._transition(self.CLOSED)
+
+    def record_failure(self) -> None:
+        """
+        Record a failed request, opening the circuit if the threshold is reached
+        or if the probe of a half open circuit failed.
+        """
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.time()
+                self._transition(self.OPEN)
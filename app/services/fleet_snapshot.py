@@ -0,0 +1,231 @@
+import logging
+import threading
+import time
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Iterable, Mapping, NamedTuple, Optional, Tuple
+
+from app.core.config import CIRCUIT_BREAKER_RESET_TIMEOUT, SNAPSHOT_REFRESH_INTERVAL
+from app.services.availability_service import AvailabilitySnapshot, availability_store
+from app.services.cache_service import last_known_fleet
+from app.services.change_log import change_log, fleet_states
+from app.services.location_index import LocationIndex
+from app.services.nsw_transport_api import get_carpark_locations
+
+logger = logging.getLogger(__name__)
+
+
+class FleetSnapshot(NamedTuple):
+    """
+    Everything derived from one refresh of the fleet, published at once: a reader holding
+    a snapshot never sees the locations of one refresh with the no-update set of another.
+    Nothing in it is modified after it is published.
+    """
+
+    # The facility names per facility ID
+    carpark_ids: Mapping[str, str]
+    # The facilities which stopped updating their occupancy
+    no_update: FrozenSet[str]
+    # The located carparks (of get_carpark_locations) and their spatial index
+    carparks: Tuple[Dict, ...]
+    index: LocationIndex
+    # The last known availability per facility ID, and the availability store revision it was copied at
+    availability: AvailabilitySnapshot
+    availability_revision: int
+    # True if the locations are the last known ones, the NSW API being unavailable
+    stale: bool
+    # The change log version of the fleet state
+    version: int
+    built_at: float
+
+
+def build_fleet_snapshot(
+    locations: Dict, carpark_ids: Optional[Dict] = None, no_update: Optional[Iterable[str]] = None
+) -> FleetSnapshot:
+    """
+    Build a fleet snapshot from carpark locations (the result of get_carpark_locations),
+    with the carpark IDs and no-update set of the same sweep and the current availabilities.
+
+    Parameters:
+        locations (dict): The carpark locations
+        carpark_ids (dict, optional): The facility names per facility ID, defaults to the last known ones
+        no_update (set, optional): The no-update facility IDs, defaults to the last known ones
+
+    Returns:
+        FleetSnapshot: The snapshot (version 0 until published)
+    """
+    if carpark_ids is None:
+        snapshot = last_known_fleet.get("carpark_ids")
+        carpark_ids = snapshot.value if snapshot is not None else {}
+    if no_update is None:
+        snapshot = last_known_fleet.get("no_update_carparks")
+        no_update = snapshot.value if snapshot is not None else ()
+    carparks = locations.get("carparks", [])
+    if not isinstance(carparks, list):
+        logger.warning("Unexpected structure: carparks is not a list")
+        carparks = []
+    availability_revision = availability_store.revision
+    return FleetSnapshot(
+        carpark_ids=MappingProxyType(dict(carpark_ids)),
+        no_update=frozenset(no_update),
+        carparks=tuple(carparks),
+        index=LocationIndex(carparks),
+        availability=AvailabilitySnapshot(availability_store.copy()),
+        availability_revision=availability_revision,
+        stale=bool(locations.get("stale")),
+        version=0,
+        built_at=time.time(),
+    )
+
+
+class FleetSnapshotStore:
+    def __init__(self, refresh_interval: float = 3600.0, stale_retry_interval: float = 30.0):
+        """
+        Initialize the holder of the current fleet snapshot.
+
+        The snapshot is replaced by a single reference assignment, so the readers take no
+        lock: they read the current snapshot once and use it for the whole request. Only the
+        first request of a cold process waits for a snapshot to be built; afterwards the
+        snapshot is refreshed in the background when it is due, and the availabilities
+        are republished (sharing the rest of the snapshot) when they changed.
+
+        Parameters:
+            refresh_interval (float): The age in seconds after which the snapshot is refreshed
+            stale_retry_interval (float): The age in seconds after which a stale snapshot is refreshed
+        """
+        self.refresh_interval = refresh_interval
+        self.stale_retry_interval = stale_retry_interval
+        self._current: Optional[FleetSnapshot] = None
+        # Held by the writers only, while they swap the snapshot
+        self._lock = threading.Lock()
+        # Held while a snapshot is built (single-flight), and the number of snapshots built
+        self._building = threading.Lock()
+        self._builds = 0
+        # Held while a background refresh runs
+        self._refreshing = threading.Lock()
+
+    def current(self) -> Optional[FleetSnapshot]:
+        """
+        Get the current snapshot, without building or refreshing it.
+        """
+        return self._current
+
+    def clear(self) -> None:
+        with self._lock:
+            self._current = None
+
+    def publish(self, snapshot: FleetSnapshot) -> FleetSnapshot:
+        """
+        Publish a refreshed snapshot, versioned by the change log (once per refresh: the
+        availabilities and forgotten facilities republished meanwhile keep its version).
+
+        Returns:
+            FleetSnapshot: The published snapshot
+        """
+        with self._lock:
+            snapshot = snapshot._replace(version=change_log.publish(fleet_states(snapshot)))
+            self._current = snapshot
+            return snapshot
+
+    def forget_facility(self, facility_id: str) -> None:
+        """
+        Publish the current snapshot without a facility in its no-update set (e.g. wrongly flagged)
+        and with the current availabilities, the facility's being forgotten.
+        """
+        with self._lock:
+            snapshot = self._current
+            if snapshot is not None:
+                self._current = self._with_availability(snapshot)._replace(no_update=snapshot.no_update - {facility_id})
+
+    def refresh(self, renew: bool = False) -> Optional[FleetSnapshot]:
+        """
+        Build and publish a snapshot from the carpark locations (a sweep if their cache expired,
+        or the last known locations while the NSW API is unavailable).
+
+        Parameters:
+            renew (bool): Sweep the locations again even if they are cached, see get_carpark_locations
+                          (the background refresh of a due snapshot, built from the cached locations)
+
+        Returns:
+            FleetSnapshot: The published snapshot, or None if there are no locations
+        """
+        return self._build(self._builds, renew)
+
+    def _build(self, builds: int, renew: bool = False) -> Optional[FleetSnapshot]:
+        # A single snapshot is built at a time: a caller which waited for another build
+        # (e.g. a refresh while the first request of a cold process builds it) gets its snapshot.
+        # The readers and the availability republishing are not blocked meanwhile.
+        with self._building:
+            if self._builds != builds:
+                return self._current
+            locations = get_carpark_locations(renew=renew)
+            if not locations:
+                return None
+            snapshot = self.publish(build_fleet_snapshot(locations))
+            self._builds += 1
+            return snapshot
+
+    def get(self, now: float = None) -> Optional[FleetSnapshot]:
+        """
+        Get the current snapshot, building it if there is none yet.
+
+        Returns:
+            FleetSnapshot: The snapshot, or None if there are no locations
+        """
+        builds = self._builds
+        snapshot = self._current
+        if snapshot is None:
+            return self._build(builds)
+
+        if snapshot.availability_revision != availability_store.revision:
+            snapshot = self._republish_availability(snapshot)
+
+        now = time.time() if now is None else now
+        interval = self.stale_retry_interval if snapshot.stale else self.refresh_interval
+        if now - snapshot.built_at >= interval:
+            self._refresh_in_background()
+        return snapshot
+
+    def _republish_availability(self, snapshot: FleetSnapshot) -> FleetSnapshot:
+        # A reader never waits: if a writer is busy, the current snapshot is served
+        if not self._lock.acquire(blocking=False):
+            return snapshot
+        try:
+            current = self._current
+            if current is not snapshot:
+                return current
+            self._current = self._with_availability(snapshot)
+            return self._current
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _with_availability(snapshot: FleetSnapshot) -> FleetSnapshot:
+        # Only the availabilities changed since the snapshot's are copied (see AvailabilitySnapshot.updated)
+        revision, changes = availability_store.changes_since(snapshot.availability_revision)
+        if changes is None:
+            availability = AvailabilitySnapshot(availability_store.copy())
+        else:
+            availability = snapshot.availability.updated(changes)
+        return snapshot._replace(availability=availability, availability_revision=revision)
+
+    def _refresh_in_background(self) -> None:
+        if not self._refreshing.acquire(blocking=False):
+            return
+        threading.Thread(target=self._refresh_safely, name="fleet-snapshot", daemon=True).start()
+
+    def _refresh_safely(self) -> None:
+        try:
+            # Else the snapshot would be rebuilt from the cached locations it was built from
+            self.refresh(renew=True)
+        except Exception as e:
+            logger.error("Failed to refresh the fleet snapshot: {}".format(e))
+        finally:
+            self._refreshing.release()
+
+
+# Create a global fleet snapshot store instance
+fleet_snapshots = FleetSnapshotStore(
+    refresh_interval=SNAPSHOT_REFRESH_INTERVAL,
+    # A stale snapshot is retried once the circuit breaker lets a request through
+    stale_retry_interval=CIRCUIT_BREAKER_RESET_TIMEOUT,
+)
@@ -0,0 +1,266 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import geocoder as geocoder_lib
+import requests
+
+from app.core.config import (
+    GEOCODER_CACHE_PATH,
+    GEOCODER_CACHE_SIZE,
+    GEOCODER_PROVIDER,
+    GEOCODER_REGION,
+    GEOCODER_TIMEOUT,
+)
+from app.core.metrics import geocode_requests_total
+from app.core.timing import timed_phase
+
+logger = logging.getLogger(__name__)
+
+Coordinates = Tuple[float, float]
+
+
+class GeocodingError(Exception):
+    """
+    Raised when the geocoding provider fails (as opposed to not finding the address),
+    so that the failure is not cached.
+    """
+
+
+def normalize_address(address: str) -> str:
+    """
+    Normalize an address, so that spelling variants share a cache entry.
+
+    Example:
+        "  Central Station,  SYDNEY " -> "central station sydney"
+    """
+    return " ".join(re.findall(r"[a-z0-9]+", address.lower()))
+
+
+class Geocoder:
+    """
+    Base class of the geocoders: resolve a (normalized) address to coordinates.
+    """
+
+    def geocode(self, address: str) -> Optional[Coordinates]:
+        """
+        Parameters:
+            address (str): The normalized address
+
+        Returns:
+            Tuple[float, float]: The (latitude, longitude), or None if the address is not found
+
+        Raises:
+            GeocodingError: If the provider fails
+        """
+        raise NotImplementedError
+
+
+class ProviderGeocoder(Geocoder):
+    def __init__(self, provider: str = "osm", region: str = "", timeout: float = 5.0):
+        """
+        Initialize a geocoder backed by a provider of the geocoder library (e.g. "osm", "arcgis").
+
+        Parameters:
+            provider (str): The geocoder library provider
+            region (str): Appended to the queries to bias them (e.g. "NSW, Australia")
+            timeout (float): The timeout of a provider request in seconds
+        """
+        self.provider = provider
+        self.region = region
+        self.timeout = timeout
+
+    def geocode(self, address: str) -> Optional[Coordinates]:
+        query = "{}, {}".format(address, self.region) if self.region else address
+        try:
+            result = geocoder_lib.get(query, provider=self.provider, timeout=self.timeout)
+        except (requests.RequestException, ValueError) as e:
+            # Connection errors and timeouts, or an invalid (e.g. non-JSON) provider response
+            raise GeocodingError("{} geocoding of '{}' failed: {}".format(self.provider, address, e)) from e
+        if result.ok:
+            lat, lng = result.latlng
+            return float(lat), float(lng)
+        if result.error:
+            raise GeocodingError("{} geocoding of '{}' failed: {}".format(self.provider, address, result.error))
+        return None
+
+
+class StaticGeocoder(Geocoder):
+    def __init__(self, places: Dict[str, Coordinates] = None):
+        """
+        Initialize an offline geocoder resolving a fixed set of addresses (for tests and local development).
+
+        Parameters:
+            places (dict): The coordinates per address
+        """
+        self.places = {normalize_address(address): tuple(coords) for address, coords in (places or {}).items()}
+
+    def geocode(self, address: str) -> Optional[Coordinates]:
+        return self.places.get(address)
+
+
+def create_geocoder(provider: str = GEOCODER_PROVIDER) -> Geocoder:
+    """
+    Create the geocoder of a provider: "static" (offline, no address known) or a geocoder library provider.
+    """
+    if provider == "static":
+        return StaticGeocoder()
+    return ProviderGeocoder(provider, region=GEOCODER_REGION, timeout=GEOCODER_TIMEOUT)
+
+
+class CachedGeocoder:
+    def __init__(self, geocoder: Geocoder, maxsize: int = 10000, path: str = "", save_delay: float = 5.0):
+        """
+        Initialize an LRU cache of normalized address -> coordinates in front of a geocoder.
+        Addresses which are not found are cached too, provider failures are not.
+
+        The cache is persisted to a JSON file (rewritten save_delay seconds after a new
+        entry, so that a burst of provider requests is saved once), so that the station
+        and suburb lookups survive restarts and never leave the process again. The file
+        is replaced atomically by a uniquely named temporary file: the threads, and the
+        worker processes sharing the path, never write to the same file.
+
+        Parameters:
+            geocoder (Geocoder): The geocoder, replaceable (e.g. by a StaticGeocoder in tests)
+            maxsize (int): The maximum number of addresses
+            path (str): The JSON file to persist the cache to, empty to keep it in memory only
+            save_delay (float): The delay in seconds between a new entry and the save, 0 to save at once
+        """
+        self.geocoder = geocoder
+        self.maxsize = maxsize
+        self.path = path
+        self.save_delay = save_delay
+        self._entries: "OrderedDict[str, Optional[Coordinates]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Held while the file is written, one save at a time
+        self._save_lock = threading.Lock()
+        # The pending save, if any
+        self._save_timer: Optional[threading.Timer] = None
+        if path:
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def load(self) -> int:
+        """
+        Load the persisted cache, if any.
+
+        Returns:
+            int: The number of loaded addresses
+        """
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logger.error("Failed to load the geocoder cache {}: {}".format(self.path, e))
+            return 0
+        # The file lists the addresses from least to most recently used
+        items = list(entries.items())
+        first = max(len(items) - self.maxsize, 0)
+        with self._lock:
+            for address, coords in items[first:]:
+                self._entries[address] = tuple(coords) if coords else None
+        return len(self._entries)
+
+    def save(self) -> None:
+        """
+        Write the cache to its JSON file, through a unique temporary file in the same directory.
+        """
+        with self._save_lock:
+            with self._lock:
+                entries = dict(self._entries)
+            directory, name = os.path.split(os.path.abspath(self.path))
+            try:
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=name + ".", suffix=".tmp")
+            except OSError as e:
+                logger.error("Failed to save the geocoder cache {}: {}".format(self.path, e))
+                return
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.error("Failed to save the geocoder cache {}: {}".format(self.path, e))
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def _schedule_save(self) -> None:
+        if self.save_delay <= 0:
+            self.save()
+            return
+        with self._lock:
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(self.save_delay, self._run_scheduled_save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _run_scheduled_save(self) -> None:
+        with self._lock:
+            self._save_timer = None
+        self.save()
+
+    def flush(self) -> None:
+        """
+        Run the pending save now (e.g. on shutdown), if any.
+        """
+        with self._lock:
+            timer, self._save_timer = self._save_timer, None
+        if timer is not None:
+            timer.cancel()
+            self.save()
+
+    def geocode(self, address: str) -> Optional[Coordinates]:
+        """
+        Resolve an address to coordinates, from the cache or else the geocoder.
+
+        Parameters:
+            address (str): The address, e.g. "Central Station, Sydney"
+
+        Returns:
+            Tuple[float, float]: The (latitude, longitude), or None if the address is not found
+
+        Raises:
+            ValueError: If the address has no letter or digit (it normalizes to an empty string)
+            GeocodingError: If the geocoder fails
+        """
+        key = normalize_address(address)
+        if not key:
+            raise ValueError("The address has no letter or digit: {!r}".format(address))
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                geocode_requests_total.inc(result="hit")
+                return self._entries[key]
+        try:
+            with timed_phase("geocode"):
+                coords = self.geocoder.geocode(key)
+        except GeocodingError:
+            geocode_requests_total.inc(result="error")
+            raise
+        geocode_requests_total.inc(result="miss" if coords else "not_found")
+        with self._lock:
+            self._entries[key] = coords
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        if self.path:
+            self._schedule_save()
+        return coords
+
+
+# Create a global geocoding service instance
+geocoding_service = CachedGeocoder(create_geocoder(), maxsize=GEOCODER_CACHE_SIZE, path=GEOCODER_CACHE_PATH)
@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from app.services.fleet_snapshot import fleet_snapshots
+from app.services.nsw_transport_api import upstream_breaker
+from app.services.sweep_progress import sweep_progress
+
+logger = logging.getLogger(__name__)
+
+# The running (or last) warmup of the fleet snapshot
+_warmup_thread: Optional[threading.Thread] = None
+
+
+def snapshot_age(now: float = None) -> Optional[float]:
+    """
+    Get the age of the fleet snapshot (served by /nearby, /nearby/batch and /changes).
+
+    Returns:
+        float: The age in seconds, or None if the snapshot was never loaded
+    """
+    snapshot = fleet_snapshots.current()
+    if snapshot is None:
+        return None
+    return (now or time.time()) - snapshot.built_at
+
+
+def is_ready() -> bool:
+    """
+    Check if the fleet snapshot is loaded, so that requests are served without a cold sweep.
+    """
+    return fleet_snapshots.current() is not None
+
+
+def health_status(now: float = None) -> Dict:
+    """
+    Get the health of the service. Only in-process state is read (no upstream
+    request, no lock), so that it can be polled every second.
+
+    Returns:
+        dict: Whether the service is ready, the age of the fleet snapshot,
+              the state of the circuit breaker around the NSW API, whether the sweeps are paused
+              and their progress
+    """
+    return {
+        "ready": is_ready(),
+        "snapshot_age_seconds": snapshot_age(now),
+        "circuit_state": upstream_breaker.state,
+        "sweeps_paused": sweep_progress.paused,
+        "sweeps": sweep_progress.status(),
+    }
+
+
+def warm_up(retry_delay: float = 5.0, max_retry_delay: float = 300.0) -> None:
+    """
+    Build and publish the fleet snapshot, retrying with exponential backoff until one is loaded:
+    while the NSW API is unavailable at startup nothing is known yet, and a service which is not
+    ready gets no traffic which would build it.
+
+    Parameters:
+        retry_delay (float): The delay before the first retry in seconds, doubled on each retry
+        max_retry_delay (float): The maximum delay between two attempts in seconds
+    """
+    while True:
+        try:
+            if fleet_snapshots.refresh() is not None:
+                return
+        except Exception as e:
+            logger.error("Failed to warm up the fleet snapshot: {}".format(e))
+        # A request may have loaded it meanwhile
+        if is_ready():
+            return
+        logger.warning("No fleet snapshot loaded, retrying the warmup in {:.0f}s".format(retry_delay))
+        time.sleep(retry_delay)
+        retry_delay = min(retry_delay * 2, max_retry_delay)
+
+
+def start_warmup(
+    force: bool = False, retry_delay: float = 5.0, max_retry_delay: float = 300.0
+) -> Optional[threading.Thread]:
+    """
+    Load the fleet snapshot in the background (see warm_up), unless it is already loaded
+    (e.g. by the master of the preforking server) or a warmup is running.
+
+    Parameters:
+        force (bool): Warm up even if the snapshot is loaded (the expired or invalidated caches are rebuilt)
+        retry_delay (float): The delay before the first retry in seconds
+        max_retry_delay (float): The maximum delay between two attempts in seconds
+
+    Returns:
+        threading.Thread: The warmup thread, or None if no warmup was started
+    """
+    global _warmup_thread
+    if (is_ready() and not force) or warmup_running():
+        return None
+    logger.info("Warming up the fleet snapshot")
+    _warmup_thread = threading.Thread(
+        target=warm_up, args=(retry_delay, max_retry_delay), name="snapshot-warmup", daemon=True
+    )
+    _warmup_thread.start()
+    return _warmup_thread
+
+
+def warmup_running() -> bool:
+    return _warmup_thread is not None and _warmup_thread.is_alive()
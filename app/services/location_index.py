@@ -0,0 +1,216 @@
+import logging
+from bisect import bisect_left, bisect_right
+from heapq import heappush, heapreplace
+from math import asin, cos, inf, pi, radians, sin, sqrt
+from operator import itemgetter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.utils.distance import EARTH_RADIUS_KM
+
+logger = logging.getLogger(__name__)
+
+# Kilometers per degree of latitude: two points are at least this far apart per degree of latitude between them
+KM_PER_DEGREE = EARTH_RADIUS_KM * pi / 180
+
+# A nearby match: (distance in km, facility ID, name)
+Match = Tuple[float, str, str]
+
+# A nearby query: (latitude, longitude, radius in km)
+Origin = Tuple[float, float, float]
+
+# A filter of the carparks by facility ID (e.g. AvailabilityStore.matcher)
+Include = Optional[Callable[[str], bool]]
+
+
+def _max_lng_delta(lat_rad: float, radius_km: float) -> float:
+    """
+    The largest longitude difference (in radians) of the points within a radius of a latitude,
+    or pi if the radius reaches a pole.
+    """
+    if radius_km / EARTH_RADIUS_KM >= pi / 2:
+        return pi
+    sin_radius = sin(radius_km / EARTH_RADIUS_KM)
+    cos_lat = cos(lat_rad)
+    if sin_radius >= cos_lat:
+        return pi
+    return asin(sin_radius / cos_lat)
+
+
+class LocationIndex:
+    __slots__ = ("_lats", "_lat_rads", "_lng_rads", "_cos_lats", "_ids", "_names")
+
+    def __init__(self, carparks: List[Dict]):
+        """
+        Initialize a spatial index of the carpark locations: the carparks sorted by latitude,
+        with their coordinates in radians and the cosine of their latitude precomputed.
+
+        A query only computes the distance to the carparks in the latitude band of its
+        radius (found by bisection), and the haversine formula only has the origin
+        terms left to compute.
+
+        Parameters:
+            carparks (list): The carparks of get_carpark_locations(), the invalid ones are skipped
+        """
+        entries = []
+        for carpark in carparks:
+            try:
+                location = carpark.get("location") or {}
+                lat, lng = float(location.get("latitude")), float(location.get("longitude"))
+            except (TypeError, ValueError) as e:
+                logger.error("Error processing carpark {}: {}".format(carpark.get("facility_id"), e))
+                continue
+            entries.append((lat, lng, carpark.get("facility_id"), carpark.get("name", "Unknown")))
+        entries.sort(key=itemgetter(0))
+
+        self._lats = [lat for lat, _, _, _ in entries]
+        self._lat_rads = [radians(lat) for lat in self._lats]
+        self._lng_rads = [radians(lng) for _, lng, _, _ in entries]
+        self._cos_lats = [cos(lat) for lat in self._lat_rads]
+        self._ids = [facility_id for _, _, facility_id, _ in entries]
+        self._names = [name for _, _, _, name in entries]
+
+    def __len__(self) -> int:
+        return len(self._lats)
+
+    def _distance(self, i: int, lat_rad: float, lng_rad: float, cos_lat: float) -> float:
+        """
+        The haversine distance in km between the carpark i and an origin (in radians).
+        """
+        a = (
+            sin((self._lat_rads[i] - lat_rad) / 2) ** 2
+            + cos_lat * self._cos_lats[i] * sin((self._lng_rads[i] - lng_rad) / 2) ** 2
+        )
+        return 2 * EARTH_RADIUS_KM * asin(sqrt(min(a, 1.0)))
+
+    def within(self, lat: float, lng: float, radius_km: float, include: Include = None) -> List[Match]:
+        """
+        Find the carparks within a radius of a location.
+
+        Parameters:
+            lat (float): Latitude of the search point
+            lng (float): Longitude of the search point
+            radius_km (float): Search radius in kilometers
+            include (Callable, optional): Only the carparks whose facility ID it accepts are matched
+
+        Returns:
+            List[Match]: The (distance, facility ID, name) of the carparks within the radius, nearest first
+        """
+        return self.within_many([(lat, lng, radius_km)], include)[0]
+
+    def within_many(self, origins: Sequence[Origin], include: Include = None) -> List[List[Match]]:
+        """
+        Find the carparks within the radius of each origin, in one pass over the index:
+        the carparks are swept by latitude, and each is only compared with the origins
+        whose latitude band it is in (e.g. the neighbouring stations of a train line).
+
+        Parameters:
+            origins (list): The (latitude, longitude, radius in km) of the searches
+            include (Callable, optional): Only the carparks whose facility ID it accepts are matched
+
+        Returns:
+            List[List[Match]]: The matches of each origin (see within), in the order of the origins
+        """
+        results: List[List[Match]] = [[] for _ in origins]
+        if not origins or not self._lats:
+            return results
+
+        # The latitude band of each origin, by lower bound
+        bands = sorted(
+            (lat - radius_km / KM_PER_DEGREE, lat + radius_km / KM_PER_DEGREE, i, radians(lat), radians(lng), radius_km)
+            for i, (lat, lng, radius_km) in enumerate(origins)
+        )
+        start = bisect_left(self._lats, bands[0][0])
+        stop = bisect_right(self._lats, max(band[1] for band in bands))
+
+        active = []
+        next_band = 0
+        for j in range(start, stop):
+            carpark_lat = self._lats[j]
+            while next_band < len(bands) and bands[next_band][0] <= carpark_lat:
+                lower, upper, i, lat_rad, lng_rad, radius_km = bands[next_band]
+                active.append(
+                    (upper, results[i], lat_rad, lng_rad, cos(lat_rad), radius_km, _max_lng_delta(lat_rad, radius_km))
+                )
+                next_band += 1
+            if active and min(band[0] for band in active) < carpark_lat:
+                active = [band for band in active if band[0] >= carpark_lat]
+            if include is not None and not include(self._ids[j]):
+                continue
+            carpark_lng = self._lng_rads[j]
+            for _, matches, lat_rad, lng_rad, cos_lat, radius_km, max_lng_delta in active:
+                # The longitude test skips the trigonometry for most of the carparks of the band
+                lng_delta = abs(carpark_lng - lng_rad)
+                if lng_delta > max_lng_delta and 2 * pi - lng_delta > max_lng_delta:
+                    continue
+                distance = self._distance(j, lat_rad, lng_rad, cos_lat)
+                if distance <= radius_km:
+                    matches.append((distance, self._ids[j], self._names[j]))
+
+        for matches in results:
+            matches.sort(key=itemgetter(0))
+        return results
+
+    def nearest(
+        self, lat: float, lng: float, k: int, radius_km: Optional[float] = None, include: Include = None
+    ) -> List[Match]:
+        """
+        Find the k nearest carparks of a location, with a best-first search: the index is
+        walked outward from the latitude of the location, always on the side of the nearest
+        latitude, until the latitude gap alone is farther than the k-th nearest carpark found.
+        The longitude span of that distance skips the trigonometry for the others.
+
+        Parameters:
+            lat (float): Latitude of the search point
+            lng (float): Longitude of the search point
+            k (int): The number of carparks
+            radius_km (float): The maximum distance in kilometers, None for no limit
+            include (Callable, optional): Only the carparks whose facility ID it accepts are matched
+
+        Returns:
+            List[Match]: The (distance, facility ID, name) of the k nearest carparks, nearest first
+        """
+        if k <= 0 or not self._lats:
+            return []
+        lat_rad, lng_rad = radians(lat), radians(lng)
+        cos_lat = cos(lat_rad)
+        limit = inf if radius_km is None else radius_km
+        bound = limit
+        max_lng_delta = _max_lng_delta(lat_rad, bound)
+
+        # The k nearest carparks found, farthest first: (-distance, position)
+        heap: List[Tuple[float, int]] = []
+        north = bisect_left(self._lats, lat)
+        south = north - 1
+        while True:
+            south_gap = (lat - self._lats[south]) * KM_PER_DEGREE if south >= 0 else inf
+            north_gap = (self._lats[north] - lat) * KM_PER_DEGREE if north < len(self._lats) else inf
+            if south_gap <= north_gap:
+                gap, j = south_gap, south
+                south -= 1
+            else:
+                gap, j = north_gap, north
+                north += 1
+            if gap == inf or gap > bound:
+                break
+
+            lng_delta = abs(self._lng_rads[j] - lng_rad)
+            if lng_delta > max_lng_delta and 2 * pi - lng_delta > max_lng_delta:
+                continue
+            if include is not None and not include(self._ids[j]):
+                continue
+            distance = self._distance(j, lat_rad, lng_rad, cos_lat)
+            if len(heap) < k:
+                if distance > limit:
+                    continue
+                heappush(heap, (-distance, j))
+            elif distance < -heap[0][0]:
+                heapreplace(heap, (-distance, j))
+            else:
+                continue
+            if len(heap) == k:
+                bound = -heap[0][0]
+                max_lng_delta = _max_lng_delta(lat_rad, bound)
+
+        matches = [(-distance, self._ids[j], self._names[j]) for distance, j in heap]
+        matches.sort(key=itemgetter(0))
+        return matches
@@ -1,139 +1,280 @@
 import logging
+import threading
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Dict, Optional, Set
 
 import requests
 from cachetools import cached
+from cachetools.keys import hashkey
 
 from app.core.config import (
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    CIRCUIT_BREAKER_RESET_TIMEOUT,
+    INTERACTIVE_RESERVED_REQUESTS_PER_SECOND,
+    LOCATION_MAX_AGE_HOURS,
     MAX_REQUESTS_PER_SECOND,
     NSW_TRANSPORT_BASE_API_URL,
+    RETRY_BASE_DELAY,
+    RETRY_DEADLINE,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_MAX_DELAY,
     get_facility_url,
     get_nsw_headers,
 )
+from app.core.master_channel import master_channel
+from app.core.metrics import (
+    stale_responses_total,
+    staleness_checks_total,
+    upstream_request_duration_seconds,
+    upstream_retries_total,
+    upstream_short_circuited_total,
+)
+from app.core.timing import timed_phase
+from app.services.availability_service import availability_store, available_status  # noqa: F401
 from app.services.cache_service import (
     carpark_ids_cache,
     carpark_locations_cache,
+    last_known_details,
+    last_known_fleet,
     no_update_carparks_cache,
 )
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.occupancy_forecast import occupancy_forecaster
+from app.services.occupancy_history import occupancy_history
+from app.services.retry_policy import RetryPolicy, parse_retry_after
+from app.services.staleness_tracker import StalenessTracker, staleness_tracker
+from app.services.sweep_progress import sweep_progress
+from app.services.upstream_throttle import BACKGROUND, PriorityThrottle, upstream_priority
+from app.services.zone_service import zone_cache
 from app.utils.time_utils import get_local_time, parse_message_date
 
 logger = logging.getLogger(__name__)
 
-# Global variables for rate limiting
-request_count = 0
-last_request_time = time.time()
+# Throttle of the requests to the NSW Transport API (5 requests per second),
+# shared by the interactive lookups and the background sweeps
+upstream_throttle = PriorityThrottle(
+    MAX_REQUESTS_PER_SECOND, interactive_reserved=INTERACTIVE_RESERVED_REQUESTS_PER_SECOND
+)
+
+# Default retry policy of the requests to the NSW Transport API
+DEFAULT_RETRY_POLICY = RetryPolicy(
+    max_attempts=RETRY_MAX_ATTEMPTS,
+    base_delay=RETRY_BASE_DELAY,
+    max_delay=RETRY_MAX_DELAY,
+    deadline=RETRY_DEADLINE,
+)
+
+# Circuit breaker around the NSW Transport API, shared by all requests
+upstream_breaker = CircuitBreaker(
+    "nsw_upstream",
+    failure_threshold=CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=CIRCUIT_BREAKER_RESET_TIMEOUT,
+)
 
 
-def reset_request_counter():
+class UpstreamUnavailableError(Exception):
     """
-    The NSW Transport API has a throttle limit of 5 requests per second.
-    Reset the request counter if we're in a new second
+    Raised when fresh data cannot be fetched from the NSW Transport API.
+    Raising (instead of returning None) keeps the failure out of the TTL caches.
     """
 
-    # Access global variables for request tracking
-    global request_count, last_request_time
 
-    # Get current Unix timestamp
-    current_time = time.time()
+def _timed_get(url, headers) -> requests.Response:
+    """
+    Send a GET request to the NSW Transport API and record its latency
 
-    # Check if we've moved into a new second by comparing integer timestamps
-    # This resets the counter at the start of each new second
-    if int(current_time) > int(last_request_time):
-        # Reset request counter
-        request_count = 0
-        # Update last request time
-        last_request_time = current_time
+    Parameters:
+        url (str): The URL to make the request to
+        headers (dict): Headers to include in the request
+
+    Returns:
+        requests.Response: The response object
+    """
+    start = time.perf_counter()
+    status = "error"
+    try:
+        with timed_phase("upstream"):
+            response = requests.get(url, headers=headers, timeout=10)
+        status = response.status_code
+        return response
+    finally:
+        upstream_request_duration_seconds.observe(time.perf_counter() - start, status=status)
 
 
-def wait_for_next_second():
+def _is_upstream_failure(error: requests.exceptions.RequestException) -> bool:
     """
-    Wait until the start of the next second
+    Check if a failed request counts against the circuit breaker.
+    Client errors (e.g. 404 for an unknown facility) show that the NSW API is up,
+    while network errors, timeouts, throttling and 5xx errors show that it is degraded.
     """
-
-    current_time = time.time()
-    wait_time = 1.0 - (current_time - int(current_time))
-    if wait_time > 0:
-        time.sleep(wait_time)
+    response = getattr(error, "response", None)
+    if response is None:
+        return True
+    return response.status_code >= 500 or response.status_code in (403, 429)
 
 
-def make_api_request(url, headers) -> dict | None:
+def make_api_request(url, headers, retry_policy: RetryPolicy = None) -> dict | None:
     """
     Make an API request with the throttle limiting
     (Because the NSW API has a throttle limit of 5 requests per second)
+    The request is sent in the priority lane of the current context (see upstream_priority).
+    Fails fast without a request while the circuit breaker is open.
+    Retryable failures (network errors, 429/403, 5xx) are retried with exponential
+    backoff and full jitter, honouring the Retry-After header, within the policy deadline.
 
     Parameters:
         url (str): The URL to make the request to
         headers (dict): Headers to include in the request
+        retry_policy (RetryPolicy, optional): The retry policy, defaults to DEFAULT_RETRY_POLICY
 
     Returns:
         requests.Response: The response object if successful
         None: If the request fails
     """
 
-    global request_count
+    retry_policy = retry_policy or DEFAULT_RETRY_POLICY
+    deadline = time.monotonic() + retry_policy.deadline
 
-    # Reset the request_count as 0 if we're in a new second
-    reset_request_counter()
+    # Fail fast while the NSW API is known to be degraded
+    if not upstream_breaker.allow_request():
+        upstream_short_circuited_total.inc()
+        logger.warning("Circuit breaker is open, skipping request to {}".format(url))
+        return None
 
-    # If we've hit the throttle limit (5 requests per second)
-    # wait for next second and reset request_count
-    if request_count >= MAX_REQUESTS_PER_SECOND:
-        # wait the left time in one second
-        wait_for_next_second()
-        # reset request_count as 0
-        reset_request_counter()
+    for attempt in range(retry_policy.max_attempts):
+        # Wait for a slot of the throttle limit (5 requests per second),
+        # interactive lookups are served before the background sweeps
+        upstream_throttle.acquire()
 
-    try:
-        # Make the API request and increase request_count
-        response = requests.get(url, headers=headers, timeout=10)
-        request_count += 1
-
-        # Handle throttle limit exceeded (HTTP 429) by waiting and retrying
-        if response.status_code == 429 or response.status_code == 403:
-            wait_for_next_second()
-            reset_request_counter()
-            response = requests.get(url, headers=headers, timeout=10)
-            request_count += 1
-
-        # do not return the response if the request fails
-        response.raise_for_status()
+        response = None
+        try:
+            # Make the API request
+            response = _timed_get(url, headers)
+
+            # Handle throttle limit exceeded (HTTP 429, or 403 from NSW) as a retryable error
+            if response.status_code == 429 or response.status_code == 403:
+                raise requests.exceptions.HTTPError(
+                    "Throttled by the NSW API (HTTP {})".format(response.status_code), response=response
+                )
+
+            # do not return the response if the request fails
+            response.raise_for_status()
+
+            data = response.json()
+            upstream_breaker.record_success()
+            return data
+
+        except requests.exceptions.RequestException as e:
+            # 404 error, cannot find the resources
+            logger.error(f"API request failed: {e}")
+            error = e
+
+        # Stop on non-retryable errors, on the last attempt, or if the circuit opened meanwhile
+        if not retry_policy.is_retryable(error) or attempt == retry_policy.max_attempts - 1 or upstream_breaker.is_open:
+            break
+
+        retry_after = parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+        delay = retry_policy.backoff(attempt, retry_after)
+        if time.monotonic() + delay > deadline:
+            logger.warning("Retry deadline exceeded for {}".format(url))
+            break
+
+        status = response.status_code if response is not None else "error"
+        upstream_retries_total.inc(status=status)
+        logger.info("Retry {}/{} for {} in {:.2f}s".format(attempt + 1, retry_policy.max_attempts - 1, url, delay))
+        with timed_phase("backoff"):
+            time.sleep(delay)
+
+    if _is_upstream_failure(error):
+        upstream_breaker.record_failure()
+    else:
+        upstream_breaker.record_success()
+    return None
 
-        return response.json()
 
-    except requests.exceptions.RequestException as e:
-        # 404 error, cannot find the resources
-        logger.error(f"API request failed: {e}")
+# The sweeps are single-flight: the callers arriving while one runs (requests, warmup, snapshot refresh,
+# poller) wait for its result instead of sweeping again, and the cache is only accessed under the condition lock
+@cached(carpark_ids_cache, condition=threading.Condition())
+def _fetch_all_carpark_ids() -> Dict:
+    """
+    Query all carparks information from the NSW Transport API, using in-memory cache.
 
-        return None
+    Raises:
+        UpstreamUnavailableError: If the request fails
+    """
+    carpark_ids = make_api_request(url=NSW_TRANSPORT_BASE_API_URL, headers=get_nsw_headers())
+    if not carpark_ids:
+        raise UpstreamUnavailableError("Failed to fetch the carpark IDs")
+    return carpark_ids
 
 
-@cached(carpark_ids_cache)
 def get_all_carpark_ids() -> Optional[Dict]:
     """
     Query all carparks information from the NSW Transport API.
+    Falls back to the last known result if the request fails.
 
     Returns:
         dict: Dictionary mapping facility IDs to facility names,
-              or None if request fails
+              or None if request fails and there is no last known result
         API response example:
             {
                 "facility_id": "facility_name"
                 ...
             }
     """
-    return make_api_request(url=NSW_TRANSPORT_BASE_API_URL, headers=get_nsw_headers())
+    try:
+        carpark_ids = _fetch_all_carpark_ids()
+    except UpstreamUnavailableError:
+        return _last_known_fleet("carpark_ids")
+    last_known_fleet.put("carpark_ids", carpark_ids)
+    return carpark_ids
+
+
+def _last_known_fleet(key: str):
+    """
+    Get the last known fleet-wide result, to serve while the NSW API is unavailable.
 
+    Parameters:
+        key (str): The result name, e.g. "carpark_locations"
 
-def get_carpark_details(facility_id: str, retry_count: int = 3) -> Optional[Dict]:
+    Returns:
+        The last known value, or None if there is none
+    """
+    snapshot = last_known_fleet.get(key)
+    if snapshot is None:
+        return None
+    stale_responses_total.inc(data=key)
+    logger.warning("Serving stale {} from {:.0f} seconds ago".format(key, time.time() - snapshot.fetched_at))
+    return snapshot.value
+
+
+def get_last_known_details(facility_id: str) -> Optional[Dict]:
+    """
+    Get the last details successfully fetched for a facility.
+
+    Parameters:
+        facility_id (str): The ID of the carpark facility
+
+    Returns:
+        dict: The last known details, or None if the facility was never fetched
+    """
+    snapshot = last_known_details.get(str(facility_id))
+    if snapshot is None:
+        return None
+    stale_responses_total.inc(data="carpark_details")
+    return snapshot.value
+
+
+def get_carpark_details(facility_id: str, retry_count: int = None) -> Optional[Dict]:
     """
     Get carpark details for a given facility ID with retry logic
+    (retries follow DEFAULT_RETRY_POLICY: backoff with jitter, 404s are not retried)
 
     Parameters:
         facility_id (str): The ID of the carpark facility to query
-        retry_count (int, optional): Number of retry attempts if request fails.
-                                   Defaults to 3.
+        retry_count (int, optional): Number of attempts if request fails.
+                                   Defaults to RETRY_MAX_ATTEMPTS (3).
 
     Returns:
         dict: JSON response containing carpark details if successful,
@@ -179,16 +320,45 @@ def get_carpark_details(facility_id: str, retry_count: int = 3) -> Optional[Dict
         }
     """
 
-    for attempt in range(retry_count):
-        if attempt > 0:
-            logger.info("Retry {}/{} for facility {}".format(attempt, retry_count - 1, facility_id))
-        response = make_api_request(url=get_facility_url(facility_id), headers=get_nsw_headers())
-        if response:
-            logger.info("API request successful for facility {}".format(facility_id))
-            return response
+    retry_policy = DEFAULT_RETRY_POLICY
+    if retry_count is not None:
+        retry_policy = retry_policy.with_max_attempts(retry_count)
+
+    response = make_api_request(url=get_facility_url(facility_id), headers=get_nsw_headers(), retry_policy=retry_policy)
+    if response:
+        logger.info("API request successful for facility {}".format(facility_id))
+        last_known_details.put(str(facility_id), response)
+        availability_store.update(facility_id, response)
+        # Parse the zones once per refresh, not on every request serving these details
+        zone_cache.get(facility_id, response)
+        record_reading(facility_id, response)
+        return response
     return None
 
 
+def record_reading(facility_id: str, details: Dict) -> None:
+    """
+    Record the occupancy of fetched details in the occupancy history and the forecast profiles.
+    Under the preforking server the master keeps them for all the workers (which are forked with
+    them, and so all serve the same history): a worker sends its readings to the master.
+
+    Parameters:
+        facility_id (str): The facility ID
+        details (dict): The carpark details
+    """
+    if master_channel.connected:
+        reading = {
+            "spots": details.get("spots"),
+            "occupancy": {"total": (details.get("occupancy") or {}).get("total")},
+            "MessageDate": details.get("MessageDate"),
+        }
+        master_channel.send("reading", facility_id=str(facility_id), details=reading)
+        return
+    if occupancy_history.record(facility_id, details):
+        buffer = occupancy_history.get(facility_id)
+        occupancy_forecaster.update(facility_id, buffer.last_timestamp, buffer.last_occupancy, buffer.spots)
+
+
 def is_carpark_no_update(details: Dict, current_time: datetime, no_update_hours: int = 24) -> bool:
     """
     Determine if a carpark is considered no update.
@@ -216,121 +386,197 @@ def is_carpark_no_update(details: Dict, current_time: datetime, no_update_hours:
     return age_hours > no_update_hours
 
 
-def fetch_no_update_carparks(carpark_ids: Dict, current_time: datetime) -> Set[str]:
+def fetch_no_update_carparks(
+    carpark_ids: Dict, current_time: datetime, tracker: StalenessTracker = staleness_tracker
+) -> Set[str]:
     """
-    Check all carparks and return the ones that have no update.
+    Check the carparks and return the ones that have no update.
+
+    Only the carparks whose status might have changed since their last check are
+    fetched again: a carpark updated recently cannot become no-update before its
+    MessageDate + 24 hours, so the staleness tracker skips it until then.
 
     Parameters:
         carpark_ids (dict): Dictionary mapping facility IDs to facility names
         current_time (datetime): The current time
+        tracker (StalenessTracker): The per-facility staleness records
 
     Returns:
         Set[str]: Set of facility IDs that are considered no-update
     """
     no_update_set = set()
-    for facility_id, _ in carpark_ids.items():
-        logger.debug("Checking facility {}...".format(facility_id))
-        details = get_carpark_details(facility_id)
-        if not details or is_carpark_no_update(details, current_time):
-            no_update_set.add(str(facility_id))
-            logger.info("Facility {} is no-update".format(facility_id))
+    with sweep_progress.track("no_update_carparks", len(carpark_ids)) as sweep:
+        for facility_id, _ in carpark_ids.items():
+            sweep.advance()
+            if tracker.is_due(facility_id, current_time):
+                logger.debug("Checking facility {}...".format(facility_id))
+                details = get_carpark_details(facility_id) or get_last_known_details(facility_id)
+                no_update = not details or is_carpark_no_update(details, current_time)
+                message_date = details.get("MessageDate") if details else None
+                record = tracker.update(
+                    facility_id,
+                    parse_message_date(message_date) if message_date else None,
+                    no_update,
+                    current_time,
+                )
+                staleness_checks_total.inc(result="checked")
+            else:
+                record = tracker.get(facility_id)
+                staleness_checks_total.inc(result="skipped")
+            if record.no_update:
+                no_update_set.add(str(facility_id))
+                logger.info("Facility {} is no-update".format(facility_id))
     return no_update_set
 
 
-@cached(no_update_carparks_cache)
-def get_no_update_carparks() -> Set[str]:
+@cached(no_update_carparks_cache, condition=threading.Condition())
+def _build_no_update_carparks() -> Set[str]:
     """
     Get carparks that haven't updated within hours, using in-memory cache.
 
-    Returns:
-        Set[str]: Set of facility IDs that are considered no-update
+    Raises:
+        UpstreamUnavailableError: If the NSW API is unavailable, or the sweeps are paused
     """
+    if sweep_progress.paused:
+        raise UpstreamUnavailableError("The sweeps are paused")
     carpark_ids = get_all_carpark_ids()
     if not carpark_ids:
-        return set()
-    return fetch_no_update_carparks(carpark_ids, get_local_time())
+        raise UpstreamUnavailableError("No carpark IDs to check")
+    no_update_set = fetch_no_update_carparks(carpark_ids, get_local_time())
+    # Do not cache a sweep during which the NSW API became unavailable
+    if upstream_breaker.is_open:
+        raise UpstreamUnavailableError("The NSW API became unavailable during the no-update sweep")
+    return no_update_set
 
 
-@cached(carpark_locations_cache)
-def get_carpark_locations() -> Optional[Dict]:
+def get_no_update_carparks() -> Set[str]:
     """
-    Get all carparks information from the NSW Transport API.
+    Get carparks that haven't updated within hours, using in-memory cache.
+    Falls back to the last known result while the NSW API is unavailable.
 
     Returns:
-        dict: Dictionary containing list of carparks with their details
-        API response example:
-            {
-                "carparks": [
-                    {
-                        "facility_id": str,
-                        "name": str,
-                        "location": {
-                            "latitude": float,
-                            "longitude": float
-                        }
-                    }
-                ]
-            }
+        Set[str]: Set of facility IDs that are considered no-update
+    """
+    try:
+        # A sweep is background work, it must not hold back the interactive lookups
+        with upstream_priority(BACKGROUND):
+            no_update_set = _build_no_update_carparks()
+    except UpstreamUnavailableError:
+        last_known = _last_known_fleet("no_update_carparks")
+        return last_known if last_known is not None else set()
+    last_known_fleet.put("no_update_carparks", no_update_set)
+    return no_update_set
+
+
+def _locate_details(facility_id: str, current_time: datetime) -> Optional[Dict]:
+    """
+    Get the details of a facility to locate it: locations rarely change, so the last known details
+    of a facility fetched within LOCATION_MAX_AGE_HOURS (e.g. by the no-update sweep which just ran)
+    are used without a request.
+    """
+    if staleness_tracker.seen_within(facility_id, current_time, timedelta(hours=LOCATION_MAX_AGE_HOURS)):
+        snapshot = last_known_details.get(str(facility_id))
+        if snapshot is not None:
+            staleness_checks_total.inc(result="located")
+            return snapshot.value
+    return get_carpark_details(facility_id) or get_last_known_details(facility_id)
+
+
+@cached(carpark_locations_cache, condition=threading.Condition())
+def _build_carpark_locations() -> Dict:
     """
+    Get all carparks information from the NSW Transport API, using in-memory cache.
+    Only the facilities not fetched recently are requested (see _locate_details).
+
+    Raises:
+        UpstreamUnavailableError: If the NSW API is unavailable, or the sweeps are paused
+    """
+    if sweep_progress.paused:
+        raise UpstreamUnavailableError("The sweeps are paused")
 
     # Get mapping of facility IDs to names
     carpark_ids = get_all_carpark_ids()
     if not carpark_ids:
-        return None
+        raise UpstreamUnavailableError("No carpark IDs to locate")
 
     # Get no-update carparks once
     no_update_carparks = get_no_update_carparks()
     carparks_list = []
+    current_time = get_local_time()
+
+    with sweep_progress.track("carpark_locations", len(carpark_ids)) as sweep:
+        for facility_id, name in carpark_ids.items():
+            sweep.advance()
+            # Skip if carpark is known to be no-update
+            if facility_id in no_update_carparks:
+                continue
+
+            details = _locate_details(facility_id, current_time)
+            if not details:
+                continue
+
+            location = details.get("location", {})
+            if not location:
+                continue
+
+            try:
+                carpark = {
+                    "facility_id": facility_id,
+                    "name": name,
+                    "location": {
+                        "latitude": float(location.get("latitude")),
+                        "longitude": float(location.get("longitude")),
+                    },
+                }
+                carparks_list.append(carpark)
+            except (TypeError, ValueError) as e:
+                logger.error("Error processing carpark {}: {}".format(facility_id, e))
+                continue
 
-    for facility_id, name in carpark_ids.items():
-        # Skip if carpark is known to be no-update
-        if facility_id in no_update_carparks:
-            continue
-
-        details = get_carpark_details(facility_id)
-        if not details:
-            continue
-
-        location = details.get("location", {})
-        if not location:
-            continue
-
-        try:
-            carpark = {
-                "facility_id": facility_id,
-                "name": name,
-                "location": {
-                    "latitude": float(location.get("latitude")),
-                    "longitude": float(location.get("longitude")),
-                },
-            }
-            carparks_list.append(carpark)
-        except (TypeError, ValueError) as e:
-            logger.error("Error processing carpark {}: {}".format(facility_id, e))
-            continue
+    # Do not cache a sweep during which the NSW API became unavailable
+    if upstream_breaker.is_open:
+        raise UpstreamUnavailableError("The NSW API became unavailable during the locations sweep")
 
     return {"carparks": carparks_list}
 
 
-def available_status(spots: int, occupancy: int) -> str:
+def get_carpark_locations(renew: bool = False) -> Optional[Dict]:
     """
-    Get the available status of a carpark
+    Get all carparks information from the NSW Transport API.
+    While the NSW API is unavailable, the last known locations are returned
+    with "stale": True.
 
     Parameters:
-        spots (int): The total number of spots
-        occupancy (int): The number of occupied spots
+        renew (bool): Sweep again even if the cached locations did not expire, and cache the new ones
+                      (e.g. to refresh the fleet snapshot built from them), unless the sweeps are paused
 
     Returns:
-        str: The available status of the carpark
+        dict: Dictionary containing list of carparks with their details
         API response example:
-            "Full"
-            "Almost Full"
-            "Available"
-    """
-    available_spots = spots - occupancy
-    if available_spots <= 0:
-        return "Full"
-    elif available_spots <= spots * 0.1:
-        return "Almost Full"
-    else:
-        return "Available"
+            {
+                "carparks": [
+                    {
+                        "facility_id": str,
+                        "name": str,
+                        "location": {
+                            "latitude": float,
+                            "longitude": float
+                        }
+                    }
+                ]
+            }
+    """
+
+    try:
+        # A sweep is background work, it must not hold back the interactive lookups
+        with upstream_priority(BACKGROUND):
+            if renew and not sweep_progress.paused:
+                locations = _build_carpark_locations.__wrapped__()
+                carpark_locations_cache[hashkey()] = locations
+            else:
+                locations = _build_carpark_locations()
+    except UpstreamUnavailableError:
+        last_known = _last_known_fleet("carpark_locations")
+        return {**last_known, "stale": True} if last_known is not None else None
+    last_known_fleet.put("carpark_locations", locations)
+    return locations
@@ -0,0 +1,177 @@
+import math
+import threading
+from array import array
+from datetime import datetime
+from typing import Dict, Optional
+
+from app.services.occupancy_history import OccupancyHistory
+from app.utils.time_utils import SYDNEY_TZ
+
+# Weekly profile resolution: 7 days of 96 slots of 15 minutes
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+SLOTS_PER_WEEK = 7 * SLOTS_PER_DAY
+WEEK_SECONDS = 7 * 24 * 3600
+
+
+def week_slot(timestamp: float) -> int:
+    """
+    Get the slot of the week (Sydney time) of a timestamp.
+
+    Parameters:
+        timestamp (float): The epoch time
+
+    Returns:
+        int: The slot index, from 0 (Monday 00:00) to SLOTS_PER_WEEK - 1 (Sunday 23:45)
+    """
+    local_time = datetime.fromtimestamp(timestamp, SYDNEY_TZ)
+    return local_time.weekday() * SLOTS_PER_DAY + (local_time.hour * 60 + local_time.minute) // SLOT_MINUTES
+
+
+class OccupancyProfile:
+    def __init__(self, max_weight: int = 8, trend_time_constant: float = 3600.0):
+        """
+        Initialize the weekly occupancy profile of a facility.
+
+        Each 15 minutes slot of the week keeps the mean occupancy of each week: the readings
+        of a slot in the same week are averaged together, and each week then counts once in
+        the running mean of the slot (weighting the last max_weight weeks, so that the profile
+        follows seasonal changes), whatever the polling rate. The residual of the last reading
+        against its slot mean gives the recent trend, which fades out with trend_time_constant.
+
+        Parameters:
+            max_weight (int): The maximum weight, in weeks, of the past weeks of a slot
+            trend_time_constant (float): The time constant of the trend decay in seconds
+        """
+        self.max_weight = max_weight
+        self.trend_time_constant = trend_time_constant
+        # The running mean of the past weeks of each slot, and the number of weeks in it
+        self.means = array("d", bytes(8 * SLOTS_PER_WEEK))
+        self.weeks = array("i", bytes(4 * SLOTS_PER_WEEK))
+        # The mean of the readings of each slot in its current week, and the week (since the epoch)
+        self.week_means = array("d", bytes(8 * SLOTS_PER_WEEK))
+        self.week_counts = array("i", bytes(4 * SLOTS_PER_WEEK))
+        self.week_numbers = array("q", bytes(8 * SLOTS_PER_WEEK))
+        # The number of readings of each slot
+        self.counts = array("i", bytes(4 * SLOTS_PER_WEEK))
+        self.spots = 0
+        self.last_timestamp = 0.0
+        self.last_occupancy = 0
+        self.residual = 0.0
+
+    def slot_mean(self, slot: int) -> float:
+        """
+        Get the mean occupancy of a slot: the past weeks, with the current week counted once.
+        """
+        weeks = self.weeks[slot]
+        if not self.week_counts[slot]:
+            return self.means[slot]
+        if not weeks:
+            return self.week_means[slot]
+        return self.means[slot] + (self.week_means[slot] - self.means[slot]) / min(weeks + 1, self.max_weight)
+
+    def update(self, timestamp: float, occupancy: int, spots: int) -> None:
+        """
+        Add a reading to the profile.
+
+        Parameters:
+            timestamp (float): The epoch time of the reading
+            occupancy (int): The occupancy
+            spots (int): The total number of spots
+        """
+        slot = week_slot(timestamp)
+        # The residual is computed against the mean before the reading
+        self.residual = occupancy - self.slot_mean(slot) if self.counts[slot] else 0.0
+
+        # A slot never spans two epoch weeks, which start on a whole hour of Sydney time
+        week_number = int(timestamp // WEEK_SECONDS)
+        if self.week_counts[slot] and week_number != self.week_numbers[slot]:
+            # A new week of the slot: its previous week counts once in the running mean
+            self.means[slot] = self.slot_mean(slot)
+            self.weeks[slot] += 1
+            self.week_counts[slot] = 0
+        if not self.week_counts[slot]:
+            self.week_numbers[slot] = week_number
+            self.week_means[slot] = 0.0
+        self.week_counts[slot] += 1
+        self.week_means[slot] += (occupancy - self.week_means[slot]) / self.week_counts[slot]
+
+        self.counts[slot] += 1
+        self.spots = spots
+        self.last_timestamp = timestamp
+        self.last_occupancy = occupancy
+
+    def forecast(self, timestamp: float) -> Dict:
+        """
+        Forecast the occupancy at a given time: the slot mean, adjusted by the recent trend.
+        Falls back to the last reading while the slot has no readings.
+
+        Parameters:
+            timestamp (float): The epoch time to forecast
+
+        Returns:
+            dict: {"occupancy": int, "samples": int}, samples being the number of readings of the slot
+        """
+        slot = week_slot(timestamp)
+        count = self.counts[slot]
+        if not count:
+            return {"occupancy": self.last_occupancy, "samples": 0}
+        horizon = max(timestamp - self.last_timestamp, 0.0)
+        trend = self.residual * math.exp(-horizon / self.trend_time_constant)
+        occupancy = round(self.slot_mean(slot) + trend)
+        return {"occupancy": min(max(occupancy, 0), self.spots or occupancy), "samples": count}
+
+
+class OccupancyForecaster:
+    def __init__(self):
+        """
+        Initialize the per-facility occupancy profiles.
+        They are updated as the readings arrive, so a forecast is a lookup.
+        """
+        self._profiles: Dict[str, OccupancyProfile] = {}
+        self._lock = threading.Lock()
+
+    def get(self, facility_id: str) -> Optional[OccupancyProfile]:
+        return self._profiles.get(str(facility_id))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._profiles.clear()
+
+    def update(self, facility_id: str, timestamp: float, occupancy: int, spots: int) -> None:
+        with self._lock:
+            profile = self._profiles.get(str(facility_id))
+            if profile is None:
+                profile = self._profiles[str(facility_id)] = OccupancyProfile()
+            profile.update(timestamp, occupancy, spots)
+
+    def rebuild(self, history: OccupancyHistory) -> int:
+        """
+        Rebuild the profiles from the occupancy history (e.g. after loading it on startup).
+
+        Returns:
+            int: The number of facilities with a profile
+        """
+        self.clear()
+        for facility_id, buffer in history.items():
+            for index in range(buffer.size):
+                physical = buffer.physical_index(index)
+                self.update(facility_id, buffer.timestamps[physical], buffer.occupancy[physical], buffer.spots)
+        return len(self._profiles)
+
+    def forecast(self, facility_id: str, timestamp: float) -> Optional[Dict]:
+        """
+        Forecast the occupancy of a facility at a given time.
+
+        Returns:
+            dict: {"occupancy": int, "samples": int, "spots": int}, or None if the facility has no readings
+        """
+        profile = self.get(facility_id)
+        if profile is None:
+            return None
+        with self._lock:
+            return {**profile.forecast(timestamp), "spots": profile.spots}
+
+
+# Create a global occupancy forecaster instance
+occupancy_forecaster = OccupancyForecaster()
@@ -0,0 +1,263 @@
+import logging
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional
+
+from app.core.config import HISTORY_CAPACITY
+from app.utils.time_utils import parse_message_date
+
+logger = logging.getLogger(__name__)
+
+# Header of a persisted buffer: capacity, size, spots
+_HEADER = struct.Struct("<iii")
+
+
+class _TimestampView:
+    """
+    A read-only view of the timestamps of a ring buffer in chronological order,
+    so that bisect can search the buffer without copying it.
+    """
+
+    def __init__(self, buffer: "OccupancyRingBuffer"):
+        self._buffer = buffer
+
+    def __len__(self) -> int:
+        return self._buffer.size
+
+    def __getitem__(self, index: int) -> float:
+        return self._buffer.timestamps[self._buffer.physical_index(index)]
+
+
+class OccupancyRingBuffer:
+    def __init__(self, capacity: int):
+        """
+        Initialize a fixed-size ring buffer of occupancy readings.
+        The timestamps (epoch seconds) and occupancies are kept in typed arrays,
+        12 bytes per reading; the oldest readings are overwritten once it is full.
+
+        Parameters:
+            capacity (int): The maximum number of readings
+        """
+        self.capacity = capacity
+        self.timestamps = array("d", bytes(8 * capacity))
+        self.occupancy = array("i", bytes(4 * capacity))
+        self.start = 0
+        self.size = 0
+        self.spots = 0
+
+    def physical_index(self, index: int) -> int:
+        """
+        Get the array index of the index-th oldest reading.
+        """
+        return (self.start + index) % self.capacity
+
+    @property
+    def last_timestamp(self) -> Optional[float]:
+        return self.timestamps[self.physical_index(self.size - 1)] if self.size else None
+
+    @property
+    def last_occupancy(self) -> Optional[int]:
+        return self.occupancy[self.physical_index(self.size - 1)] if self.size else None
+
+    def append(self, timestamp: float, occupancy: int) -> bool:
+        """
+        Append a reading, unless it is not newer than the last one
+        (the same reading is seen by several fetches).
+
+        Returns:
+            bool: True if the reading was appended
+        """
+        last_timestamp = self.last_timestamp
+        if last_timestamp is not None and timestamp <= last_timestamp:
+            return False
+        if self.size < self.capacity:
+            index = self.physical_index(self.size)
+            self.size += 1
+        else:
+            index = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.timestamps[index] = timestamp
+        self.occupancy[index] = occupancy
+        return True
+
+    def downsample(self, since: float, until: float, step: float) -> List[Dict]:
+        """
+        Aggregate the readings between since and until into buckets of step seconds.
+        Only the readings in the range are visited: the range is found by bisection.
+
+        Parameters:
+            since (float): The start of the range (epoch seconds)
+            until (float): The end of the range (epoch seconds)
+            step (float): The bucket size in seconds
+
+        Returns:
+            List[dict]: One dict per non-empty bucket, with the bucket start timestamp,
+                        and the mean, min and max occupancy of its readings
+        """
+        view = _TimestampView(self)
+        first = bisect_left(view, since)
+        last = bisect_right(view, until)
+        points = []
+        bucket = None
+        for index in range(first, last):
+            physical = self.physical_index(index)
+            timestamp = self.timestamps[physical]
+            occupancy = self.occupancy[physical]
+            # Buckets are aligned on the clock (e.g. :00, :15, :30, :45 for 15 minutes)
+            bucket_start = timestamp // step * step
+            if bucket is None or bucket["timestamp"] != bucket_start:
+                bucket = {"timestamp": bucket_start, "total": 0, "count": 0, "min": occupancy, "max": occupancy}
+                points.append(bucket)
+            bucket["total"] += occupancy
+            bucket["count"] += 1
+            bucket["min"] = min(bucket["min"], occupancy)
+            bucket["max"] = max(bucket["max"], occupancy)
+        return [
+            {
+                "timestamp": point["timestamp"],
+                "occupancy": point["total"] / point["count"],
+                "min_occupancy": point["min"],
+                "max_occupancy": point["max"],
+            }
+            for point in points
+        ]
+
+    def write(self, f) -> None:
+        """
+        Write the buffer to a binary file, oldest reading first.
+        """
+        f.write(_HEADER.pack(self.capacity, self.size, self.spots))
+        start, end = self.start, self.start + self.size
+        # The readings may wrap around the end of the arrays
+        head_end, tail_end = min(end, self.capacity), max(end - self.capacity, 0)
+        for values in (self.timestamps, self.occupancy):
+            values[start:head_end].tofile(f)
+            values[:tail_end].tofile(f)
+
+    @classmethod
+    def read(cls, f, capacity: int) -> "OccupancyRingBuffer":
+        """
+        Read a buffer written by write(), keeping the newest readings if it is larger than capacity.
+        """
+        _, size, spots = _HEADER.unpack(f.read(_HEADER.size))
+        timestamps = array("d")
+        timestamps.fromfile(f, size)
+        occupancy = array("i")
+        occupancy.fromfile(f, size)
+        buffer = cls(capacity)
+        buffer.spots = spots
+        for index in range(max(size - capacity, 0), size):
+            buffer.append(timestamps[index], occupancy[index])
+        return buffer
+
+
+class OccupancyHistory:
+    def __init__(self, capacity: int = HISTORY_CAPACITY):
+        """
+        Initialize the per-facility occupancy history.
+
+        Parameters:
+            capacity (int): The number of readings kept per facility
+        """
+        self.capacity = capacity
+        self._buffers: Dict[str, OccupancyRingBuffer] = {}
+        self._lock = threading.Lock()
+
+    def get(self, facility_id: str) -> Optional[OccupancyRingBuffer]:
+        return self._buffers.get(str(facility_id))
+
+    def items(self):
+        return list(self._buffers.items())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buffers.clear()
+
+    def record(self, facility_id: str, details: Dict) -> bool:
+        """
+        Record the occupancy of a detail payload of the NSW API.
+        The reading is timestamped with its MessageDate (or the current time if missing).
+
+        Parameters:
+            facility_id (str): The facility ID
+            details (dict): The carpark details
+
+        Returns:
+            bool: True if a new reading was recorded
+        """
+        try:
+            spots = int(details.get("spots", 0))
+            occupancy = int(details.get("occupancy", {}).get("total"))
+        except (TypeError, ValueError):
+            return False
+        msg_date = details.get("MessageDate")
+        msg_datetime = parse_message_date(msg_date) if msg_date else None
+        timestamp = msg_datetime.timestamp() if msg_datetime else time.time()
+        with self._lock:
+            buffer = self._buffers.get(str(facility_id))
+            if buffer is None:
+                buffer = self._buffers[str(facility_id)] = OccupancyRingBuffer(self.capacity)
+            buffer.spots = spots
+            return buffer.append(timestamp, occupancy)
+
+    def downsample(self, facility_id: str, since: float, until: float, step: float) -> Optional[List[Dict]]:
+        """
+        Get the downsampled readings of a facility (see OccupancyRingBuffer.downsample).
+
+        Returns:
+            List[dict]: The buckets, or None if the facility has no history
+        """
+        buffer = self.get(facility_id)
+        if buffer is None:
+            return None
+        with self._lock:
+            return buffer.downsample(since, until, step)
+
+    def save(self, directory: str) -> int:
+        """
+        Persist the buffers, one <facility_id>.bin file per facility.
+
+        Returns:
+            int: The number of saved facilities
+        """
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            for facility_id, buffer in self._buffers.items():
+                path = os.path.join(directory, "{}.bin".format(facility_id))
+                with open(path + ".tmp", "wb") as f:
+                    buffer.write(f)
+                os.replace(path + ".tmp", path)
+            return len(self._buffers)
+
+    def load(self, directory: str) -> int:
+        """
+        Load the buffers persisted by save(), if any.
+
+        Returns:
+            int: The number of loaded facilities
+        """
+        if not os.path.isdir(directory):
+            return 0
+        loaded = 0
+        for name in os.listdir(directory):
+            facility_id, extension = os.path.splitext(name)
+            if extension != ".bin":
+                continue
+            try:
+                with open(os.path.join(directory, name), "rb") as f:
+                    buffer = OccupancyRingBuffer.read(f, self.capacity)
+            except (OSError, EOFError, struct.error) as e:
+                logger.error("Failed to load the occupancy history of {}: {}".format(facility_id, e))
+                continue
+            with self._lock:
+                self._buffers[facility_id] = buffer
+            loaded += 1
+        return loaded
+
+
+# Create a global occupancy history instance
+occupancy_history = OccupancyHistory()
@@ -0,0 +1,369 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from app.core.config import (
+    MAX_REQUESTS_PER_SECOND,
+    POLL_BUDGET_FRACTION,
+    POLL_MAX_INTERVAL,
+    POLL_MIN_INTERVAL,
+    POLL_SERVE_MAX_AGE,
+)
+from app.core.metrics import scheduled_polls_total
+from app.services.cache_service import last_known_details
+from app.services.nsw_transport_api import get_all_carpark_ids, get_carpark_details, get_no_update_carparks
+from app.services.sweep_progress import sweep_progress
+from app.services.upstream_throttle import BACKGROUND, upstream_priority
+from app.utils.time_utils import SYDNEY_TZ, get_local_time
+
+logger = logging.getLogger(__name__)
+
+
+def time_of_day_factor(local_time: datetime) -> float:
+    """
+    Get the share of the polling budget to spend at a given local time.
+
+    Parameters:
+        local_time (datetime): The local (Sydney) time
+
+    Returns:
+        float: 1.0 during the weekday commuter peaks, 0.1 at night, 0.5 otherwise
+    """
+    hour = local_time.hour
+    if hour < 5:
+        return 0.1
+    if local_time.weekday() < 5 and (6 <= hour < 10 or 15 <= hour < 19):
+        return 1.0
+    return 0.5
+
+
+class FacilitySchedule:
+    __slots__ = ("occupancy", "polled_at", "change_rate", "demand", "demand_at", "interval", "next_poll_at")
+
+    def __init__(self, interval: float):
+        # The last polled occupancy and when it was polled (epoch seconds)
+        self.occupancy: Optional[int] = None
+        self.polled_at: Optional[float] = None
+        # EWMA of the occupancy change, as a fraction of the capacity per hour
+        self.change_rate = 0.0
+        # Exponentially decayed number of lookups, as of demand_at
+        self.demand = 0.0
+        self.demand_at = 0.0
+        self.interval = interval
+        # Never polled facilities are due immediately
+        self.next_poll_at = 0.0
+
+
+class PollingScheduler:
+    def __init__(
+        self,
+        requests_per_second: float,
+        min_interval: float = 60.0,
+        max_interval: float = 3600.0,
+        alpha: float = 0.3,
+        demand_half_life: float = 3600.0,
+        change_weight: float = 10.0,
+        demand_weight: float = 1.0,
+    ):
+        """
+        Initialize the per-facility polling scheduler.
+
+        Each facility gets a weight growing with how fast its occupancy changes and
+        how often it is looked up. The polling budget (scaled by the time of day) is
+        shared between the facilities in proportion to their weights, so the total
+        polling rate never exceeds the budget.
+
+        Parameters:
+            requests_per_second (float): The polling budget at peak time
+            min_interval (float): The shortest refresh interval of a facility in seconds
+            max_interval (float): The longest refresh interval of a facility in seconds
+            alpha (float): The smoothing factor of the occupancy change EWMA
+            demand_half_life (float): The half-life of the lookup counts in seconds
+            change_weight (float): The weight of the occupancy change rate
+            demand_weight (float): The weight of the lookups
+        """
+        self.requests_per_second = requests_per_second
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.alpha = alpha
+        self.demand_half_life = demand_half_life
+        self.change_weight = change_weight
+        self.demand_weight = demand_weight
+        self._schedules: Dict[str, FacilitySchedule] = {}
+        self._total_weight = 0.0
+        self._budget = requests_per_second
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._schedules)
+
+    def __contains__(self, facility_id: str) -> bool:
+        return str(facility_id) in self._schedules
+
+    def get(self, facility_id: str) -> Optional[FacilitySchedule]:
+        return self._schedules.get(str(facility_id))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._schedules.clear()
+            self._total_weight = 0.0
+
+    def mark_due(self, facility_id: str) -> None:
+        """
+        Poll a facility on the next round, e.g. after its details were invalidated.
+        """
+        schedule = self.get(facility_id)
+        if schedule is not None:
+            schedule.next_poll_at = 0.0
+
+    def sync(self, facility_ids: Iterable[str]) -> None:
+        """
+        Schedule the new facilities and drop the ones which are no longer polled.
+
+        Parameters:
+            facility_ids (Iterable[str]): The facilities to poll
+        """
+        facility_ids = {str(facility_id) for facility_id in facility_ids}
+        with self._lock:
+            for facility_id in list(self._schedules):
+                if facility_id not in facility_ids:
+                    del self._schedules[facility_id]
+            for facility_id in facility_ids - self._schedules.keys():
+                self._schedules[facility_id] = FacilitySchedule(self.max_interval)
+
+    def _demand(self, schedule: FacilitySchedule, now: float) -> float:
+        return schedule.demand * 0.5 ** ((now - schedule.demand_at) / self.demand_half_life)
+
+    def weight(self, schedule: FacilitySchedule, now: float) -> float:
+        """
+        Get the weight of a facility: 1 for a static, never looked up facility.
+        """
+        return 1.0 + self.change_weight * schedule.change_rate + self.demand_weight * self._demand(schedule, now)
+
+    def _interval(self, weight: float) -> float:
+        # The facility gets budget * weight / total_weight requests per second
+        if self._budget <= 0 or weight <= 0:
+            return self.max_interval
+        interval = self._total_weight / (self._budget * weight)
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def reschedule(self, now: float = None, local_time: datetime = None) -> None:
+        """
+        Recompute the refresh intervals of all facilities.
+
+        Parameters:
+            now (float, optional): The current epoch time
+            local_time (datetime, optional): The current local time, for the time of day factor
+        """
+        now = time.time() if now is None else now
+        local_time = local_time or get_local_time()
+        with self._lock:
+            self._budget = self.requests_per_second * time_of_day_factor(local_time)
+            weights = {facility_id: self.weight(schedule, now) for facility_id, schedule in self._schedules.items()}
+            self._total_weight = sum(weights.values())
+            for facility_id, schedule in self._schedules.items():
+                schedule.interval = self._interval(weights[facility_id])
+                if schedule.polled_at is not None:
+                    schedule.next_poll_at = schedule.polled_at + schedule.interval
+
+    def record_poll(self, facility_id: str, details: Optional[Dict], now: float = None) -> None:
+        """
+        Record the result of a poll, updating the occupancy change rate of the facility.
+
+        Parameters:
+            facility_id (str): The facility ID
+            details (dict, optional): The polled details, None if the poll failed
+            now (float, optional): The current epoch time
+        """
+        now = time.time() if now is None else now
+        schedule = self.get(facility_id)
+        if schedule is None:
+            return
+        with self._lock:
+            if details:
+                try:
+                    spots = int(details.get("spots", 0))
+                    occupancy = int(details.get("occupancy", {}).get("total", 0))
+                except (TypeError, ValueError):
+                    occupancy = None
+                if occupancy is not None and schedule.occupancy is not None and schedule.polled_at is not None:
+                    elapsed_hours = (now - schedule.polled_at) / 3600
+                    if elapsed_hours > 0:
+                        rate = abs(occupancy - schedule.occupancy) / max(spots, 1) / elapsed_hours
+                        schedule.change_rate = self.alpha * rate + (1 - self.alpha) * schedule.change_rate
+                schedule.occupancy = occupancy
+            schedule.polled_at = now
+            schedule.interval = self._interval(self.weight(schedule, now))
+            schedule.next_poll_at = now + schedule.interval
+
+    def record_demand(self, facility_id: str, now: float = None) -> None:
+        """
+        Record a lookup of a scheduled facility.
+
+        Parameters:
+            facility_id (str): The facility ID
+            now (float, optional): The current epoch time
+        """
+        now = time.time() if now is None else now
+        schedule = self.get(facility_id)
+        if schedule is None:
+            return
+        with self._lock:
+            schedule.demand = self._demand(schedule, now) + 1
+            schedule.demand_at = now
+
+    def due(self, now: float = None) -> List[str]:
+        """
+        Get the facilities due for a poll, the most overdue first.
+        """
+        now = time.time() if now is None else now
+        due = [(schedule.next_poll_at, facility_id) for facility_id, schedule in self._schedules.items()]
+        return [facility_id for next_poll_at, facility_id in sorted(due) if next_poll_at <= now]
+
+    def budget(self) -> float:
+        """
+        The polling budget (requests per second) as of the last reschedule.
+        """
+        return self._budget
+
+    def freshness(self, now: float = None) -> List[Dict]:
+        """
+        Get the freshness of the polled data of every scheduled facility.
+
+        Returns:
+            List[dict]: One dict per facility with the poll time, age, interval,
+                        next poll time, change rate and demand
+        """
+        now = time.time() if now is None else now
+        rows = []
+        for facility_id, schedule in sorted(self._schedules.items()):
+            rows.append(
+                {
+                    "facility_id": facility_id,
+                    "polled_at": datetime.fromtimestamp(schedule.polled_at, SYDNEY_TZ) if schedule.polled_at else None,
+                    "age_seconds": round(now - schedule.polled_at, 1) if schedule.polled_at else None,
+                    "interval_seconds": round(schedule.interval, 1),
+                    "next_poll_at": datetime.fromtimestamp(max(schedule.next_poll_at, now), SYDNEY_TZ),
+                    "change_rate": round(schedule.change_rate, 4),
+                    "demand": round(self._demand(schedule, now), 2),
+                }
+            )
+        return rows
+
+
+class BackgroundPoller:
+    def __init__(self, scheduler: PollingScheduler, resync_interval: float = 3600.0):
+        """
+        Initialize the background poller, which refreshes the details of the
+        facilities when the scheduler says they are due.
+
+        Parameters:
+            scheduler (PollingScheduler): The polling scheduler
+            resync_interval (float): How often to refresh the list of facilities in seconds
+        """
+        self.scheduler = scheduler
+        self.resync_interval = resync_interval
+        self._synced_at = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def sync(self, now: float) -> None:
+        """
+        Poll the facilities which are not no-update (those are checked by the no-update sweep).
+        """
+        carpark_ids = get_all_carpark_ids()
+        if not carpark_ids:
+            return
+        no_update_set = get_no_update_carparks()
+        self.scheduler.sync(facility_id for facility_id in carpark_ids if str(facility_id) not in no_update_set)
+        self._synced_at = now
+
+    def run_once(self, now: float = None) -> int:
+        """
+        Poll the facilities which are due, pacing the polls to the budget.
+
+        Returns:
+            int: The number of polled facilities (none while the sweeps are paused)
+        """
+        if sweep_progress.paused:
+            return 0
+        now = time.time() if now is None else now
+        if now - self._synced_at >= self.resync_interval or not len(self.scheduler):
+            self.sync(now)
+        self.scheduler.reschedule(now)
+        polled = 0
+        for facility_id in self.scheduler.due(now):
+            if self._stop.is_set():
+                break
+            started = time.time()
+            with upstream_priority(BACKGROUND):
+                details = get_carpark_details(facility_id)
+            self.scheduler.record_poll(facility_id, details)
+            scheduled_polls_total.inc(result="success" if details else "failure")
+            polled += 1
+            budget = self.scheduler.budget()
+            if budget > 0:
+                self._stop.wait(max(1 / budget - (time.time() - started), 0))
+        return polled
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                polled = self.run_once()
+                logger.debug("Background poller refreshed {} facilities".format(polled))
+            except Exception as e:
+                logger.error("Error in the background poller: {}".format(e))
+            self._stop.wait(1.0)
+
+    def start(self) -> None:
+        if self.is_running:
+            return
+        logger.info("Starting the background poller ({:.2f} requests/s)".format(self.scheduler.requests_per_second))
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="background-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def get_polled_details(facility_id: str, now: float = None, max_age: float = POLL_SERVE_MAX_AGE) -> Optional[Dict]:
+    """
+    Get the details refreshed by the background poller, if they are still within
+    the refresh interval of the facility and younger than max_age: a quiet facility
+    is polled rarely (up to POLL_MAX_INTERVAL), which is too old to serve as current.
+
+    Parameters:
+        facility_id (str): The facility ID
+        now (float, optional): The current epoch time
+        max_age (float): The maximum age of the details served, in seconds
+
+    Returns:
+        dict: The polled details, or None if the facility is not polled or its details are too old
+    """
+    now = time.time() if now is None else now
+    schedule = polling_scheduler.get(facility_id)
+    snapshot = last_known_details.get(str(facility_id))
+    if schedule is None or snapshot is None:
+        return None
+    if now - snapshot.fetched_at > min(schedule.interval, max_age):
+        return None
+    return snapshot.value
+
+
+# Create the global polling scheduler and background poller instances
+polling_scheduler = PollingScheduler(
+    requests_per_second=MAX_REQUESTS_PER_SECOND * POLL_BUDGET_FRACTION,
+    min_interval=POLL_MIN_INTERVAL,
+    max_interval=POLL_MAX_INTERVAL,
+)
+background_poller = BackgroundPoller(polling_scheduler)
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import logging
+import threading
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from app.core.metrics import cache_entries, cache_requests_total
+
+logger = logging.getLogger(__name__)
+
+
+class EncodedResponse(NamedTuple):
+    # The JSON body, ready to be written to the socket
+    body: bytes
+    # The strong entity tag of the body, quoted
+    etag: str
+
+
+def encode_body(body: bytes) -> EncodedResponse:
+    """
+    Tag an encoded response body with the hash of its content, so that the same content
+    always gets the same ETag (e.g. details fetched again without any change).
+
+    Parameters:
+        body (bytes): The JSON body
+
+    Returns:
+        EncodedResponse: The body and its ETag
+    """
+    return EncodedResponse(body=body, etag='"{}"'.format(hashlib.blake2b(body, digest_size=16).hexdigest()))
+
+
+def details_digest(details: Dict) -> bytes:
+    """
+    Hash the content of a details payload, so that details fetched again without any change
+    (a new payload of the same content) are recognized.
+
+    Parameters:
+        details (dict): The carpark details
+
+    Returns:
+        bytes: The digest of the content
+    """
+    content = json.dumps(details, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Check an If-None-Match header against an ETag (weak comparison, as for GET requests).
+
+    Parameters:
+        if_none_match (str, optional): The If-None-Match header, e.g. '"abc", W/"def"' or '*'
+        etag (str): The quoted ETag of the current response
+
+    Returns:
+        bool: True if the client already has the current response
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    def __init__(self, name: str):
+        """
+        Initialize a cache of encoded responses, per facility.
+
+        A response is kept with the details payload it was built from and the digest of its
+        content: it is built and encoded once per details content, whatever the number of
+        requests serving it (the same payload of the background poller, or the same details
+        fetched again), and rebuilt when the facility's details change.
+
+        Parameters:
+            name (str): The cache name, reported by the cache metrics
+        """
+        self.name = name
+        self._entries: Dict[str, Tuple[Dict, bytes, bool, EncodedResponse]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, facility_id: str, details: Dict, stale: bool = False) -> Optional[EncodedResponse]:
+        """
+        Get the response built from a details payload.
+
+        Parameters:
+            facility_id (str): The facility ID
+            details (dict): The carpark details the response is served from
+            stale (bool): True if the details are the last known ones, the NSW API being unavailable
+
+        Returns:
+            EncodedResponse: The response, or None if it was not built from details of this content yet
+        """
+        entry = self._entries.get(str(facility_id))
+        # The same payload is served without hashing it
+        if entry is not None and entry[2] == stale and (entry[0] is details or entry[1] == details_digest(details)):
+            cache_requests_total.inc(cache=self.name, result="hit")
+            return entry[3]
+        cache_requests_total.inc(cache=self.name, result="miss")
+        return None
+
+    def put(self, facility_id: str, details: Dict, body: bytes, stale: bool = False) -> EncodedResponse:
+        """
+        Record the response built from a details payload, replacing the previous one of the facility.
+
+        Parameters:
+            facility_id (str): The facility ID
+            details (dict): The carpark details the response was built from
+            body (bytes): The JSON body
+            stale (bool): True if the details are the last known ones
+
+        Returns:
+            EncodedResponse: The body and its ETag
+        """
+        response = encode_body(body)
+        with self._lock:
+            self._entries[str(facility_id)] = (details, details_digest(details), stale, response)
+            cache_entries.set(len(self._entries), cache=self.name)
+        return response
+
+    def forget(self, facility_id: str) -> None:
+        with self._lock:
+            self._entries.pop(str(facility_id), None)
+            cache_entries.set(len(self._entries), cache=self.name)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            cache_entries.set(0, cache=self.name)
+
+
+# Create a global response cache instance for the carpark details
+detail_responses = ResponseCache("carpark_detail_responses")
+# Create a global response cache instance for the carpark details of the no-update carparks
+no_update_responses = ResponseCache("carpark_no_update_responses")
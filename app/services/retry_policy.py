@@ -0,0 +1,103 @@
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import FrozenSet, Optional
+
+import requests
+
+# NSW returns 403 as well as 429 when the throttle limit is exceeded
+DEFAULT_RETRYABLE_STATUSES = frozenset({403, 429, 500, 502, 503, 504})
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header value.
+
+    Parameters:
+        value (str): Either a number of seconds ("2") or an HTTP date
+                     ("Wed, 21 Oct 2015 07:28:00 GMT")
+
+    Returns:
+        float: The number of seconds to wait, or None if the value is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 10.0,
+        deadline: float = 30.0,
+        retryable_statuses: FrozenSet[int] = DEFAULT_RETRYABLE_STATUSES,
+    ):
+        """
+        Initialize the retry policy: exponential backoff with full jitter,
+        bounded by a total deadline.
+
+        Parameters:
+            max_attempts (int): The maximum number of attempts, including the first one
+            base_delay (float): The backoff cap of the first retry in seconds, doubled on each retry
+            max_delay (float): The maximum backoff in seconds
+            deadline (float): The total time budget in seconds, no retry is started past it
+            retryable_statuses (FrozenSet[int]): The HTTP statuses worth retrying
+        """
+        if max_attempts < 1:
+            raise ValueError("The maximum number of attempts must be at least 1, got {}".format(max_attempts))
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retryable_statuses = retryable_statuses
+
+    def with_max_attempts(self, max_attempts: int) -> "RetryPolicy":
+        """
+        Get a copy of the policy with another maximum number of attempts.
+        """
+        return RetryPolicy(max_attempts, self.base_delay, self.max_delay, self.deadline, self.retryable_statuses)
+
+    def is_retryable(self, error: requests.exceptions.RequestException) -> bool:
+        """
+        Check if a failed request is worth retrying.
+        Connection errors and timeouts are, client errors such as 404 are not.
+
+        Parameters:
+            error (RequestException): The error raised by the request
+
+        Returns:
+            bool: True if the request should be retried
+        """
+        response = getattr(error, "response", None)
+        if response is None:
+            # No response: connection errors and timeouts are transient, while invalid
+            # URLs or invalid JSON (the ValueError subclasses of requests) are not
+            return not isinstance(error, ValueError)
+        return response.status_code in self.retryable_statuses
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Get the delay before the next attempt.
+
+        Parameters:
+            attempt (int): The number of the attempt which just failed, starting at 0
+            retry_after (float, optional): The delay requested by the server (Retry-After header)
+
+        Returns:
+            float: The delay in seconds: a random value between 0 and the exponential cap
+                   (full jitter), but never less than the Retry-After delay
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
@@ -0,0 +1,109 @@
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, NamedTuple, Optional
+
+
+class StalenessRecord(NamedTuple):
+    # The last MessageDate seen for the facility (None if missing or invalid)
+    message_date: Optional[datetime]
+    # When the facility was last checked against the NSW API
+    checked_at: datetime
+    # The earliest time the no-update status of the facility could change
+    next_check_at: datetime
+    no_update: bool
+
+
+class StalenessTracker:
+    def __init__(self, no_update_hours: int = 24):
+        """
+        Initialize the per-facility staleness records.
+
+        A facility with a recent MessageDate cannot become no-update before
+        MessageDate + no_update_hours, so it does not need to be checked again
+        until then. A no-update facility may get an update at any time, so it is
+        due on every sweep.
+
+        Parameters:
+            no_update_hours (int): The number of hours after which a carpark is considered no update
+        """
+        self.no_update_window = timedelta(hours=no_update_hours)
+        self._records: Dict[str, StalenessRecord] = {}
+        self._lock = threading.Lock()
+
+    def get(self, facility_id: str) -> Optional[StalenessRecord]:
+        return self._records.get(str(facility_id))
+
+    def is_due(self, facility_id: str, current_time: datetime) -> bool:
+        """
+        Check if the facility must be fetched again to know its no-update status.
+
+        Parameters:
+            facility_id (str): The facility ID
+            current_time (datetime): The current time
+
+        Returns:
+            bool: True if the facility was never checked or its status might have changed
+        """
+        record = self.get(facility_id)
+        return record is None or current_time >= record.next_check_at
+
+    def seen_within(self, facility_id: str, current_time: datetime, max_age: timedelta) -> bool:
+        """
+        Check if the facility was fetched by a check recently.
+
+        Parameters:
+            facility_id (str): The facility ID
+            current_time (datetime): The current time
+            max_age (timedelta): The maximum age of the check
+
+        Returns:
+            bool: True if the facility was checked within max_age
+        """
+        record = self.get(facility_id)
+        return record is not None and current_time - record.checked_at <= max_age
+
+    def update(
+        self,
+        facility_id: str,
+        message_date: Optional[datetime],
+        no_update: bool,
+        current_time: datetime,
+    ) -> StalenessRecord:
+        """
+        Record the result of a check.
+
+        Parameters:
+            facility_id (str): The facility ID
+            message_date (datetime, optional): The MessageDate of the fetched details
+            no_update (bool): Whether the facility is considered no update
+            current_time (datetime): The current time
+
+        Returns:
+            StalenessRecord: The new record
+        """
+        if no_update or message_date is None:
+            next_check_at = current_time
+        else:
+            next_check_at = message_date + self.no_update_window
+        record = StalenessRecord(message_date, current_time, next_check_at, no_update)
+        with self._lock:
+            self._records[str(facility_id)] = record
+        return record
+
+    def forget(self, facility_id: str) -> None:
+        """
+        Drop the record of a facility, so that it is checked on the next sweep.
+        """
+        with self._lock:
+            self._records.pop(str(facility_id), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+# Create a global staleness tracker instance
+staleness_tracker = StalenessTracker()
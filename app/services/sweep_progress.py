@@ -0,0 +1,105 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class Sweep:
+    __slots__ = ("name", "total", "done", "started_at", "finished_at", "duration", "completed")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.total = 0
+        self.done = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Duration of the last finished sweep, and whether it went through all the facilities
+        self.duration: Optional[float] = None
+        self.completed: Optional[bool] = None
+
+    @property
+    def running(self) -> bool:
+        return self.started_at is not None and self.finished_at is None
+
+    def advance(self, count: int = 1) -> None:
+        self.done += count
+
+
+class SweepProgress:
+    def __init__(self):
+        """
+        Initialize the progress records of the fleet sweeps (e.g. the no-update sweep),
+        read by the health endpoints. Recording is a few attribute writes, so that the
+        sweeps are not slowed down, and reading needs no lock.
+
+        The background sweeps can be paused (e.g. while the NSW API serves bad data):
+        the fleet results are then served from the caches, or the last known results.
+        """
+        self._sweeps: Dict[str, Sweep] = {}
+        self.paused_at: Optional[float] = None
+
+    @property
+    def paused(self) -> bool:
+        return self.paused_at is not None
+
+    def pause(self) -> None:
+        if self.paused_at is None:
+            self.paused_at = time.time()
+
+    def resume(self) -> None:
+        self.paused_at = None
+
+    def get(self, name: str) -> Optional[Sweep]:
+        return self._sweeps.get(name)
+
+    def clear(self) -> None:
+        self._sweeps.clear()
+        self.paused_at = None
+
+    @contextmanager
+    def track(self, name: str, total: int):
+        """
+        Record the progress of a sweep over `total` facilities.
+
+        Example:
+            with sweep_progress.track("no_update_carparks", len(carpark_ids)) as sweep:
+                for facility_id in carpark_ids:
+                    ...
+                    sweep.advance()
+        """
+        sweep = self._sweeps.get(name)
+        if sweep is None:
+            sweep = self._sweeps[name] = Sweep(name)
+        sweep.total, sweep.done = total, 0
+        sweep.started_at, sweep.finished_at = time.time(), None
+        completed = False
+        try:
+            yield sweep
+            completed = True
+        finally:
+            sweep.finished_at = time.time()
+            sweep.duration = sweep.finished_at - sweep.started_at
+            sweep.completed = completed
+
+    def status(self) -> Dict[str, Dict]:
+        """
+        Get the progress of every sweep.
+
+        Returns:
+            dict: Per sweep name, whether it is running, the facilities done out of the total,
+                  and the duration of the last finished sweep and whether it completed
+        """
+        return {
+            name: {
+                "running": sweep.running,
+                "done": sweep.done,
+                "total": sweep.total,
+                "started_at": sweep.started_at,
+                "last_duration_seconds": sweep.duration,
+                "last_completed": sweep.completed,
+            }
+            for name, sweep in list(self._sweeps.items())
+        }
+
+
+# Create a global sweep progress instance
+sweep_progress = SweepProgress()
@@ -0,0 +1,118 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from app.core.metrics import throttle_wait_seconds
+from app.core.timing import timed_phase
+
+# Priority lanes of the requests to the NSW Transport API
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# The lane of the upstream requests made by the current request or task
+_current_priority: ContextVar[str] = ContextVar("upstream_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def upstream_priority(priority: str):
+    """
+    Send the upstream requests made inside the block in the given lane.
+
+    Example:
+        with upstream_priority(BACKGROUND):
+            fetch_no_update_carparks(carpark_ids, current_time)
+    """
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> str:
+    return _current_priority.get()
+
+
+class PriorityThrottle:
+    def __init__(self, requests_per_second: int, interactive_reserved: int = 1):
+        """
+        Initialize the throttle of the requests to the NSW Transport API.
+
+        Like the NSW throttle limit, it allows `requests_per_second` requests in each
+        second. Interactive requests (user lookups) may use all of them and are always
+        served before the waiting background requests (sweeps), which only get the
+        capacity left after `interactive_reserved` requests per second are kept for
+        interactive requests.
+
+        Parameters:
+            requests_per_second (int): The number of requests allowed per second
+            interactive_reserved (int): The number of requests per second reserved to
+                                        interactive requests (background requests always get at least one)
+        """
+        self.interactive_reserved = interactive_reserved
+        self._condition = threading.Condition()
+        self.set_rate(requests_per_second)
+        self.reset()
+
+    def set_rate(self, requests_per_second: int) -> None:
+        """
+        Change the number of requests allowed per second (e.g. the share of a process of the NSW budget).
+        """
+        with self._condition:
+            self.requests_per_second = requests_per_second
+            self.background_limit = max(requests_per_second - self.interactive_reserved, 1)
+
+    def reset(self) -> None:
+        """
+        Start a new window and forget the waiting requests.
+        """
+        self._window = 0
+        self.request_count = 0
+        self._waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+
+    def _roll_window(self, now: float) -> None:
+        # Reset the request count if we're in a new second
+        if int(now) > self._window:
+            self._window = int(now)
+            self.request_count = 0
+
+    def _has_slot(self, priority: str) -> bool:
+        if priority == INTERACTIVE:
+            return self.request_count < self.requests_per_second
+        # Background requests yield to the waiting interactive requests
+        return self.request_count < self.background_limit and not self._waiting[INTERACTIVE]
+
+    def acquire(self, priority: str = None) -> float:
+        """
+        Wait for a request slot in the current second.
+
+        Parameters:
+            priority (str, optional): INTERACTIVE or BACKGROUND, defaults to the lane of the current context
+
+        Returns:
+            float: The time waited in seconds
+        """
+        priority = priority or current_priority()
+        start = time.monotonic()
+        with self._condition:
+            self._roll_window(time.time())
+            if not self._has_slot(priority):
+                self._waiting[priority] += 1
+                try:
+                    with timed_phase("throttle"):
+                        while True:
+                            # Wait until the start of the next second, or until a slot is freed for this lane
+                            now = time.time()
+                            self._condition.wait(1.0 - (now - int(now)))
+                            self._roll_window(time.time())
+                            if self._has_slot(priority):
+                                break
+                finally:
+                    self._waiting[priority] -= 1
+            self.request_count += 1
+            # A served interactive request may unblock the background lane
+            self._condition.notify_all()
+        waited = time.monotonic() - start
+        throttle_wait_seconds.observe(waited, priority=priority)
+        return waited
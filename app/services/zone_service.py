@@ -0,0 +1,83 @@
+import logging
+import threading
+from typing import Dict, NamedTuple, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Zone(NamedTuple):
+    zone_id: str
+    name: str
+    spots: int
+    occupancy: int
+
+
+def parse_zones(details: Dict) -> Tuple[Zone, ...]:
+    """
+    Parse the zones of a carpark details payload.
+    Zones with invalid spots or occupancy are skipped.
+
+    Parameters:
+        details (dict): The carpark details
+
+    Returns:
+        Tuple[Zone, ...]: The zones, in the payload order
+    """
+    zones = []
+    for zone in details.get("zones") or []:
+        try:
+            zones.append(
+                Zone(
+                    zone_id=str(zone.get("zone_id", "")),
+                    name=zone.get("zone_name") or "Unknown",
+                    spots=int(zone.get("spots", 0)),
+                    occupancy=int((zone.get("occupancy") or {}).get("total", 0)),
+                )
+            )
+        except (AttributeError, TypeError, ValueError) as e:
+            logger.warning("Invalid zone in the details of facility {}: {}".format(details.get("facility_id"), e))
+    return tuple(zones)
+
+
+class ZoneCache:
+    def __init__(self):
+        """
+        Initialize the cache of the parsed zones, per facility.
+
+        The parsed zones are kept with the details payload they come from, so that
+        the zones of a detail snapshot are parsed once, whatever the number of
+        requests serving it, and parsed again when the snapshot is refreshed.
+        """
+        self._entries: Dict[str, Tuple[Dict, Tuple[Zone, ...]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, facility_id: str, details: Dict) -> Tuple[Zone, ...]:
+        """
+        Get the zones of a details payload, parsing them if this payload was not parsed yet.
+
+        Parameters:
+            facility_id (str): The facility ID
+            details (dict): The carpark details
+
+        Returns:
+            Tuple[Zone, ...]: The zones
+        """
+        entry = self._entries.get(str(facility_id))
+        if entry is not None and entry[0] is details:
+            return entry[1]
+        zones = parse_zones(details)
+        with self._lock:
+            self._entries[str(facility_id)] = (details, zones)
+        return zones
+
+    def forget(self, facility_id: str) -> None:
+        with self._lock:
+            self._entries.pop(str(facility_id), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# Create a global zone cache instance
+zone_cache = ZoneCache()
@@ -1,5 +1,8 @@
 from math import atan2, cos, radians, sin, sqrt
 
+# Mean radius of the Earth in kilometers
+EARTH_RADIUS_KM = 6371
+
 
 def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """
@@ -18,7 +21,7 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
         float: The distance between the two points in kilometers
     """
 
-    R = 6371
+    R = EARTH_RADIUS_KM
 
     # Convert coordinates to radians
     lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
@@ -1,10 +1,31 @@
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta, tzinfo
+from functools import lru_cache
 
 import pytz
 
 logger = logging.getLogger(__name__)
 
+# Number of distinct MessageDate strings kept parsed (a few sweeps of the fleet)
+PARSE_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=None)
+def get_timezone(tz: str = "Australia/Sydney") -> tzinfo:
+    """
+    Get a pytz timezone, loaded once per name.
+
+    Parameters:
+        tz (str): The timezone name
+
+    Returns:
+        tzinfo: The timezone
+    """
+    return pytz.timezone(tz)
+
+
+SYDNEY_TZ = get_timezone("Australia/Sydney")
+
 
 def get_local_time(tz: str = "Australia/Sydney") -> datetime:
     """
@@ -15,9 +36,75 @@ def get_local_time(tz: str = "Australia/Sydney") -> datetime:
         datetime: The current time in the local timezone
     """
 
-    local_tz = pytz.timezone(tz)
+    return datetime.now(get_timezone(tz))
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _hour_tzinfo(tz: str, hour: datetime) -> tzinfo | None:
+    # The offset of a wall-clock hour, if it is the same for the whole hour
+    # (None around a DST transition, which localize resolves time by time)
+    local_tz = get_timezone(tz)
+    try:
+        first = local_tz.localize(hour, is_dst=None)
+        last = local_tz.localize(hour + timedelta(hours=1, microseconds=-1), is_dst=None)
+    except (pytz.AmbiguousTimeError, pytz.NonExistentTimeError):
+        return None
+    return first.tzinfo if first.tzinfo is last.tzinfo else None
 
-    return datetime.now(local_tz)
+
+def localize(naive: datetime, tz: str = "Australia/Sydney") -> datetime:
+    """
+    Attach a timezone to a local wall-clock time, resolving the DST transitions.
+
+    When the clocks go back, the repeated hour is ambiguous: the first (daylight
+    saving) occurrence is used, so that readings never appear to come from the
+    future. When the clocks go forward, the skipped hour does not exist: it comes
+    from a clock not switched yet, so it is read as standard time.
+
+    Parameters:
+        naive (datetime): The local time, without timezone
+        tz (str): The timezone name
+
+    Returns:
+        datetime: The datetime with timezone
+    """
+    # datetime() is several times faster than datetime.replace() on this path
+    hour_tzinfo = _hour_tzinfo(tz, datetime(naive.year, naive.month, naive.day, naive.hour))
+    if hour_tzinfo is not None:
+        return datetime(
+            naive.year, naive.month, naive.day, naive.hour, naive.minute, naive.second, naive.microsecond, hour_tzinfo
+        )
+    local_tz = get_timezone(tz)
+    try:
+        return local_tz.localize(naive, is_dst=None)
+    except pytz.AmbiguousTimeError:
+        return local_tz.localize(naive, is_dst=True)
+    except pytz.NonExistentTimeError:
+        return local_tz.normalize(local_tz.localize(naive, is_dst=False))
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_local_datetime(date_str: str, tz: str = "Australia/Sydney") -> datetime:
+    """
+    Parse an ISO 8601 local time to a datetime with timezone.
+    The results are memoized: the MessageDate of a facility is the same until it
+    reports again, so most of the strings of a sweep were parsed by the previous one.
+
+    Parameters:
+        date_str (str): The date, e.g. "2025-06-11T10:00:00" (an explicit UTC offset is honoured)
+        tz (str): The timezone of the local times
+
+    Returns:
+        datetime: The datetime with timezone
+
+    Raises:
+        ValueError: If the string is not an ISO 8601 date
+        TypeError: If it is not a string
+    """
+    parsed = datetime.fromisoformat(date_str)
+    if parsed.tzinfo is not None:
+        return parsed.astimezone(get_timezone(tz))
+    return localize(parsed, tz)
 
 
 def parse_message_date(date_str: str, tz: str = "Australia/Sydney") -> datetime | None:
@@ -31,8 +118,7 @@ def parse_message_date(date_str: str, tz: str = "Australia/Sydney") -> datetime
         datetime: The datetime object with timezone
     """
     try:
-        local_tz = pytz.timezone(tz)
-        return local_tz.localize(datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%S"))
+        return parse_local_datetime(date_str, tz)
     except (ValueError, TypeError) as e:
         logger.error(f"Error parsing date {date_str}: {e}")
         return None
@@ -0,0 +1,243 @@
+"""
+Local stand-in for the NSW Transport carpark API (api.transport.nsw.gov.au/v1/carpark).
+
+It serves a generated fleet with configurable size, latency, throttling (HTTP 429)
+and MessageDate staleness, and counts the calls it receives, so the app can be
+load tested offline.
+
+Usage:
+    python -m benchmarks.fake_nsw_api --fleet-size 200 --latency-ms 50 --port 8001
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+import pytz
+
+# Bounding box around Greater Sydney
+LAT_RANGE = (-34.2, -33.4)
+LNG_RANGE = (150.6, 151.4)
+
+
+class FakeNSWTransportAPI:
+    def __init__(
+        self,
+        fleet_size: int = 50,
+        latency_ms: float = 0,
+        throttle_rate: float = 0,
+        stale_fraction: float = 0.1,
+        max_requests_per_second: Optional[int] = None,
+        seed: int = 42,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        """
+        Initialize the fake NSW Transport API.
+
+        Parameters:
+            fleet_size (int): The number of facilities to serve
+            latency_ms (float): The latency added to every response
+            throttle_rate (float): The fraction of requests randomly answered with HTTP 429
+            stale_fraction (float): The fraction of facilities whose MessageDate is older than 24 hours
+            max_requests_per_second (int, optional): If set, requests above this rate get HTTP 429,
+                                                     like the real API throttle limit
+            seed (int): The random seed of the generated fleet
+            host (str): The host to listen on
+            port (int): The port to listen on, 0 picks a free port
+        """
+        self.latency_ms = latency_ms
+        self.throttle_rate = throttle_rate
+        self.max_requests_per_second = max_requests_per_second
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._second = 0
+        self._second_count = 0
+        self.calls: Dict[str, int] = {"list": 0, "details": 0, "throttled": 0, "not_found": 0}
+
+        self.facilities = {}
+        for i in range(1, fleet_size + 1):
+            self.facilities[str(i)] = {
+                "name": f"Park&Ride - Facility {i}",
+                "latitude": self._random.uniform(*LAT_RANGE),
+                "longitude": self._random.uniform(*LNG_RANGE),
+                "spots": self._random.choice([50, 100, 200, 500, 1000]),
+                "stale": self._random.random() < stale_fraction,
+            }
+
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """
+        The URL to use as NSW_TRANSPORT_BASE_API_URL.
+        """
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1/carpark"
+
+    @property
+    def total_calls(self) -> int:
+        """
+        The number of requests received (including throttled ones).
+        """
+        return sum(self.calls.values()) - self.calls["not_found"]
+
+    def reset_calls(self) -> None:
+        with self._lock:
+            for key in self.calls:
+                self.calls[key] = 0
+
+    def start(self) -> "FakeNSWTransportAPI":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-nsw-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _is_throttled(self) -> bool:
+        with self._lock:
+            if self.throttle_rate and self._random.random() < self.throttle_rate:
+                return True
+            if self.max_requests_per_second:
+                second = int(time.time())
+                if second != self._second:
+                    self._second, self._second_count = second, 0
+                self._second_count += 1
+                return self._second_count > self.max_requests_per_second
+        return False
+
+    def details(self, facility_id: str) -> Optional[Dict]:
+        """
+        Build the detail payload of a facility, in the shape of the real API.
+
+        Parameters:
+            facility_id (str): The facility ID
+
+        Returns:
+            dict: The facility details, or None if the facility does not exist
+        """
+        facility = self.facilities.get(facility_id)
+        if facility is None:
+            return None
+
+        now = datetime.now(pytz.timezone("Australia/Sydney")).replace(tzinfo=None)
+        message_date = now - (timedelta(days=2) if facility["stale"] else timedelta(minutes=2))
+        spots = facility["spots"]
+        total = self._random.randint(0, spots)
+        occupancy = {"loop": None, "total": str(total), "monthlies": None, "open_gate": None, "transients": None}
+        return {
+            "tsn": str(2000000 + int(facility_id)),
+            "time": str(int(time.time())),
+            "spots": str(spots),
+            "zones": [
+                {
+                    "spots": str(spots),
+                    "zone_id": facility_id,
+                    "occupancy": occupancy,
+                    "zone_name": facility["name"],
+                    "parent_zone_id": "0",
+                }
+            ],
+            "ParkID": "1",
+            "location": {
+                "suburb": "Sydney",
+                "address": f"{facility_id} Station Street",
+                "latitude": f"{facility['latitude']:.6f}",
+                "longitude": f"{facility['longitude']:.6f}",
+            },
+            "occupancy": occupancy,
+            "MessageDate": message_date.strftime("%Y-%m-%dT%H:%M:%S"),
+            "facility_id": facility_id,
+            "facility_name": facility["name"],
+            "tfnsw_facility_id": f"TFNSW-{facility_id}",
+        }
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, payload) -> None:
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if api.latency_ms:
+                    time.sleep(api.latency_ms / 1000)
+
+                if api._is_throttled():
+                    with api._lock:
+                        api.calls["throttled"] += 1
+                    return self._send(429, {"ErrorDetails": {"Message": "Rate limit exceeded"}})
+
+                url = urlparse(self.path)
+                if url.path.rstrip("/") != "/v1/carpark":
+                    return self._send(404, {"ErrorDetails": {"Message": "Not found"}})
+
+                facility_id = parse_qs(url.query).get("facility", [None])[0]
+                if facility_id is None:
+                    with api._lock:
+                        api.calls["list"] += 1
+                    return self._send(200, {fid: f["name"] for fid, f in api.facilities.items()})
+
+                with api._lock:
+                    api.calls["details"] += 1
+                details = api.details(facility_id)
+                if details is None:
+                    with api._lock:
+                        api.calls["not_found"] += 1
+                    return self._send(404, {"ErrorDetails": {"Message": "Facility not found"}})
+                return self._send(200, details)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stand-in of the NSW Transport carpark API")
+    parser.add_argument("--fleet-size", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--throttle-rate", type=float, default=0)
+    parser.add_argument("--stale-fraction", type=float, default=0.1)
+    parser.add_argument("--max-rps", type=int, default=None)
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+
+    api = FakeNSWTransportAPI(
+        fleet_size=args.fleet_size,
+        latency_ms=args.latency_ms,
+        throttle_rate=args.throttle_rate,
+        stale_fraction=args.stale_fraction,
+        max_requests_per_second=args.max_rps,
+        port=args.port,
+    )
+    print(f"Serving fake NSW Transport API on {api.base_url}")
+    try:
+        api.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+End-to-end load test of the Carpark Finder API against a local NSW Transport API stand-in.
+
+The fake upstream and the app (served by uvicorn) both run in this process, so the
+test is fully offline. It reports the latency percentiles, throughput and the number
+of upstream calls per request.
+
+Usage:
+    python -m benchmarks.loadtest --fleet-size 50 --concurrency 20 --requests 500 --scenario mixed
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.fake_nsw_api import LAT_RANGE, LNG_RANGE, FakeNSWTransportAPI
+
+API_TOKEN = "loadtest-token"
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Get a percentile with linear interpolation between the closest ranks.
+
+    Parameters:
+        values (List[float]): The values (do not need to be sorted)
+        q (float): The percentile, between 0 and 100
+
+    Returns:
+        float: The percentile value, 0.0 for an empty list
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize(latencies: List[float], statuses: Dict[int, int], elapsed: float, upstream_calls: int) -> Dict:
+    """
+    Build the load test report.
+
+    Parameters:
+        latencies (List[float]): The request latencies in seconds
+        statuses (dict): The number of responses per HTTP status
+        elapsed (float): The wall-clock duration of the run in seconds
+        upstream_calls (int): The number of calls the fake upstream received during the run
+
+    Returns:
+        dict: The report
+    """
+    count = len(latencies)
+    return {
+        "requests": count,
+        "statuses": {str(status): n for status, n in sorted(statuses.items())},
+        "throughput_rps": count / elapsed if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": max(latencies, default=0.0) * 1000,
+        },
+        "upstream_calls": upstream_calls,
+        "upstream_calls_per_request": upstream_calls / count if count else 0.0,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _request_path(scenario: str, rng: random.Random, facility_ids: List[str], radius_km: float) -> str:
+    if scenario == "mixed":
+        scenario = rng.choice(["nearby", "details"])
+    if scenario == "details":
+        return f"/carparks/{rng.choice(facility_ids)}"
+    lat, lng = rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE)
+    return f"/carparks/nearby?lat={lat:.5f}&lng={lng:.5f}&radius_km={radius_km}"
+
+
+async def drive(base_url: str, paths: List[str], concurrency: int):
+    """
+    Send the requests with at most `concurrency` requests in flight.
+
+    Returns:
+        tuple: (latencies in seconds, responses per HTTP status)
+    """
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    queue = list(reversed(paths))
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, headers={"X-API-Key": API_TOKEN}, limits=limits) as client:
+
+        async def worker():
+            while queue:
+                path = queue.pop()
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path, timeout=300)
+                    status = response.status_code
+                except httpx.HTTPError:
+                    status = 0
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses
+
+
+def run_loadtest(args) -> Dict:
+    """
+    Start the fake upstream and the app, warm the caches and run the load test.
+
+    Returns:
+        dict: The report, including the cold start (first request) latency
+    """
+    upstream = FakeNSWTransportAPI(
+        fleet_size=args.fleet_size,
+        latency_ms=args.latency_ms,
+        throttle_rate=args.throttle_rate,
+        stale_fraction=args.stale_fraction,
+        max_requests_per_second=args.upstream_max_rps,
+        seed=args.seed,
+    ).start()
+
+    # The app reads its settings at import time
+    os.environ["NSW_TRANSPORT_BASE_API_URL"] = upstream.base_url
+    os.environ["NSW_CARPARK_API_TOKEN"] = "fake-nsw-token"
+    os.environ["PUBLIC_API_TOKEN"] = API_TOKEN
+    os.environ["NSW_MAX_REQUESTS_PER_SECOND"] = str(args.app_max_upstream_rps)
+
+    import uvicorn
+
+    from app.core.rate_limit import rate_limiter
+    from app.main import app
+
+    logging.getLogger().setLevel(logging.WARNING)
+    # Measure the app, not the per API key rate limiter, unless asked to
+    if not args.keep_client_rate_limit:
+        rate_limiter.requests_per_second = float("inf")
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="loadtest-app", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    base_url = f"http://127.0.0.1:{port}"
+
+    try:
+        rng = random.Random(args.seed)
+        facility_ids = list(upstream.facilities)
+
+        # Cold start: the first request fills the caches
+        upstream.reset_calls()
+        cold_latencies, _ = asyncio.run(drive(base_url, [_request_path("nearby", rng, facility_ids, 5)], 1))
+        cold_upstream_calls = upstream.total_calls
+
+        paths = [_request_path(args.scenario, rng, facility_ids, args.radius_km) for _ in range(args.requests)]
+        upstream.reset_calls()
+        start = time.perf_counter()
+        latencies, statuses = asyncio.run(drive(base_url, paths, args.concurrency))
+        report = summarize(latencies, statuses, time.perf_counter() - start, upstream.total_calls)
+        report["upstream_throttled"] = upstream.calls["throttled"]
+        report["cold_start"] = {"latency_ms": cold_latencies[0] * 1000, "upstream_calls": cold_upstream_calls}
+        report["config"] = {
+            key: getattr(args, key)
+            for key in ("scenario", "fleet_size", "latency_ms", "throttle_rate", "stale_fraction", "concurrency")
+        }
+        return report
+    finally:
+        server.should_exit = True
+        thread.join()
+        upstream.stop()
+
+
+def print_report(report: Dict) -> None:
+    latency = report["latency_ms"]
+    print(f"Scenario:             {report['config']['scenario']} (fleet of {report['config']['fleet_size']})")
+    print(
+        f"Cold start:           {report['cold_start']['latency_ms']:.1f} ms, "
+        f"{report['cold_start']['upstream_calls']} upstream calls"
+    )
+    print(f"Requests:             {report['requests']} at concurrency {report['config']['concurrency']}")
+    print(f"Statuses:             {report['statuses']}")
+    print(f"Throughput:           {report['throughput_rps']:.1f} req/s")
+    print(
+        f"Latency:              p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms, "
+        f"p99 {latency['p99']:.1f} ms, max {latency['max']:.1f} ms"
+    )
+    print(
+        f"Upstream calls:       {report['upstream_calls']} ({report['upstream_calls_per_request']:.2f} per request, "
+        f"{report['upstream_throttled']} throttled)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Carpark Finder API against a fake NSW upstream")
+    parser.add_argument("--scenario", choices=["nearby", "details", "mixed"], default="mixed")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--radius-km", type=float, default=5)
+    parser.add_argument("--fleet-size", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=20, help="Latency of the fake upstream")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="Fraction of upstream calls answered with 429")
+    parser.add_argument("--stale-fraction", type=float, default=0.1, help="Fraction of facilities not updated in 24h")
+    parser.add_argument("--upstream-max-rps", type=int, default=None, help="Throttle limit of the fake upstream")
+    parser.add_argument("--app-max-upstream-rps", type=int, default=5, help="The app's own upstream throttle")
+    parser.add_argument("--keep-client-rate-limit", action="store_true", help="Keep the per API key rate limiter")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = run_loadtest(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,492 @@
+"""
+Microbenchmarks of the hot-path functions, with JSON baselines to catch regressions.
+
+Usage:
+    # run the benchmarks and print the results
+    python -m benchmarks.microbench run
+    # store (or refresh) a baseline
+    python -m benchmarks.microbench run --output benchmarks/baselines/baseline.json
+    # run and compare against a baseline, exit code 1 if anything (but the references) is >10% slower
+    python -m benchmarks.microbench run --compare benchmarks/baselines/baseline.json --threshold 0.10
+    # compare two stored result files
+    python -m benchmarks.microbench compare benchmarks/baselines/baseline.json current.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import timeit
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+from unittest.mock import patch
+
+# The app refuses to start without its API tokens
+os.environ.setdefault("NSW_CARPARK_API_TOKEN", "benchmark-token")
+os.environ.setdefault("PUBLIC_API_TOKEN", "benchmark-token")
+
+from benchmarks.fake_nsw_api import LAT_RANGE, LNG_RANGE  # noqa: E402
+
+FLEET_SIZES = (100, 1_000, 10_000, 100_000)
+
+# The reference implementations, timed to compare the optimized ones with: not checked for regressions
+REFERENCE_BENCHMARKS = ("parse_message_date_batch_strptime",)
+
+# Sydney CBD, the origin of the nearby queries
+ORIGIN = (-33.8688, 151.2093)
+
+# One event loop for all the async benchmarks, so that loop creation is not timed
+_loop = asyncio.new_event_loop()
+
+
+def generate_locations(size: int, seed: int = 42) -> Dict:
+    """
+    Generate a fleet in the shape returned by get_carpark_locations().
+
+    Parameters:
+        size (int): The number of carparks
+        seed (int): The random seed
+
+    Returns:
+        dict: {"carparks": [{"facility_id", "name", "location": {"latitude", "longitude"}}]}
+    """
+    rng = random.Random(seed)
+    return {
+        "carparks": [
+            {
+                "facility_id": str(i),
+                "name": f"Park&Ride - Facility {i}",
+                "location": {"latitude": rng.uniform(*LAT_RANGE), "longitude": rng.uniform(*LNG_RANGE)},
+            }
+            for i in range(1, size + 1)
+        ]
+    }
+
+
+def bench_haversine_distance() -> Callable:
+    from app.utils.distance import haversine_distance
+
+    lat, lng = ORIGIN
+    return lambda: haversine_distance(lat, lng, -33.8150, 151.0011)
+
+
+def bench_parse_message_date() -> Callable:
+    from app.utils.time_utils import parse_message_date
+
+    return lambda: parse_message_date("2025-06-12T10:00:00")
+
+
+def generate_message_dates(size: int, seed: int = 42) -> List[str]:
+    """
+    Generate the MessageDate strings of a fleet sweep: one per facility, spread over the last two days.
+    """
+    rng = random.Random(seed)
+    start = datetime(2025, 6, 10).timestamp()
+    return [
+        datetime.fromtimestamp(start + rng.randrange(2 * 24 * 3600)).strftime("%Y-%m-%dT%H:%M:%S") for _ in range(size)
+    ]
+
+
+def bench_parse_message_date_batch(size: int, cold: bool = False) -> Callable:
+    """
+    The MessageDate parsing of a sweep of the fleet. Warm: the dates were parsed by
+    the previous sweep (facilities not updated since); cold: every date is new.
+    """
+    from app.utils.time_utils import parse_local_datetime, parse_message_date
+
+    dates = generate_message_dates(size)
+
+    def run():
+        if cold:
+            parse_local_datetime.cache_clear()
+        return [parse_message_date(date) for date in dates]
+
+    return run
+
+
+def bench_parse_message_date_batch_strptime(size: int) -> Callable:
+    """
+    The reference for the batch benchmarks: timezone lookup and strptime on every call.
+    """
+    import pytz
+
+    dates = generate_message_dates(size)
+
+    def run():
+        return [pytz.timezone("Australia/Sydney").localize(datetime.strptime(d, "%Y-%m-%dT%H:%M:%S")) for d in dates]
+
+    return run
+
+
+def bench_is_carpark_no_update() -> Callable:
+    from app.services.nsw_transport_api import is_carpark_no_update
+    from app.utils.time_utils import get_local_time
+
+    details = {"MessageDate": "2025-06-12T10:00:00"}
+    now = get_local_time()
+    return lambda: is_carpark_no_update(details, now)
+
+
+def bench_available_status() -> Callable:
+    from app.services.nsw_transport_api import available_status
+
+    return lambda: available_status(100, 95)
+
+
+def bench_is_rate_limited() -> Callable:
+    from app.core.rate_limit import SimpleRateLimiter
+
+    limiter = SimpleRateLimiter(requests_per_second=10**9)
+    keys = [f"key-{i}" for i in range(100)]
+    index = iter(range(10**12))
+    return lambda: limiter.is_rate_limited(keys[next(index) % 100])
+
+
+def snapshot_of(locations: Dict) -> Callable:
+    """
+    Build the fleet snapshot of generated locations once, and return a get_fleet_snapshot replacement serving it.
+    """
+    from app.services.fleet_snapshot import build_fleet_snapshot
+
+    snapshot = build_fleet_snapshot(locations, carpark_ids={}, no_update=())
+
+    async def get_fleet_snapshot():
+        return snapshot
+
+    return get_fleet_snapshot
+
+
+def bench_nearby_build(size: int) -> Callable:
+    """
+    The /nearby handler: distance filter and Carpark construction over the fleet.
+    """
+    from app.api.v1.endpoints import carpark
+
+    get_fleet_snapshot = snapshot_of(generate_locations(size))
+    lat, lng = ORIGIN
+
+    def run():
+        with patch.object(carpark, "get_fleet_snapshot", new=get_fleet_snapshot):
+            return _loop.run_until_complete(
+                carpark.get_nearby_carparks(
+                    lat=lat, lng=lng, radius_km=10, k=None, min_available=None, status=None, api_key="benchmark"
+                )
+            )
+
+    return run
+
+
+def bench_nearby_k(size: int, k: int = 5) -> Callable:
+    """
+    The /nearby handler in k nearest mode.
+    """
+    from app.api.v1.endpoints import carpark
+
+    get_fleet_snapshot = snapshot_of(generate_locations(size))
+    lat, lng = ORIGIN
+
+    def run():
+        with patch.object(carpark, "get_fleet_snapshot", new=get_fleet_snapshot):
+            return _loop.run_until_complete(
+                carpark.get_nearby_carparks(
+                    lat=lat, lng=lng, radius_km=None, k=k, min_available=None, status=None, api_key="benchmark"
+                )
+            )
+
+    return run
+
+
+def bench_nearest(size: int, k: int = 5) -> Callable:
+    """
+    The k nearest search of the location index alone.
+    """
+    from app.services.location_index import LocationIndex
+
+    index = LocationIndex(generate_locations(size)["carparks"])
+    lat, lng = ORIGIN
+    return lambda: index.nearest(lat, lng, k)
+
+
+def bench_nearby_batch(size: int, origins: int = 50) -> Callable:
+    """
+    The batch nearby handler: the carparks within 2km of each station of a line from Parramatta to the CBD.
+    """
+    from app.api.v1.endpoints import carpark
+    from app.models.schemas import NearbyBatchRequest
+
+    get_fleet_snapshot = snapshot_of(generate_locations(size))
+    (start_lat, start_lng), (end_lat, end_lng) = (-33.8170, 151.0034), ORIGIN
+    request = NearbyBatchRequest(
+        origins=[
+            {
+                "lat": start_lat + (end_lat - start_lat) * i / origins,
+                "lng": start_lng + (end_lng - start_lng) * i / origins,
+                "radius_km": 2,
+            }
+            for i in range(origins)
+        ]
+    )
+
+    def run():
+        with patch.object(carpark, "get_fleet_snapshot", new=get_fleet_snapshot):
+            return _loop.run_until_complete(carpark.get_nearby_carparks_batch(request=request, api_key="benchmark"))
+
+    return run
+
+
+def bench_nearby_serialize(size: int) -> Callable:
+    """
+    The /nearby response: response model validation and JSON encoding of the results.
+    """
+    from typing import List as ListType
+
+    from pydantic import TypeAdapter
+
+    from app.api.v1.endpoints import carpark
+    from app.models.schemas import Carpark
+
+    get_fleet_snapshot = snapshot_of(generate_locations(size))
+    lat, lng = ORIGIN
+    with patch.object(carpark, "get_fleet_snapshot", new=get_fleet_snapshot):
+        results = _loop.run_until_complete(
+            carpark.get_nearby_carparks(
+                lat=lat, lng=lng, radius_km=10, k=None, min_available=None, status=None, api_key="benchmark"
+            )
+        )
+    adapter = TypeAdapter(ListType[Carpark])
+    return lambda: json.dumps(adapter.dump_python(adapter.validate_python(results), mode="json")).encode()
+
+
+def bench_carpark_details(cached: bool = True) -> Callable:
+    """
+    The /carparks/{facility_id} handler for polled details with zones: served from the encoded
+    response cache, or built and encoded on every call (cached=False).
+    """
+    from app.api.v1.endpoints import carpark
+    from app.services.response_cache import detail_responses
+
+    details = {
+        "facility_id": "111",
+        "facility_name": "Benchmark carpark",
+        "spots": "500",
+        "occupancy": {"total": "320"},
+        "MessageDate": "2025-06-12T10:00:00",
+        "zones": [
+            {"zone_id": str(i), "zone_name": f"Level {i}", "spots": "100", "occupancy": {"total": "64"}}
+            for i in range(1, 6)
+        ],
+    }
+
+    def run():
+        if not cached:
+            detail_responses.forget("111")
+        with patch.object(carpark, "get_polled_details", new=lambda facility_id: details):
+            return _loop.run_until_complete(
+                carpark.get_carpark_available_details(facility_id="111", api_key="benchmark", request=None)
+            )
+
+    return run
+
+
+def collect_benchmarks(sizes: Tuple[int, ...]) -> List[Tuple[str, Callable[[], Callable]]]:
+    """
+    List the benchmarks as (name, setup) pairs; setup returns the callable to time.
+    """
+    benchmarks = [
+        ("haversine_distance", bench_haversine_distance),
+        ("parse_message_date", bench_parse_message_date),
+        ("is_carpark_no_update", bench_is_carpark_no_update),
+        ("available_status", bench_available_status),
+        ("SimpleRateLimiter.is_rate_limited", bench_is_rate_limited),
+        ("carpark_details", bench_carpark_details),
+        ("carpark_details_uncached", lambda: bench_carpark_details(cached=False)),
+    ]
+    for size in sizes:
+        benchmarks.append(
+            (f"parse_message_date_batch[n={size}]", lambda size=size: bench_parse_message_date_batch(size))
+        )
+        benchmarks.append(
+            (
+                f"parse_message_date_batch_cold[n={size}]",
+                lambda size=size: bench_parse_message_date_batch(size, cold=True),
+            )
+        )
+        benchmarks.append(
+            (
+                f"parse_message_date_batch_strptime[n={size}]",
+                lambda size=size: bench_parse_message_date_batch_strptime(size),
+            )
+        )
+        benchmarks.append((f"nearby_build[n={size}]", lambda size=size: bench_nearby_build(size)))
+        benchmarks.append((f"nearby_serialize[n={size}]", lambda size=size: bench_nearby_serialize(size)))
+        benchmarks.append((f"nearby_batch[n={size}]", lambda size=size: bench_nearby_batch(size)))
+        benchmarks.append((f"nearby_k[n={size}]", lambda size=size: bench_nearby_k(size)))
+        benchmarks.append((f"nearest[n={size}]", lambda size=size: bench_nearest(size)))
+    return benchmarks
+
+
+def measure(func: Callable, repeat: int = 5, min_time: float = 0.2) -> Dict:
+    """
+    Time a callable: calibrate the number of loops to run for at least min_time,
+    then run it `repeat` times. The median of the runs is compared against the baseline
+    (a single disturbed or lucky run does not move it), the best is kept for reference.
+
+    Returns:
+        dict: {"seconds_per_op": float (median), "best_seconds_per_op": float, "loops": int, "repeat": int}
+    """
+    timer = timeit.Timer(func)
+    loops = 1
+    while True:
+        elapsed = timer.timeit(loops)
+        if elapsed >= min_time:
+            break
+        loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9) * 1.2))
+    runs = [elapsed] + timer.repeat(repeat=repeat - 1, number=loops)
+    return {
+        "seconds_per_op": statistics.median(runs) / loops,
+        "best_seconds_per_op": min(runs) / loops,
+        "loops": loops,
+        "repeat": repeat,
+    }
+
+
+def run_benchmarks(name_filter: str = "", sizes: Tuple[int, ...] = FLEET_SIZES, repeat: int = 5) -> Dict:
+    """
+    Run the benchmarks whose name contains name_filter.
+
+    Returns:
+        dict: {"meta": {...}, "results": {name: measurement}}
+    """
+    results = {}
+    for name, setup in collect_benchmarks(sizes):
+        if name_filter and name_filter not in name:
+            continue
+        results[name] = measure(setup(), repeat=repeat)
+        print(f"{name:45s} {format_seconds(results[name]['seconds_per_op'])}", file=sys.stderr)
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def format_seconds(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:10.3f} {unit}"
+    return f"{seconds / 1e-9:10.1f} ns"
+
+
+def is_reference(name: str) -> bool:
+    """
+    Whether a benchmark times a reference implementation (see REFERENCE_BENCHMARKS).
+    """
+    return name.split("[")[0] in REFERENCE_BENCHMARKS
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = 0.10) -> List[Dict]:
+    """
+    Compare benchmark results against a baseline.
+
+    Parameters:
+        baseline (dict): The baseline results
+        current (dict): The current results
+        threshold (float): The relative slowdown flagged as a regression (0.10 = 10%)
+
+    Returns:
+        List[dict]: One row per benchmark present in both, with the ratio current/baseline
+                    and whether it is a regression (never for the reference benchmarks)
+    """
+    rows = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["seconds_per_op"]
+        after = result["seconds_per_op"]
+        ratio = after / before if before else float("inf")
+        reference = is_reference(name)
+        rows.append(
+            {
+                "name": name,
+                "baseline": before,
+                "current": after,
+                "ratio": ratio,
+                "reference": reference,
+                "regression": not reference and ratio > 1 + threshold,
+            }
+        )
+    return rows
+
+
+def missing_from_baseline(baseline: Dict, current: Dict) -> List[str]:
+    """
+    List the benchmarks which the baseline has no result for, and which are not compared:
+    the baseline must be refreshed when a benchmark is added.
+    """
+    return sorted(name for name in current["results"] if name not in baseline["results"])
+
+
+def print_comparison(rows: List[Dict]) -> None:
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else "(reference)" if row["reference"] else ""
+        print(
+            f"{row['name']:45s} {format_seconds(row['baseline'])} -> {format_seconds(row['current'])}"
+            f"  x{row['ratio']:.2f} {flag}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the hot-path functions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=list(FLEET_SIZES), help="Fleet sizes")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--output", help="Write the results (e.g. a new baseline) to this JSON file")
+    run_parser.add_argument("--compare", help="Compare the results against this baseline JSON file")
+    run_parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown flagged as regression")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        current = run_benchmarks(args.filter, tuple(args.sizes), args.repeat)
+        if args.output:
+            os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+            with open(args.output, "w") as f:
+                json.dump(current, f, indent=2)
+        if not args.compare:
+            return
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+
+    rows = compare(baseline, current, args.threshold)
+    print_comparison(rows)
+    for name in missing_from_baseline(baseline, current):
+        print(f"{name:45s} not in the baseline, not compared")
+    if any(row["regression"] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    # Keep the benchmark output readable: the handlers log at INFO level
+    import logging
+
+    logging.disable(logging.INFO)
+    main()
@@ -0,0 +1,30 @@
+"""
+Production entry point: a preforking server.
+
+The app is imported and the fleet snapshot warmed once in the master process, then
+the workers are forked and share it copy-on-write. The snapshot is refreshed and the
+workers re-forked every SNAPSHOT_REFRESH_INTERVAL seconds, or on SIGHUP.
+
+Usage:
+    python serve.py --host 0.0.0.0 --port 8000 --workers 4
+"""
+
+import argparse
+
+from app.core.config import SERVER_WORKERS, SNAPSHOT_REFRESH_INTERVAL
+from app.core.prefork import PreforkServer, share_upstream_budget
+from app.main import app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the API with preforked workers")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    parser.add_argument("--refresh-interval", type=float, default=SNAPSHOT_REFRESH_INTERVAL, help="Seconds")
+    args = parser.parse_args()
+
+    # The master (sweeps) and the workers split the NSW throttle limit
+    share_upstream_budget(args.workers + 1)
+    PreforkServer(
+        app, host=args.host, port=args.port, workers=args.workers, refresh_interval=args.refresh_interval
+    ).serve()
@@ -1,6 +1,6 @@
 # provide mock data for testing
 
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 import pytest
 from fastapi.testclient import TestClient
@@ -22,6 +22,79 @@ def reset_rate_limiter():
     rate_limiter.requests.clear()
 
 
+@pytest.fixture(autouse=True)
+def reset_upstream_throttle():
+    """
+    Reset the upstream throttle before each test
+    This is to ensure that the requests made by the previous tests
+    do not make the next requests wait for a free slot
+    """
+    from app.services.nsw_transport_api import upstream_throttle
+
+    upstream_throttle.reset()
+
+
+@pytest.fixture(autouse=True)
+def reset_upstream_state():
+    """
+    Reset the circuit breaker, the last known snapshots and availability, the staleness records, the polling schedules,
+    the occupancy history and forecasts, the parsed zones and encoded responses, the sweep progress, the change log and the fleet snapshot before each test
+    This is to ensure that failures or data recorded by the previous tests
+    do not open the circuit, get served as stale data or skip facility checks
+    """
+    from app.services.availability_service import availability_store
+    from app.services.cache_service import last_known_details, last_known_fleet
+    from app.services.change_log import change_log
+    from app.services.fleet_snapshot import fleet_snapshots
+    from app.services.nsw_transport_api import upstream_breaker
+    from app.services.occupancy_forecast import occupancy_forecaster
+    from app.services.occupancy_history import occupancy_history
+    from app.services.polling_scheduler import polling_scheduler
+    from app.services.response_cache import detail_responses, no_update_responses
+    from app.services.staleness_tracker import staleness_tracker
+    from app.services.sweep_progress import sweep_progress
+    from app.services.zone_service import zone_cache
+
+    upstream_breaker.reset()
+    last_known_details.clear()
+    availability_store.clear()
+    last_known_fleet.clear()
+    staleness_tracker.clear()
+    polling_scheduler.clear()
+    occupancy_history.clear()
+    occupancy_forecaster.clear()
+    zone_cache.clear()
+    detail_responses.clear()
+    no_update_responses.clear()
+    sweep_progress.clear()
+    change_log.clear()
+    fleet_snapshots.clear()
+
+
+@pytest.fixture(autouse=True)
+def offline_geocoder():
+    """
+    Replace the geocoder with an offline stand-in and keep its cache in memory,
+    so that the tests never call a geocoding provider
+    """
+    from app.services.geocoding_service import StaticGeocoder, geocoding_service
+
+    geocoding_service.clear()
+    geocoder = StaticGeocoder({"Central Station, Sydney": (-33.8832, 151.2070)})
+    with patch.object(geocoding_service, "geocoder", geocoder), patch.object(geocoding_service, "path", ""):
+        yield geocoder
+
+
+@pytest.fixture(autouse=True)
+def cold_no_update_carparks():
+    """
+    Answer the no-update check of the details requests of a cold process (no fleet snapshot loaded)
+    with no facility, so that the tests never sweep the NSW API for it
+    """
+    with patch("app.api.v1.endpoints.carpark.get_no_update_carparks", return_value=set()) as get_no_update_carparks:
+        yield get_no_update_carparks
+
+
 @pytest.fixture
 def test_client():
     """
@@ -0,0 +1,160 @@
+# test the admin endpoints
+
+from unittest.mock import patch
+
+import pytest
+
+from app.services.admin_service import FLEET_CACHES, invalidate_cache
+from app.services.availability_service import availability_store
+from app.services.cache_service import (
+    carpark_locations_cache,
+    last_known_details,
+    last_known_fleet,
+    no_update_carparks_cache,
+)
+from app.services.fleet_snapshot import build_fleet_snapshot, fleet_snapshots
+from app.services.nsw_transport_api import get_carpark_locations
+from app.services.staleness_tracker import staleness_tracker
+from app.services.sweep_progress import sweep_progress
+from app.utils.time_utils import get_local_time
+
+ADMIN_HEADERS = {"X-Admin-Token": "admin-token"}
+
+
+@pytest.fixture(autouse=True)
+def admin_token():
+    """
+    Enable the admin API with a known token, and empty the fleet caches filled by the tests
+    """
+    with patch("app.core.security.ADMIN_API_TOKEN", "admin-token"):
+        yield
+    for cache in FLEET_CACHES.values():
+        cache.clear()
+
+
+def test_admin_requires_token(test_client):
+    """
+    Test the admin authentication.
+
+    This test verifies that the admin endpoints reject a missing or invalid token, and the public API key,
+    and are disabled when no admin token is configured.
+    """
+    assert test_client.get("/admin/status").status_code == 403
+    assert test_client.get("/admin/status", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert test_client.get("/admin/status", headers={"X-API-Key": "y"}).status_code == 403
+    assert test_client.get("/admin/status", headers=ADMIN_HEADERS).status_code == 200
+
+    with patch("app.core.security.ADMIN_API_TOKEN", None):
+        response = test_client.get("/admin/status", headers=ADMIN_HEADERS)
+    assert response.status_code == 403
+    assert response.json()["detail"] == "The admin API is disabled."
+
+
+def test_admin_status(test_client):
+    """
+    Test the /admin/status endpoint.
+
+    This test verifies that the status reports the statistics of every fleet cache.
+    """
+    carpark_locations_cache[()] = {"carparks": []}
+
+    response = test_client.get("/admin/status", headers=ADMIN_HEADERS)
+
+    assert response.status_code == 200
+    caches = response.json()["caches"]
+    assert set(caches) == {"carpark_ids", "carpark_locations", "no_update_carparks"}
+    assert caches["carpark_locations"]["entries"] == 1
+    assert response.json()["sweeps_paused"] is False
+
+
+def test_invalidate_cache(test_client):
+    """
+    Test the /admin/caches/{name}/invalidate endpoint.
+
+    This test verifies that a fleet cache, or all of them, can be invalidated, that the fleet snapshot
+    is then rebuilt in the background, and that unknown caches are rejected.
+    """
+    carpark_locations_cache[()] = {"carparks": []}
+
+    with patch("app.api.v1.endpoints.admin.start_warmup") as start_warmup:
+        response = test_client.post("/admin/caches/carpark_locations/invalidate", headers=ADMIN_HEADERS)
+        assert response.status_code == 200
+        assert response.json()["caches"]["carpark_locations"]["entries"] == 0
+        start_warmup.assert_called_once_with(force=True)
+
+        carpark_locations_cache[()] = {"carparks": []}
+        assert test_client.post("/admin/caches/all/invalidate", headers=ADMIN_HEADERS).status_code == 200
+        assert len(carpark_locations_cache) == 0
+        assert start_warmup.call_count == 2
+
+        assert test_client.post("/admin/caches/unknown/invalidate", headers=ADMIN_HEADERS).status_code == 404
+        assert start_warmup.call_count == 2
+
+    with patch("app.services.admin_service.start_warmup") as start_warmup:
+        assert invalidate_cache("carpark_ids") == 0
+        start_warmup.assert_called_once_with(force=True)
+
+
+def test_invalidate_facility(test_client, mock_carpark_details):
+    """
+    Test the /admin/facilities/{facility_id}/invalidate endpoint.
+
+    This test verifies that the last known details, the availability and the no-update status of the facility
+    are dropped, also from the fleet snapshot, so that it is served again and the next sweep checks it again.
+    """
+    last_known_details.put("111", mock_carpark_details)
+    staleness_tracker.update("111", None, True, get_local_time())
+    last_known_fleet.put("no_update_carparks", {"111", "222"})
+    no_update_carparks_cache["sweep"] = {"111", "222"}
+    availability_store.update("111", {"spots": "100", "occupancy": {"total": "60"}})
+    fleet_snapshots.publish(build_fleet_snapshot({"carparks": []}))
+
+    response = test_client.post("/admin/facilities/111/invalidate", headers=ADMIN_HEADERS)
+
+    assert response.status_code == 200
+    assert last_known_details.get("111") is None
+    assert staleness_tracker.get("111") is None
+    assert last_known_fleet.get("no_update_carparks").value == {"222"}
+    assert len(no_update_carparks_cache) == 0
+    assert fleet_snapshots.current().no_update == frozenset({"222"})
+    assert "111" not in fleet_snapshots.current().availability
+
+
+def test_warmup(test_client):
+    """
+    Test the /admin/warmup endpoint.
+
+    This test verifies that a warmup is started even if the snapshot is loaded, after invalidating the caches
+    if requested.
+    """
+    last_known_fleet.put("carpark_locations", {"carparks": []})
+    carpark_locations_cache[()] = {"carparks": []}
+
+    with patch("app.api.v1.endpoints.admin.start_warmup") as start_warmup:
+        response = test_client.post("/admin/warmup?invalidate=true", headers=ADMIN_HEADERS)
+
+    assert response.status_code == 202
+    start_warmup.assert_called_once_with(force=True)
+    assert len(carpark_locations_cache) == 0
+
+
+def test_pause_and_resume_sweeps(test_client, mock_carpark_locations):
+    """
+    Test the /admin/sweeps/pause and /admin/sweeps/resume endpoints.
+
+    This test verifies that no sweep runs while the sweeps are paused: the last known locations are served.
+    """
+    last_known_fleet.put("carpark_locations", mock_carpark_locations)
+
+    response = test_client.post("/admin/sweeps/pause", headers=ADMIN_HEADERS)
+    assert response.status_code == 200
+    assert response.json()["sweeps_paused"] is True
+
+    with patch("app.services.nsw_transport_api.get_all_carpark_ids") as get_all_carpark_ids:
+        locations = get_carpark_locations()
+    get_all_carpark_ids.assert_not_called()
+    assert locations == {**mock_carpark_locations, "stale": True}
+
+    response = test_client.post("/admin/sweeps/resume", headers=ADMIN_HEADERS)
+    assert response.json()["sweeps_paused"] is False
+    assert not sweep_progress.paused
@@ -0,0 +1,103 @@
+# test the availability store
+
+from app.services.availability_service import AvailabilitySnapshot, AvailabilityStore
+
+
+def test_availability_store_update():
+    """
+    Test the AvailabilityStore.update method.
+
+    This test verifies that the available spots and status are parsed from the details,
+    and that invalid details are not recorded.
+    """
+    store = AvailabilityStore()
+
+    availability = store.update("111", {"spots": "100", "occupancy": {"total": "95"}}, now=1000.0)
+
+    assert availability.available_spots == 5
+    assert availability.status == "Almost Full"
+    assert store.get(111) == availability
+    assert store.update("222", {"spots": "n/a", "occupancy": {"total": "1"}}) is None
+    assert store.get("222") is None
+
+
+def test_availability_store_matcher():
+    """
+    Test the AvailabilityStore.matcher method.
+
+    This test verifies that the facilities are matched on their available spots and status,
+    that the facilities with an unknown availability never match, and that no conditions means no filter.
+    """
+    store = AvailabilityStore()
+    store.update("1", {"spots": "100", "occupancy": {"total": "10"}})
+    store.update("2", {"spots": "100", "occupancy": {"total": "95"}})
+    store.update("3", {"spots": "100", "occupancy": {"total": "100"}})
+
+    assert store.matcher() is None
+
+    with_space = store.matcher(min_available=1)
+    assert [facility_id for facility_id in ("1", "2", "3", "4") if with_space(facility_id)] == ["1", "2"]
+
+    not_full = store.matcher(statuses=["Available", "Almost Full"])
+    assert [facility_id for facility_id in ("1", "2", "3", "4") if not_full(facility_id)] == ["1", "2"]
+
+    plenty = store.matcher(min_available=10, statuses=["Available", "Almost Full"])
+    assert [facility_id for facility_id in ("1", "2", "3", "4") if plenty(facility_id)] == ["1"]
+
+
+def test_availability_store_changes_since():
+    """
+    Test the AvailabilityStore.changes_since method.
+
+    This test verifies that only the facilities whose availability changed after a revision are returned,
+    with None for a forgotten facility, and that a revision from before a clear returns None.
+    """
+    store = AvailabilityStore()
+    store.update("1", {"spots": "100", "occupancy": {"total": "10"}})
+    store.update("2", {"spots": "100", "occupancy": {"total": "20"}})
+    revision = store.revision
+
+    store.update("2", {"spots": "100", "occupancy": {"total": "20"}})
+    assert store.changes_since(revision) == (revision, {})
+
+    store.update("1", {"spots": "100", "occupancy": {"total": "50"}})
+    store.forget("2")
+    current, changes = store.changes_since(revision)
+    assert current == store.revision == revision + 2
+    assert changes == {"1": store.get("1"), "2": None}
+
+    store.clear()
+    assert store.changes_since(revision) == (store.revision, None)
+    assert store.changes_since(store.revision) == (store.revision, {})
+
+
+def test_availability_snapshot_updated():
+    """
+    Test the AvailabilitySnapshot.updated method.
+
+    This test verifies that an updated snapshot has the changes and the base it shares, that the previous
+    snapshot is unchanged, and that the changes are merged into a new base once they outnumber its square root.
+    """
+    store = AvailabilityStore()
+    for facility_id in range(100):
+        store.update(str(facility_id), {"spots": "100", "occupancy": {"total": "10"}})
+    snapshot = AvailabilitySnapshot(store.copy())
+    revision = store.revision
+
+    store.update("1", {"spots": "100", "occupancy": {"total": "100"}})
+    store.update("new", {"spots": "10", "occupancy": {"total": "0"}})
+    store.forget("2")
+    updated = snapshot.updated(store.changes_since(revision)[1])
+
+    assert updated._base is snapshot._base
+    assert updated["1"].status == "Full"
+    assert updated.get("new").available_spots == 10
+    assert "2" not in updated and updated.get("2") is None
+    assert len(updated) == 100
+    assert dict(updated) == store.copy()
+    assert snapshot["1"].status == "Available" and "new" not in snapshot and "2" in snapshot
+
+    merged = snapshot.updated({str(facility_id): None for facility_id in range(65)})
+    assert merged._base is not snapshot._base
+    assert merged._changes == {}
+    assert len(merged) == 35
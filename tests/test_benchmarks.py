@@ -0,0 +1,130 @@
+# test the load test harness and the microbenchmarks in benchmarks/
+# check if the fake NSW Transport API serves the fleet like the real API
+# check if the report computes the percentiles correctly
+# check if the microbenchmark comparison flags regressions
+
+import requests
+
+from benchmarks.fake_nsw_api import FakeNSWTransportAPI
+from benchmarks.loadtest import percentile, summarize
+from benchmarks.microbench import compare, generate_locations, measure, missing_from_baseline
+
+
+def test_percentile():
+    """
+    Test the percentile function.
+
+    This test verifies the interpolated percentiles and the empty list case.
+    """
+    values = [float(v) for v in range(1, 101)]
+
+    assert percentile(values, 50) == 50.5
+    assert percentile(values, 99) == 99.01
+    assert percentile([], 95) == 0.0
+
+
+def test_summarize():
+    """
+    Test the summarize function.
+
+    This test verifies the throughput and the upstream calls per request of the report.
+    """
+    report = summarize([0.1, 0.2, 0.3, 0.4], {200: 3, 429: 1}, elapsed=2.0, upstream_calls=2)
+
+    assert report["requests"] == 4
+    assert report["statuses"] == {"200": 3, "429": 1}
+    assert report["throughput_rps"] == 2.0
+    assert report["upstream_calls_per_request"] == 0.5
+
+
+def test_fake_nsw_api_serves_fleet():
+    """
+    Test the FakeNSWTransportAPI.
+
+    This test verifies that the fake serves the facility list and the facility details,
+    and counts the calls it receives.
+    """
+    with FakeNSWTransportAPI(fleet_size=3, stale_fraction=1.0) as api:
+        facilities = requests.get(api.base_url, timeout=5).json()
+        details = requests.get(f"{api.base_url}?facility=2", timeout=5).json()
+        missing = requests.get(f"{api.base_url}?facility=999", timeout=5)
+
+    assert list(facilities) == ["1", "2", "3"]
+    assert details["facility_id"] == "2"
+    assert {"spots", "occupancy", "location", "MessageDate", "zones"} <= set(details)
+    assert missing.status_code == 404
+    assert api.calls["list"] == 1
+    assert api.calls["details"] == 2
+
+
+def test_fake_nsw_api_throttle():
+    """
+    Test the FakeNSWTransportAPI.
+
+    This test verifies that the requests are answered with HTTP 429 when the throttle is injected.
+    """
+    with FakeNSWTransportAPI(fleet_size=1, throttle_rate=1.0) as api:
+        response = requests.get(api.base_url, timeout=5)
+
+    assert response.status_code == 429
+    assert api.calls["throttled"] == 1
+
+
+def test_microbench_compare_flags_regressions():
+    """
+    Test the compare function.
+
+    This test verifies that only the benchmarks slower than the threshold are flagged,
+    that the reference benchmarks are never flagged, and that benchmarks missing from the baseline
+    are not compared but reported.
+    """
+    reference = "parse_message_date_batch_strptime[n=100]"
+    baseline = {
+        "results": {
+            "fast": {"seconds_per_op": 1.0},
+            "slow": {"seconds_per_op": 1.0},
+            reference: {"seconds_per_op": 1.0},
+        }
+    }
+    current = {
+        "results": {
+            "fast": {"seconds_per_op": 1.05},
+            "slow": {"seconds_per_op": 1.5},
+            reference: {"seconds_per_op": 1.5},
+            "new": {"seconds_per_op": 1.0},
+        }
+    }
+
+    rows = {row["name"]: row for row in compare(baseline, current, threshold=0.10)}
+
+    assert set(rows) == {"fast", "slow", reference}
+    assert rows["fast"]["regression"] is False
+    assert rows["slow"]["regression"] is True
+    assert rows["slow"]["ratio"] == 1.5
+    assert rows[reference]["reference"] is True
+    assert rows[reference]["regression"] is False
+    assert missing_from_baseline(baseline, current) == ["new"]
+
+
+def test_microbench_measure():
+    """
+    Test the measure function.
+
+    This test verifies that the callable is timed over enough loops, and that the median of the runs is kept.
+    """
+    result = measure(lambda: None, repeat=3, min_time=0.001)
+
+    assert result["loops"] > 1
+    assert result["seconds_per_op"] >= result["best_seconds_per_op"] > 0
+
+
+def test_generate_locations():
+    """
+    Test the generate_locations function.
+
+    This test verifies that the generated fleet has the shape returned by get_carpark_locations().
+    """
+    locations = generate_locations(10)
+
+    assert len(locations["carparks"]) == 10
+    assert set(locations["carparks"][0]) == {"facility_id", "name", "location"}
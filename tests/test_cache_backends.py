@@ -0,0 +1,250 @@
+# test the cache backends
+
+import pickle
+import sqlite3
+from unittest.mock import MagicMock, patch
+
+import pytest
+from cachetools import cached
+
+from app.core.config import CacheConfig, CacheSettings
+from app.core.metrics import cache_entries, cache_evictions_total
+from app.services.cache_backends import FakeRedis, MeteredTTLCache, RedisCache, SQLiteCache, dumps, loads
+from app.services.cache_service import create_cache
+
+
+def test_sqlite_cache_shared_between_workers(tmp_path):
+    """
+    Test the SQLiteCache class.
+
+    This test verifies that an entry cached by one worker (connection) is a hit for the other
+    workers sharing the database, so that one worker's sweep warms all of them.
+
+    Parameters:
+        tmp_path: the pytest temporary directory
+    """
+    path = str(tmp_path / "cache.sqlite3")
+    worker_1 = SQLiteCache("carpark_ids", maxsize=10, ttl=60, path=path)
+    worker_2 = SQLiteCache("carpark_ids", maxsize=10, ttl=60, path=path)
+    sweep = MagicMock(return_value={"111": "carpark_1"})
+
+    assert cached(worker_1)(sweep)() == {"111": "carpark_1"}
+    assert cached(worker_2)(sweep)() == {"111": "carpark_1"}
+    assert sweep.call_count == 1
+
+    # caches with another name do not share the entries
+    assert len(SQLiteCache("carpark_locations", maxsize=10, ttl=60, path=path)) == 0
+
+
+def test_sqlite_cache_expiry_and_maxsize(tmp_path):
+    """
+    Test the SQLiteCache class.
+
+    This test verifies that the entries expire after the TTL, and that the cache keeps at most maxsize entries.
+
+    Parameters:
+        tmp_path: the pytest temporary directory
+    """
+    cache = SQLiteCache("test", maxsize=2, ttl=60, path=str(tmp_path / "cache.sqlite3"))
+    with patch("app.services.cache_backends.time.time", return_value=1000.0):
+        cache["a"] = 1
+    with patch("app.services.cache_backends.time.time", return_value=1001.0):
+        cache["b"] = 2
+        cache["c"] = 3
+        assert len(cache) == 2
+        assert "a" not in cache
+        assert cache["c"] == 3
+    with patch("app.services.cache_backends.time.time", return_value=1100.0):
+        with pytest.raises(KeyError):
+            cache["c"]
+
+
+def test_json_serialization():
+    """
+    Test the dumps and loads functions.
+
+    This test verifies that the cached keys and values round-trip through JSON, tuples and sets included,
+    and that anything but plain data is rejected.
+    """
+    value = {"carparks": [{"facility_id": "111", "location": {"latitude": -33.8}}], "ids": {"222", "111"}}
+    assert loads(dumps(value)) == value
+    assert loads(dumps(("sweep", 1))) == ("sweep", 1)
+    assert dumps({"111", "222"}) == dumps({"222", "111"})
+    with pytest.raises(TypeError):
+        dumps(object())
+    with pytest.raises(TypeError):
+        dumps({1: "carpark_1"})
+
+
+def test_sqlite_cache_keys_and_foreign_entries(tmp_path):
+    """
+    Test the SQLiteCache class.
+
+    This test verifies that the cache iterates over the original keys, and that an entry which is not JSON
+    (e.g. a pickle written by someone else) is a miss, never loaded.
+
+    Parameters:
+        tmp_path: the pytest temporary directory
+    """
+    path = str(tmp_path / "private" / "cache.sqlite3")
+    cache = SQLiteCache("carpark_ids", maxsize=10, ttl=60, path=path)
+    cache[()] = {"111": "carpark_1"}
+    cache[("sweep",)] = {"222"}
+    assert sorted(cache, key=len) == [(), ("sweep",)]
+    assert cache[("sweep",)] == {"222"}
+    assert (tmp_path / "private").stat().st_mode & 0o777 == 0o700
+
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.execute("UPDATE entries SET value = ? WHERE key = ?", (pickle.dumps({"111": "carpark_1"}), dumps(())))
+    with pytest.raises(KeyError):
+        cache[()]
+
+
+def test_redis_cache_with_fake_redis():
+    """
+    Test the RedisCache class with the FakeRedis client.
+
+    This test verifies that the entries are shared through the client, expire, and can be cleared.
+    """
+    client = FakeRedis()
+    worker_1 = RedisCache("carpark_ids", maxsize=10, ttl=60, client=client)
+    worker_2 = RedisCache("carpark_ids", maxsize=10, ttl=60, client=client)
+
+    worker_1[()] = {"111": "carpark_1"}
+    assert worker_2[()] == {"111": "carpark_1"}
+    assert list(worker_2) == [()]
+
+    with patch("app.services.cache_backends.time.time", return_value=10**12):
+        with pytest.raises(KeyError):
+            worker_2[()]
+
+    worker_1["key"] = "value"
+    worker_2.clear()
+    assert len(worker_1) == 0
+
+
+def test_create_cache_unknown_backend():
+    """
+    Test the create_cache function.
+
+    This test verifies that an unknown backend is rejected.
+    """
+    with pytest.raises(ValueError):
+        create_cache("test", CacheConfig(maxsize=10, ttl=60), backend="memcached")
+
+
+@pytest.mark.parametrize(
+    "policy, evicted",
+    [
+        ("lru", "b"),  # "a" was read after "b" was written
+        ("lfu", "c"),  # "a" and "b" were read, "c" was not
+        ("ttl", "a"),  # "a" is the soonest to expire
+    ],
+)
+def test_memory_cache_eviction_policies(policy, evicted):
+    """
+    Test the eviction policies of the MeteredTTLCache.
+
+    This test verifies that each policy evicts the expected entry when the cache is full,
+    and that the eviction is counted in the metrics.
+
+    Parameters:
+        policy: the eviction policy
+        evicted: the entry expected to be evicted
+    """
+    name = "test_{}".format(policy)
+    evictions = cache_evictions_total.value(cache=name, reason="capacity")
+    cache = MeteredTTLCache(name, maxsize=3, ttl=60, policy=policy)
+    with patch("app.services.cache_backends.time.monotonic", side_effect=[1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0]):
+        cache["a"] = 1
+        cache["b"] = 2
+        cache["a"]
+        cache["b"]
+        cache["c"] = 3
+        cache["a"]
+        cache["d"] = 4
+
+    assert evicted not in cache._entries
+    assert len(cache._entries) == 3
+    assert cache_evictions_total.value(cache=name, reason="capacity") == evictions + 1
+    assert cache_entries.value(cache=name) == 3
+
+
+def test_memory_cache_expired_entries_evicted_first():
+    """
+    Test the MeteredTTLCache.
+
+    This test verifies that expired entries are purged before evicting a live entry, and counted as expired.
+    """
+    cache = MeteredTTLCache("test_expired", maxsize=2, ttl=60, policy="lru")
+    with patch("app.services.cache_backends.time.monotonic", return_value=0.0):
+        cache["a"] = 1
+    with patch("app.services.cache_backends.time.monotonic", return_value=50.0):
+        cache["b"] = 2
+    with patch("app.services.cache_backends.time.monotonic", return_value=70.0):
+        cache["c"] = 3
+        assert sorted(cache) == ["b", "c"]
+        with pytest.raises(KeyError):
+            cache["a"]
+
+    assert cache.stats() == {"entries": 0, "maxsize": 2, "evictions": 0, "expirations": 1}
+
+
+def test_memory_cache_ttl_jitter():
+    """
+    Test the TTL jitter of the MeteredTTLCache.
+
+    This test verifies that the expiry times are spread within +/- jitter of the TTL.
+    """
+    cache = MeteredTTLCache("test_jitter", maxsize=100, ttl=100, jitter=0.2)
+    with patch("app.services.cache_backends.time.monotonic", return_value=0.0):
+        for key in range(100):
+            cache[key] = key
+
+    expires = [entry[1] for entry in cache._entries.values()]
+    assert all(80 <= expiry <= 120 for expiry in expires)
+    assert len(set(expires)) > 1
+
+
+def test_memory_cache_unknown_policy():
+    """
+    Test the MeteredTTLCache.
+
+    This test verifies that an unknown eviction policy is rejected.
+    """
+    with pytest.raises(ValueError):
+        MeteredTTLCache("test", maxsize=10, ttl=60, policy="fifo")
+
+
+def test_cache_settings_from_environment():
+    """
+    Test the CacheSettings class.
+
+    This test verifies that the settings of each cache are read from the environment, and default otherwise.
+    """
+    environment = {
+        "CACHE_CARPARK_LOCATIONS__TTL": "600",
+        "CACHE_CARPARK_LOCATIONS__MAXSIZE": "16",
+        "CACHE_NO_UPDATE_CARPARKS__POLICY": "lfu",
+        "CACHE_NO_UPDATE_CARPARKS__JITTER": "0.1",
+    }
+    with patch.dict("os.environ", environment):
+        settings = CacheSettings(_env_file=None)
+
+    assert settings.carpark_locations == CacheConfig(ttl=600, maxsize=16)
+    assert settings.no_update_carparks == CacheConfig(policy="lfu", jitter=0.1)
+    assert settings.carpark_ids == CacheConfig()
+
+    cache = create_cache("no_update_carparks", settings.no_update_carparks, backend="memory")
+    assert (cache.policy, cache.jitter) == ("lfu", 0.1)
+
+
+def test_cache_settings_validation():
+    """
+    Test the CacheSettings class.
+
+    This test verifies that invalid settings are rejected.
+    """
+    with patch.dict("os.environ", {"CACHE_CARPARK_IDS__POLICY": "fifo"}):
+        with pytest.raises(ValueError):
+            CacheSettings(_env_file=None)
@@ -0,0 +1,112 @@
+# test the change log of the fleet state
+
+from app.services.availability_service import availability_store
+from app.services.change_log import ChangeLog, FacilityState, fleet_states
+from app.services.fleet_snapshot import build_fleet_snapshot
+
+
+def state(facility_id, available_spots=10, no_update=False):
+    """
+    Return the state of a located facility
+    """
+    return FacilityState(facility_id, "carpark_" + facility_id, -33.8, 151.0, no_update, available_spots, "Available")
+
+
+def test_change_log_versions_changes():
+    """
+    Test the ChangeLog class.
+
+    This test verifies that only the refreshes changing the fleet state get a new version,
+    and that a client gets the facilities changed and removed after its version.
+    """
+    log = ChangeLog()
+
+    assert log.publish({"1": state("1"), "2": state("2")}) == 1
+    assert log.publish({"1": state("1"), "2": state("2")}) == 1
+    assert log.publish({"1": state("1", available_spots=5), "2": state("2")}) == 2
+    assert log.publish({"1": state("1", available_spots=5), "3": state("3")}) == 3
+
+    assert log.changes(log.cursor(0)) == {
+        "version": log.cursor(3),
+        "full_resync": False,
+        "changed": [state("1", available_spots=5), state("3")],
+        "removed": ["2"],
+    }
+    assert log.changes(log.cursor(2)) == {
+        "version": log.cursor(3),
+        "full_resync": False,
+        "changed": [state("3")],
+        "removed": ["2"],
+    }
+    assert log.changes(log.cursor(3)) == {"version": log.cursor(3), "full_resync": False, "changed": [], "removed": []}
+
+
+def test_change_log_full_resync():
+    """
+    Test the full resync signal of the ChangeLog class.
+
+    This test verifies that a client older than the versions kept, without a cursor, or with the cursor
+    of another process (from before a restart), gets the whole fleet to replace its state.
+    """
+    log = ChangeLog(capacity=2)
+    for available_spots in range(4):
+        log.publish({"1": state("1", available_spots), "2": state("2")})
+
+    assert log.changes(log.cursor(2))["full_resync"] is False
+    assert log.changes(log.cursor(1))["full_resync"] is True
+    assert log.changes(log.cursor(1))["changed"] == [state("1", 3), state("2")]
+    assert log.changes(log.cursor(5))["full_resync"] is True
+    assert log.changes(None)["full_resync"] is True
+    assert log.changes("3")["full_resync"] is True
+    assert log.changes(log.boot_id + ":x")["full_resync"] is True
+    assert log.changes(ChangeLog().cursor(3))["full_resync"] is True
+
+    # a restarted process counts its versions again
+    cursor = log.cursor()
+    log.new_boot_id()
+    assert log.changes(cursor)["full_resync"] is True
+    assert log.changes(log.cursor())["full_resync"] is False
+
+
+def test_change_log_follow():
+    """
+    Test the ChangeLog.follow method.
+
+    This test verifies that a following worker serves the versions it was forked with and never creates one,
+    and that it answers the newer cursor of the next generation of workers with no change.
+    """
+    log = ChangeLog()
+    log.publish({"1": state("1", 1)})
+    cursor = log.cursor()
+    log.follow()
+
+    assert log.publish({"1": state("1", 2)}) == 1
+    assert log.changes(cursor) == {"version": cursor, "full_resync": False, "changed": [], "removed": []}
+    assert log.changes(log.cursor(2)) == {"version": log.cursor(2), "full_resync": False, "changed": [], "removed": []}
+    assert log.changes(None)["changed"] == [state("1", 1)]
+
+
+def test_fleet_states():
+    """
+    Test the fleet_states function.
+
+    This test verifies that the state of every facility of a fleet snapshot is built from its location,
+    its no-update status and its availability, and that an unchanged state is not versioned again.
+    """
+    log = ChangeLog()
+    availability_store.update("1", {"spots": "100", "occupancy": {"total": "90"}})
+    locations = {
+        "carparks": [{"facility_id": "1", "name": "carpark_1", "location": {"latitude": -33.8, "longitude": 151.0}}]
+    }
+    snapshot = build_fleet_snapshot(locations, carpark_ids={"1": "carpark_1", "2": "carpark_2"}, no_update={"2"})
+
+    states = fleet_states(snapshot)
+    assert states["1"] == FacilityState("1", "carpark_1", -33.8, 151.0, False, 10, "Almost Full")
+    assert states["2"] == FacilityState("2", "carpark_2", None, None, True, None, None)
+    assert log.publish(states) == 1
+    assert log.publish(fleet_states(snapshot)) == 1
+
+    availability_store.update("1", {"spots": "100", "occupancy": {"total": "20"}})
+    snapshot = snapshot._replace(availability=availability_store.copy())
+    assert log.publish(fleet_states(snapshot)) == 2
+    assert [facility.available_spots for facility in log.changes(log.cursor(1))["changed"]] == [80]
@@ -0,0 +1,67 @@
+# test the circuit_breaker.py
+# check if the circuit opens after repeated failures and fails fast
+# check if the circuit probes again after the reset timeout
+
+from unittest.mock import patch
+
+from app.services.circuit_breaker import CircuitBreaker
+
+
+def test_circuit_opens_after_threshold():
+    """
+    Test the CircuitBreaker class.
+
+    This test verifies that the circuit opens after the consecutive failures reach the threshold,
+    and that requests are then rejected.
+    """
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request() is True
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow_request() is False
+
+
+def test_success_resets_failures():
+    """
+    Test the CircuitBreaker class.
+
+    This test verifies that a success in between failures keeps the circuit closed.
+    """
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_probe():
+    """
+    Test the CircuitBreaker class.
+
+    This test verifies that a single probe is allowed after the reset timeout,
+    that a failed probe opens the circuit again, and that a successful probe closes it.
+    """
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+
+    with patch("app.services.circuit_breaker.time.time", return_value=100.0):
+        breaker.record_failure()
+
+    with patch("app.services.circuit_breaker.time.time", return_value=131.0):
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        # only one probe at a time
+        assert breaker.allow_request() is True
+        assert breaker.allow_request() is False
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+    with patch("app.services.circuit_breaker.time.time", return_value=162.0):
+        assert breaker.allow_request() is True
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
@@ -2,12 +2,15 @@
 # test get_nearby_carparks
 # test get_carpark_available_details
 
+import copy
 from unittest.mock import patch
 
 import pytest
 
+from app.api.v1.endpoints import carpark
 from app.api.v1.endpoints.carpark import verify_api_key
 from app.main import app
+from app.services.fleet_snapshot import build_fleet_snapshot, fleet_snapshots
 
 
 @pytest.mark.asyncio
@@ -30,7 +33,7 @@ async def test_get_nearby_carparks_success(async_test_client, mock_carpark_locat
 
     # patch external data source
     with patch(
-        "app.api.v1.endpoints.carpark.get_carpark_locations",
+        "app.services.fleet_snapshot.get_carpark_locations",
         return_value=mock_carpark_locations,
     ):
         response = await async_test_client.get(
@@ -68,7 +71,7 @@ async def test_get_nearby_carparks_no_results(async_test_client, mock_headers, m
     """
     app.dependency_overrides[verify_api_key] = lambda: mock_api_key
     with patch(
-        "app.api.v1.endpoints.carpark.get_carpark_locations",
+        "app.services.fleet_snapshot.get_carpark_locations",
         return_value={"carparks": []},
     ):
         response = await async_test_client.get(
@@ -122,7 +125,7 @@ async def test_get_nearby_carparks_invalid_data_structure(async_test_client, moc
     app.dependency_overrides[verify_api_key] = lambda: mock_api_key
     # patch the get_carpark_locations function to return an invalid data structure
     with patch(
-        "app.api.v1.endpoints.carpark.get_carpark_locations",
+        "app.services.fleet_snapshot.get_carpark_locations",
         return_value={"carparks": {}},
     ):
         response = await async_test_client.get(
@@ -154,7 +157,7 @@ async def test_get_nearby_carparks_internal_server_error(async_test_client, mock
 
     # simulate internal error: mock get_carpark_locations to raise an exception
     with patch(
-        "app.api.v1.endpoints.carpark.get_carpark_locations",
+        "app.services.fleet_snapshot.get_carpark_locations",
         side_effect=Exception("Simulated failure"),
     ):
         response = await async_test_client.get(
@@ -186,14 +189,12 @@ async def test_get_carpark_available_details_success(
     app.dependency_overrides[verify_api_key] = lambda: mock_api_key
 
     # patch the get_carpark_details function to return the mock carpark details
-    # patch the get_no_update_carparks function to return an empty set
     # patch the available_status function to return "Available"
     with (
         patch(
             "app.api.v1.endpoints.carpark.get_carpark_details",
             return_value=mock_carpark_details,
         ),
-        patch("app.api.v1.endpoints.carpark.get_no_update_carparks", return_value=set()),
     ):
 
         response = await async_test_client.get("/carparks/111", headers=mock_headers)
@@ -209,6 +210,48 @@ async def test_get_carpark_available_details_success(
     app.dependency_overrides = {}
 
 
+@pytest.mark.asyncio
+async def test_get_carpark_available_details_etag(async_test_client, mock_api_key, mock_headers, mock_carpark_details):
+    """
+    Test the get_carpark_available_details endpoint with an ETag.
+
+    This test verifies that the response is built once per details content (each request fetching a new payload)
+    and sent with an ETag, that a request sending the ETag back gets 304 Not Modified, and that refreshed details
+    change the ETag.
+    """
+    app.dependency_overrides[verify_api_key] = lambda: mock_api_key
+
+    with (
+        patch(
+            "app.api.v1.endpoints.carpark.get_carpark_details",
+            side_effect=lambda facility_id: copy.deepcopy(mock_carpark_details),
+        ),
+        patch(
+            "app.api.v1.endpoints.carpark.build_carpark_detail", wraps=carpark.build_carpark_detail
+        ) as build_carpark_detail,
+    ):
+        first = await async_test_client.get("/carparks/111", headers=mock_headers)
+        etag = first.headers["ETag"]
+        second = await async_test_client.get("/carparks/111", headers=mock_headers)
+        not_modified = await async_test_client.get("/carparks/111", headers={**mock_headers, "If-None-Match": etag})
+
+    assert first.status_code == 200
+    assert second.content == first.content
+    assert second.headers["ETag"] == etag
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert build_carpark_detail.call_count == 1
+
+    refreshed = {**mock_carpark_details, "occupancy": {"total": "90"}}
+    with patch("app.api.v1.endpoints.carpark.get_carpark_details", return_value=refreshed):
+        response = await async_test_client.get("/carparks/111", headers={**mock_headers, "If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()["available_spots"] == 10
+    app.dependency_overrides = {}
+
+
 @pytest.mark.asyncio
 async def test_get_carpark_available_details_invalid_api_key(async_test_client, mock_headers):
     """
@@ -234,23 +277,33 @@ async def test_get_carpark_available_details_invalid_api_key(async_test_client,
 
 
 @pytest.mark.asyncio
-async def test_get_carpark_available_details_no_update(async_test_client, mock_api_key, mock_headers):
+async def test_get_carpark_available_details_no_update(
+    async_test_client, mock_api_key, mock_headers, cold_no_update_carparks
+):
     """
     Test the get_carpark_available_details endpoint.
 
     This test verifies that the get_carpark_available_details endpoint returns a 200 status code
     when a valid facility_id is provided. It also checks that the response is valid and
-    contains the expected data.
+    contains the expected data, and that a cold process (no fleet snapshot) checks the no-update sweep.
 
     Parameters:
         async_test_client: the async test client
         mock_api_key: the mock api key
         mock_headers: the mock headers
+        cold_no_update_carparks: the no-update check of a cold process
     """
     app.dependency_overrides[verify_api_key] = lambda: mock_api_key
 
-    with patch("app.api.v1.endpoints.carpark.get_no_update_carparks", return_value={"222"}):
+    cold_no_update_carparks.return_value = {"222"}
+    with patch("app.api.v1.endpoints.carpark.get_carpark_details") as get_carpark_details:
         response = await async_test_client.get("/carparks/222", headers=mock_headers)
+    get_carpark_details.assert_not_called()
+    assert response.json()["status"] == "No Data Available"
+
+    # publish a fleet snapshot in which the carpark is no-update
+    fleet_snapshots.publish(build_fleet_snapshot({"carparks": []}, carpark_ids={"222": "carpark_2"}, no_update={"222"}))
+    response = await async_test_client.get("/carparks/222", headers=mock_headers)
 
     assert response.status_code == 200
     data = response.json()
@@ -258,6 +311,13 @@ async def test_get_carpark_available_details_no_update(async_test_client, mock_a
     assert data["available_spots"] == 0
     assert data["timestamp"] is None
 
+    # the no-update response is built once
+    with patch("app.api.v1.endpoints.carpark.CarparkDetail", wraps=carpark.CarparkDetail) as carpark_detail:
+        again = await async_test_client.get("/carparks/222", headers=mock_headers)
+    assert again.content == response.content
+    assert again.headers["ETag"] == response.headers["ETag"]
+    carpark_detail.assert_not_called()
+
     app.dependency_overrides = {}
 
 
@@ -277,10 +337,7 @@ async def test_get_carpark_available_details_not_found(async_test_client, mock_a
     """
     app.dependency_overrides[verify_api_key] = lambda: mock_api_key
 
-    with (
-        patch("app.api.v1.endpoints.carpark.get_carpark_details", return_value=None),
-        patch("app.api.v1.endpoints.carpark.get_no_update_carparks", return_value=set()),
-    ):
+    with (patch("app.api.v1.endpoints.carpark.get_carpark_details", return_value=None),):
         response = await async_test_client.get("/carparks/000", headers=mock_headers)
 
     assert response.status_code == 404
@@ -312,7 +369,6 @@ async def test_get_carpark_available_details_invalid_data(
     mock_carpark_details["spots"] = "invalid"
 
     with (
-        patch("app.api.v1.endpoints.carpark.get_no_update_carparks", return_value=set()),
         patch(
             "app.api.v1.endpoints.carpark.get_carpark_details",
             return_value=mock_carpark_details,
@@ -324,3 +380,394 @@ async def test_get_carpark_available_details_invalid_data(
     assert response.json()["detail"] == "Internal server error"
 
     app.dependency_overrides = {}
+
+
+@pytest.mark.asyncio
+async def test_get_carpark_available_details_stale(async_test_client, mock_api_key, mock_headers, mock_carpark_details):
+    """
+    Test the get_carpark_available_details endpoint.
+
+    This test verifies that the last known details are served, flagged as stale,
+    when the NSW API does not answer.
+
+    Parameters:
+        async_test_client: the async test client
+        mock_api_key: the mock api key
+        mock_headers: the mock headers
+        mock_carpark_details: the mock carpark details
+    """
+    app.dependency_overrides[verify_api_key] = lambda: mock_api_key
+
+    with (
+        patch("app.api.v1.endpoints.carpark.get_carpark_details", return_value=None),
+        patch("app.api.v1.endpoints.carpark.get_last_known_details", return_value=mock_carpark_details),
+    ):
+        response = await async_test_client.get("/carparks/111", headers=mock_headers)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["available_spots"] == 40
+    assert data["stale"] is True
+
+    app.dependency_overrides = {}
+
+
+@pytest.mark.asyncio
+async def test_get_carpark_available_details_upstream_unavailable(async_test_client, mock_api_key, mock_headers):
+    """
+    Test the get_carpark_available_details endpoint.
+
+    This test verifies that a 503 (not a 404) is returned when the circuit breaker is open
+    and there is no last known data for the carpark.
+
+    Parameters:
+        async_test_client: the async test client
+        mock_api_key: the mock api key
+        mock_headers: the mock headers
+    """
+    from app.services.nsw_transport_api import upstream_breaker
+
+    app.dependency_overrides[verify_api_key] = lambda: mock_api_key
+    for _ in range(upstream_breaker.failure_threshold):
+        upstream_breaker.record_failure()
+
+    with (patch("app.api.v1.endpoints.carpark.get_carpark_details", return_value=None),):
+        response = await async_test_client.get("/carparks/111", headers=mock_headers)
+
+    assert response.status_code == 503
+
+    app.dependency_overrides = {}
+
+
+@pytest.mark.asyncio
+async def test_get_nearby_carparks_stale_header(async_test_client, mock_carpark_locations, mock_headers, mock_api_key):
+    """
+    Test the get_nearby_carparks endpoint.
+
+    This test verifies that results computed from stale locations are flagged with the X-Data-Stale header.
+
+    Parameters:
+        async_test_client: the async test client
+        mock_carpark_locations: the mock carpark locations
+        mock_headers: the mock headers
+        mock_api_key: the mock api key
+    """
+    app.dependency_overrides[verify_api_key] = lambda: mock_api_key
+
+    with patch(
+        "app.services.fleet_snapshot.get_carpark_locations",
+        return_value={**mock_carpark_locations, "stale": True},
+    ):
+        response = await async_test_client.get(
+            "/carparks/nearby?lat=-33.8145&lng=151.0096&radius_km=1",
+            headers=mock_headers,
+        )
+
+    assert response.status_code == 200
+    assert response.headers["X-Data-Stale"] == "true"
+    assert len(response.json()) == 1
+
+    app.dependency_overrides = {}
+
+
+@pytest.mark.asyncio
+async def test_get_carparks_freshness(async_test_client, mock_api_key, mock_headers):
+    """
+    Test the get_carparks_freshness endpoint.
+
+    This test verifies that the freshness endpoint lists the polled carparks with their refresh interval.
+
+    Parameters:
+        async_test_client: the async test client
+        mock_api_key: the mock api key
+        mock_headers: the mock headers
+    """
+    from app.services.polling_scheduler import polling_scheduler
+
+    app.dependency_overrides[verify_api_key] = lambda: mock_api_key
+    polling_scheduler.sync(["111", "222"])
+    polling_scheduler.record_poll("111", {"spots": "100", "occupancy": {"total": "60"}})
+
+    response = await async_test_client.get("/carparks/freshness", headers=mock_headers)
+
+    assert response.status_code == 200
+    data = {row["facility_id"]: row for row in response.json()}
+    assert set(data) == {"111", "222"}
+    assert data["111"]["age_seconds"] is not None
+    assert data["222"]["polled_at"] is None
+    assert data["222"]["interval_seconds"] > 0
+    app.dependency_overrides = {}
+
+
+@pytest.mark.asyncio
+async def test_get_carpark_history(async_test_client, mock_api_key, mock_headers, mock_carpark_details):
+    """
+    Test the get_carpark_history endpoint.
+
+    This test verifies that the history endpoint returns the recorded readings,
+    and a 404 error for a carpark without history.
+
+    Parameters:
+        async_test_client: the async test client
+        mock_api_key: the mock api key
+        mock_headers: the mock headers
+        mock_carpark_details: the mock carpark details
+    """
+    from app.services.occupancy_history import occupancy_history
+
+    app.dependency_overrides[verify_api_key] = lambda: mock_api_key
+    occupancy_history.record("111", {**mock_carpark_details, "MessageDate": None})
+
+    response = await async_test_client.get("/carparks/111/history?hours=1&step_minutes=5", headers=mock_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total_spots"] == 100
+    assert len(data["points"]) == 1
+    assert data["points"][0]["occupancy"] == 60
+
+    response = await async_test_client.get("/carparks/222/history", headers=mock_headers)
+    assert response.status_code == 404
+    app.dependency_overrides = {}
+
+
+@pytest.mark.asyncio
+async def test_get_carpark_forecast(async_test_client, mock_api_key, mock_headers, mock_carpark_details):
+    """
+    Test the get_carpark_forecast endpoint.
+
+    This test verifies that a detail fetch feeds the forecast, and that a carpark
+    without readings gets a 404 error.
+
+    Parameters:
+        async_test_client: the async test client
+        mock_api_key: the mock api key
+        mock_headers: the mock headers
+        mock_carpark_details: the mock carpark details
+    """
+    from app.services import nsw_transport_api
+
+    app.dependency_overrides[verify_api_key] = lambda: mock_api_key
+    with patch("app.services.nsw_transport_api.make_api_request", return_value=mock_carpark_details):
+        nsw_transport_api.get_carpark_details("111")
+
+    response = await async_test_client.get("/carparks/111/forecast?minutes=30", headers=mock_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total_spots"] == 100
+    assert 0 <= data["available_spots"] <= 100
+    assert data["status"] in ("Full", "Almost Full", "Available")
+
+    response = await async_test_client.get("/carparks/222/forecast", headers=mock_headers)
+    assert response.status_code == 404
+    app.dependency_overrides = {}
+
+
+@pytest.mark.asyncio
+async def test_get_carpark_available_details_zones(async_test_client, mock_api_key, mock_headers, mock_carpark_details):
+    """
+    Test the get_carpark_available_details endpoint.
+
+    This test verifies that the availability of each zone is returned with the details.
+
+    Parameters:
+        async_test_client: the async test client
+        mock_api_key: the mock api key
+        mock_headers: the mock headers
+        mock_carpark_details: the mock carpark details
+    """
+    app.dependency_overrides[verify_api_key] = lambda: mock_api_key
+    details = {
+        **mock_carpark_details,
+        "zones": [
+            {"zone_id": "1", "zone_name": "Level 1", "spots": "60", "occupancy": {"total": "60"}},
+            {"zone_id": "2", "zone_name": "Level 2", "spots": "40", "occupancy": {"total": "0"}},
+        ],
+    }
+    with (patch("app.api.v1.endpoints.carpark.get_carpark_details", return_value=details),):
+        response = await async_test_client.get("/carparks/111", headers=mock_headers)
+
+    assert response.status_code == 200
+    assert response.json()["zones"] == [
+        {"zone_id": "1", "name": "Level 1", "total_spots": 60, "available_spots": 0, "status": "Full"},
+        {"zone_id": "2", "name": "Level 2", "total_spots": 40, "available_spots": 40, "status": "Available"},
+    ]
+    app.dependency_overrides = {}
+
+
+def test_get_nearby_carparks_by_address(test_client, mock_headers, mock_api_key, mock_carpark_locations):
+    """
+    Test the get_nearby_carparks endpoint with an address.
+
+    This test verifies that the address is geocoded (by the offline geocoder) to the search point.
+    """
+    app.dependency_overrides[verify_api_key] = lambda: mock_api_key
+
+    with patch("app.services.fleet_snapshot.get_carpark_locations", return_value=mock_carpark_locations):
+        response = test_client.get(
+            "/carparks/nearby?address=central station sydney&radius_km=100", headers=mock_headers
+        )
+
+    assert response.status_code == 200
+    assert response.json()[0]["facility_id"] == "111"
+    # carpark_1 is in Parramatta, about 20km from Central Station
+    assert 15 < response.json()[0]["distance_km"] < 25
+
+    app.dependency_overrides = {}
+
+
+def test_get_nearby_carparks_address_errors(test_client, mock_headers, mock_api_key):
+    """
+    Test the get_nearby_carparks endpoint with invalid search points.
+
+    This test verifies that a missing search point is rejected, that an unknown address returns 404,
+    that an address without a letter or digit is rejected before geocoding, and that a geocoding failure returns 503.
+    """
+    from app.services.geocoding_service import GeocodingError
+
+    app.dependency_overrides[verify_api_key] = lambda: mock_api_key
+
+    assert test_client.get("/carparks/nearby?lat=-33.8", headers=mock_headers).status_code == 422
+    with patch("app.api.v1.endpoints.carpark.geocoding_service.geocode") as geocode:
+        assert test_client.get("/carparks/nearby?address=%20,.%20", headers=mock_headers).status_code == 422
+    geocode.assert_not_called()
+    assert test_client.get("/carparks/nearby?address=nowhere", headers=mock_headers).status_code == 404
+
+    with patch("app.api.v1.endpoints.carpark.geocoding_service.geocode", side_effect=GeocodingError("provider down")):
+        response = test_client.get("/carparks/nearby?address=somewhere", headers=mock_headers)
+    assert response.status_code == 503
+
+    app.dependency_overrides = {}
+
+
+def test_get_nearby_carparks_batch(test_client, mock_headers, mock_api_key, mock_carpark_locations):
+    """
+    Test the get_nearby_carparks_batch endpoint.
+
+    This test verifies that each origin gets the carparks within its own radius, in the order of the origins,
+    and that too many origins are rejected.
+    """
+    app.dependency_overrides[verify_api_key] = lambda: mock_api_key
+    origins = [
+        {"lat": -33.8145, "lng": 151.0096, "radius_km": 1},
+        {"lat": -33.8688, "lng": 151.2093},
+        {"lat": -33.8688, "lng": 151.2093, "radius_km": 30},
+    ]
+
+    with patch("app.services.fleet_snapshot.get_carpark_locations", return_value=mock_carpark_locations):
+        response = test_client.post("/carparks/nearby/batch", json={"origins": origins}, headers=mock_headers)
+
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["radius_km"] for result in results] == [1, 10, 30]
+    assert [len(result["carparks"]) for result in results] == [1, 0, 1]
+    assert results[0]["carparks"][0]["facility_id"] == "111"
+
+    with patch("app.api.v1.endpoints.carpark.NEARBY_BATCH_MAX_ORIGINS", 2):
+        response = test_client.post("/carparks/nearby/batch", json={"origins": origins}, headers=mock_headers)
+    assert response.status_code == 422
+
+    app.dependency_overrides = {}
+
+
+def test_get_nearby_carparks_k_nearest(test_client, mock_headers, mock_api_key, mock_carpark_locations):
+    """
+    Test the get_nearby_carparks endpoint in k nearest mode.
+
+    This test verifies that the k nearest carparks are returned whatever their distance,
+    unless a radius is given too.
+    """
+    app.dependency_overrides[verify_api_key] = lambda: mock_api_key
+
+    with patch("app.services.fleet_snapshot.get_carpark_locations", return_value=mock_carpark_locations):
+        nearest = test_client.get("/carparks/nearby?lat=-35.0&lng=149.0&k=3", headers=mock_headers)
+        within = test_client.get("/carparks/nearby?lat=-35.0&lng=149.0&k=3&radius_km=10", headers=mock_headers)
+        invalid = test_client.get("/carparks/nearby?lat=-35.0&lng=149.0&k=0", headers=mock_headers)
+
+    assert nearest.status_code == 200
+    assert [carpark["facility_id"] for carpark in nearest.json()] == ["111"]
+    assert nearest.json()[0]["distance_km"] > 100
+    assert within.json() == []
+    assert invalid.status_code == 422
+
+    app.dependency_overrides = {}
+
+
+def test_get_nearby_carparks_availability_filters(test_client, mock_headers, mock_api_key):
+    """
+    Test the get_nearby_carparks endpoint with availability filters.
+
+    This test verifies that the carparks are filtered by their last known available spots and status,
+    that the carparks with an unknown availability are filtered out, and that unknown statuses are rejected.
+    """
+    from app.core.rate_limit import rate_limiter
+    from app.services.availability_service import availability_store
+
+    app.dependency_overrides[verify_api_key] = lambda: mock_api_key
+    locations = {
+        "carparks": [
+            {
+                "facility_id": str(i),
+                "name": f"carpark_{i}",
+                "location": {"latitude": -33.81 - i / 1000, "longitude": 151.0},
+            }
+            for i in range(1, 5)
+        ]
+    }
+    availability_store.update("1", {"spots": "100", "occupancy": {"total": "10"}})
+    availability_store.update("2", {"spots": "100", "occupancy": {"total": "95"}})
+    availability_store.update("3", {"spots": "100", "occupancy": {"total": "100"}})
+
+    def nearby(query):
+        # The requests of the test are not rate limited
+        rate_limiter.requests.clear()
+        response = test_client.get(f"/carparks/nearby?lat=-33.81&lng=151.0&{query}", headers=mock_headers)
+        return [carpark["facility_id"] for carpark in response.json()]
+
+    with patch("app.services.fleet_snapshot.get_carpark_locations", return_value=locations):
+        assert nearby("radius_km=5") == ["1", "2", "3", "4"]
+        assert nearby("min_available=1") == ["1", "2"]
+        assert nearby("status=Available&status=Almost Full") == ["1", "2"]
+        assert nearby("min_available=10&k=1") == ["1"]
+        assert nearby("status=Full&k=3") == ["3"]
+        rate_limiter.requests.clear()
+        invalid = test_client.get("/carparks/nearby?lat=-33.81&lng=151.0&status=Open", headers=mock_headers)
+
+    assert invalid.status_code == 422
+
+    app.dependency_overrides = {}
+
+
+def test_get_fleet_changes(test_client, mock_headers, mock_api_key, mock_carpark_locations):
+    """
+    Test the get_fleet_changes endpoint.
+
+    This test verifies that a client gets the whole fleet, then only the facilities changed after its version,
+    once the snapshot is refreshed, and the whole fleet again for the cursor of another process.
+    """
+    from app.services.availability_service import availability_store
+    from app.services.change_log import change_log
+
+    app.dependency_overrides[verify_api_key] = lambda: mock_api_key
+    fleet_snapshots.publish(build_fleet_snapshot(mock_carpark_locations))
+
+    first = test_client.get("/carparks/changes", headers=mock_headers).json()
+    assert first["version"] == change_log.cursor(1)
+    assert first["full_resync"] is True
+    assert [facility["facility_id"] for facility in first["changed"]] == ["111"]
+    assert first["changed"][0]["available_spots"] is None
+
+    unchanged = test_client.get("/carparks/changes", params={"since": first["version"]}, headers=mock_headers).json()
+    assert unchanged == {"version": first["version"], "full_resync": False, "changed": [], "removed": []}
+
+    availability_store.update("111", {"spots": "100", "occupancy": {"total": "60"}})
+    republished = test_client.get("/carparks/changes", params={"since": first["version"]}, headers=mock_headers)
+    assert republished.json() == unchanged
+
+    fleet_snapshots.publish(build_fleet_snapshot(mock_carpark_locations))
+    changed = test_client.get("/carparks/changes", params={"since": first["version"]}, headers=mock_headers).json()
+    assert changed["version"] == change_log.cursor(2)
+    assert changed["full_resync"] is False
+    assert changed["changed"][0]["available_spots"] == 40
+    assert test_client.get("/carparks/changes?since=other:1", headers=mock_headers).json()["full_resync"] is True
+
+    app.dependency_overrides = {}
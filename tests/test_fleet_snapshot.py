@@ -0,0 +1,149 @@
+# test the fleet snapshot
+
+import threading
+import time
+from unittest.mock import patch
+
+from app.services.availability_service import availability_store
+from app.services.cache_service import last_known_fleet
+from app.services.change_log import change_log
+from app.services.fleet_snapshot import FleetSnapshotStore, build_fleet_snapshot
+
+
+def test_build_fleet_snapshot(mock_carpark_locations):
+    """
+    Test the build_fleet_snapshot function.
+
+    This test verifies that the snapshot holds the locations, their index, the last known carpark IDs
+    and no-update set, and a copy of the availabilities which later updates do not change.
+    """
+    last_known_fleet.put("carpark_ids", {"111": "carpark_1", "222": "carpark_2"})
+    last_known_fleet.put("no_update_carparks", {"222"})
+    availability_store.update("111", {"spots": "100", "occupancy": {"total": "60"}})
+
+    snapshot = build_fleet_snapshot({**mock_carpark_locations, "stale": True})
+
+    assert snapshot.carpark_ids == {"111": "carpark_1", "222": "carpark_2"}
+    assert snapshot.no_update == frozenset({"222"})
+    assert len(snapshot.index) == 1
+    assert snapshot.stale is True
+    assert snapshot.availability["111"].available_spots == 40
+
+    availability_store.update("111", {"spots": "100", "occupancy": {"total": "100"}})
+    assert snapshot.availability["111"].available_spots == 40
+    assert build_fleet_snapshot({"carparks": "invalid"}).carparks == ()
+
+
+def test_fleet_snapshot_store_publish(mock_carpark_locations):
+    """
+    Test the FleetSnapshotStore.publish method.
+
+    This test verifies that a published snapshot replaces the current one at once, versioned by the change log,
+    while a reader holding the previous snapshot keeps using it unchanged.
+    """
+    store = FleetSnapshotStore()
+    first = store.publish(build_fleet_snapshot({"carparks": []}))
+    assert store.current() is first
+
+    second = store.publish(build_fleet_snapshot(mock_carpark_locations))
+    assert store.current() is second
+    assert second.version == change_log.version == first.version + 1
+    assert len(first.index) == 0
+    assert len(second.index) == 1
+
+
+def test_fleet_snapshot_store_get(mock_carpark_locations):
+    """
+    Test the FleetSnapshotStore.get method.
+
+    This test verifies that the first call builds the snapshot, that the next ones serve it without a sweep,
+    and that changed availabilities are republished with the rest of the snapshot shared (and its version).
+    """
+    store = FleetSnapshotStore()
+    with patch(
+        "app.services.fleet_snapshot.get_carpark_locations", return_value=mock_carpark_locations
+    ) as get_carpark_locations:
+        snapshot = store.get()
+        assert store.get() is snapshot
+        get_carpark_locations.assert_called_once()
+
+    availability_store.update("111", {"spots": "100", "occupancy": {"total": "60"}})
+    republished = store.get()
+    assert republished is not snapshot
+    assert republished.index is snapshot.index
+    assert republished.availability["111"].available_spots == 40
+    assert republished.version == snapshot.version == change_log.version
+    assert "111" not in snapshot.availability
+
+    with patch("app.services.fleet_snapshot.get_carpark_locations", return_value=None):
+        assert FleetSnapshotStore().get() is None
+
+
+def test_fleet_snapshot_store_refreshes_in_background(mock_carpark_locations):
+    """
+    Test the background refresh of the FleetSnapshotStore class.
+
+    This test verifies that a due snapshot is still served while it is refreshed in the background,
+    that a stale snapshot is retried sooner than a fresh one, and that the refresh sweeps the locations again.
+    """
+    store = FleetSnapshotStore(refresh_interval=3600, stale_retry_interval=30)
+    stale = store.publish(build_fleet_snapshot({**mock_carpark_locations, "stale": True}))
+
+    with patch.object(store, "_refresh_in_background") as refresh:
+        assert store.get(now=stale.built_at + 10) is stale
+        refresh.assert_not_called()
+        assert store.get(now=stale.built_at + 31) is stale
+        refresh.assert_called_once()
+
+    fresh = store.publish(build_fleet_snapshot(mock_carpark_locations))
+    with patch.object(store, "_refresh_in_background") as refresh:
+        store.get(now=fresh.built_at + 31)
+        refresh.assert_not_called()
+
+    with patch(
+        "app.services.fleet_snapshot.get_carpark_locations", return_value=mock_carpark_locations
+    ) as get_carpark_locations:
+        assert store.get(now=fresh.built_at + 3600) is fresh
+        # the refresh is running, or done: the next one waits for it to finish
+        with store._refreshing:
+            pass
+    # the cached locations the snapshot was built from are swept again
+    get_carpark_locations.assert_called_once_with(renew=True)
+    assert store.current() is not fresh
+    assert store.current().stale is False
+
+
+def test_fleet_snapshot_store_builds_once(mock_carpark_locations):
+    """
+    Test the single-flight build of the FleetSnapshotStore class.
+
+    This test verifies that a refresh arriving while the first request of a cold process builds the snapshot
+    waits for that build instead of sweeping again, and that the readers are not blocked meanwhile.
+    """
+    store = FleetSnapshotStore()
+    sweeping, done = threading.Event(), threading.Event()
+
+    def get_carpark_locations(renew=False):
+        sweeping.set()
+        done.wait(5)
+        return mock_carpark_locations
+
+    with patch("app.services.fleet_snapshot.get_carpark_locations", side_effect=get_carpark_locations) as sweep:
+        results = {}
+        cold = threading.Thread(target=lambda: results.update(get=store.get()))
+        cold.start()
+        sweeping.wait(5)
+        refresh = threading.Thread(target=lambda: results.update(refresh=store.refresh()))
+        refresh.start()
+        time.sleep(0.05)
+        assert store.current() is None
+        store.forget_facility("111")
+        done.set()
+        cold.join(5)
+        refresh.join(5)
+        sweep.assert_called_once()
+        assert results["get"] is results["refresh"] is store.current()
+
+        # a later refresh builds a new snapshot
+        assert store.refresh() is not results["get"]
+        assert sweep.call_count == 2
@@ -0,0 +1,147 @@
+# test the geocoding service
+
+import json
+import threading
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+from app.services.geocoding_service import (
+    CachedGeocoder,
+    GeocodingError,
+    ProviderGeocoder,
+    StaticGeocoder,
+    normalize_address,
+)
+
+
+def test_normalize_address():
+    """
+    Test the normalize_address function.
+
+    This test verifies that case, punctuation and whitespace variants of an address are normalized alike.
+    """
+    assert normalize_address("  Central Station,  SYDNEY ") == "central station sydney"
+    assert normalize_address("central station sydney") == "central station sydney"
+
+
+def test_cached_geocoder_caches_results():
+    """
+    Test the CachedGeocoder class.
+
+    This test verifies that variants of an address are resolved by the geocoder once,
+    that addresses which are not found are cached too, that the least recently used address is evicted,
+    and that an address without a letter or digit is rejected before geocoding.
+    """
+    geocoder = MagicMock(wraps=StaticGeocoder({"Central Station, Sydney": (-33.8832, 151.2070)}))
+    cache = CachedGeocoder(geocoder, maxsize=2)
+
+    assert cache.geocode("Central Station, Sydney") == (-33.8832, 151.2070)
+    assert cache.geocode("central station sydney") == (-33.8832, 151.2070)
+    assert cache.geocode("nowhere") is None
+    assert cache.geocode("Nowhere") is None
+    assert geocoder.geocode.call_count == 2
+
+    cache.geocode("central station sydney")
+    cache.geocode("somewhere")
+    assert len(cache) == 2
+    cache.geocode("nowhere")
+    assert geocoder.geocode.call_count == 4
+
+    with pytest.raises(ValueError):
+        cache.geocode(" ,. ")
+    assert geocoder.geocode.call_count == 4
+    assert "" not in cache._entries
+
+
+def test_cached_geocoder_does_not_cache_errors():
+    """
+    Test the CachedGeocoder class with a failing geocoder.
+
+    This test verifies that provider failures are raised and not cached, so that the next request retries.
+    """
+    geocoder = MagicMock()
+    geocoder.geocode.side_effect = [GeocodingError("timeout"), (-33.8832, 151.2070)]
+    cache = CachedGeocoder(geocoder)
+
+    with pytest.raises(GeocodingError):
+        cache.geocode("Central Station")
+    assert len(cache) == 0
+    assert cache.geocode("Central Station") == (-33.8832, 151.2070)
+
+
+def test_cached_geocoder_persistence(tmp_path):
+    """
+    Test the persistence of the CachedGeocoder class.
+
+    This test verifies that the cached addresses, found or not, are loaded by a new cache from the JSON file.
+    """
+    path = str(tmp_path / "geocoder.json")
+    cache = CachedGeocoder(StaticGeocoder({"Central Station": (-33.8832, 151.2070)}), path=path, save_delay=0)
+    cache.geocode("Central Station")
+    cache.geocode("nowhere")
+
+    geocoder = MagicMock()
+    restored = CachedGeocoder(geocoder, path=path)
+
+    assert len(restored) == 2
+    assert restored.geocode("central station") == (-33.8832, 151.2070)
+    assert restored.geocode("nowhere") is None
+    geocoder.geocode.assert_not_called()
+
+
+def test_cached_geocoder_debounced_saves(tmp_path):
+    """
+    Test the saves of the CachedGeocoder class.
+
+    This test verifies that the new entries are saved once after a delay (or on flush),
+    and that concurrent saves leave a valid file and no temporary file behind.
+    """
+    path = tmp_path / "geocoder.json"
+    cache = CachedGeocoder(StaticGeocoder({}), path=str(path), save_delay=60)
+    with patch.object(cache, "save", wraps=cache.save) as save:
+        for i in range(10):
+            cache.geocode(f"address {i}")
+        save.assert_not_called()
+        cache.flush()
+        save.assert_called_once()
+    assert len(json.loads(path.read_text())) == 10
+
+    threads = [threading.Thread(target=cache.save) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(json.loads(path.read_text())) == 10
+    assert [file.name for file in tmp_path.iterdir()] == ["geocoder.json"]
+
+
+def test_provider_geocoder():
+    """
+    Test the ProviderGeocoder class.
+
+    This test verifies that the query is biased to the region, and that the provider results
+    are mapped to coordinates, None (not found) or a GeocodingError (failure).
+    """
+    geocoder = ProviderGeocoder("osm", region="NSW, Australia", timeout=2)
+
+    found = SimpleNamespace(ok=True, latlng=[-33.8832, 151.2070], error=None)
+    with patch("app.services.geocoding_service.geocoder_lib.get", return_value=found) as get:
+        assert geocoder.geocode("central station") == (-33.8832, 151.2070)
+    get.assert_called_once_with("central station, NSW, Australia", provider="osm", timeout=2)
+
+    not_found = SimpleNamespace(ok=False, latlng=None, error=None)
+    with patch("app.services.geocoding_service.geocoder_lib.get", return_value=not_found):
+        assert geocoder.geocode("nowhere") is None
+
+    failed = SimpleNamespace(ok=False, latlng=None, error="ERROR - 503 Service Unavailable")
+    with patch("app.services.geocoding_service.geocoder_lib.get", return_value=failed):
+        with pytest.raises(GeocodingError):
+            geocoder.geocode("central station")
+
+    for error in (requests.ConnectionError("connection refused"), requests.Timeout(), ValueError("invalid JSON")):
+        with patch("app.services.geocoding_service.geocoder_lib.get", side_effect=error):
+            with pytest.raises(GeocodingError):
+                geocoder.geocode("central station")
@@ -0,0 +1,107 @@
+# test the health endpoints and the sweep progress
+
+from unittest.mock import patch
+
+import pytest
+
+from app.services.fleet_snapshot import build_fleet_snapshot, fleet_snapshots
+from app.services.health_service import start_warmup
+from app.services.nsw_transport_api import fetch_no_update_carparks, upstream_breaker
+from app.services.sweep_progress import SweepProgress
+from app.utils.time_utils import get_local_time
+
+
+def test_sweep_progress():
+    """
+    Test the SweepProgress class.
+
+    This test verifies that the progress of a sweep is reported while it runs, and its duration
+    and outcome once it finished.
+    """
+    progress = SweepProgress()
+    with progress.track("no_update_carparks", 3) as sweep:
+        sweep.advance()
+        status = progress.status()["no_update_carparks"]
+        assert status["running"]
+        assert (status["done"], status["total"]) == (1, 3)
+        assert status["last_completed"] is None
+
+    status = progress.status()["no_update_carparks"]
+    assert not status["running"]
+    assert status["last_completed"]
+    assert status["last_duration_seconds"] >= 0
+
+    with pytest.raises(RuntimeError):
+        with progress.track("no_update_carparks", 3):
+            raise RuntimeError("sweep failed")
+    assert not progress.status()["no_update_carparks"]["last_completed"]
+
+
+def test_fetch_no_update_carparks_records_progress(mock_all_carparks_response, mock_carpark_details):
+    """
+    Test the fetch_no_update_carparks function.
+
+    This test verifies that the no-update sweep reports its progress.
+    """
+    from app.services.sweep_progress import sweep_progress
+
+    with patch("app.services.nsw_transport_api.get_carpark_details", return_value=mock_carpark_details):
+        fetch_no_update_carparks(mock_all_carparks_response, get_local_time())
+
+    status = sweep_progress.status()["no_update_carparks"]
+    assert status["done"] == status["total"] == len(mock_all_carparks_response)
+    assert status["last_completed"]
+
+
+def test_readyz_before_and_after_snapshot(test_client, mock_carpark_locations):
+    """
+    Test the /readyz endpoint.
+
+    This test verifies that the service is not ready until the fleet snapshot is loaded.
+    """
+    response = test_client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["ready"] is False
+    assert response.json()["snapshot_age_seconds"] is None
+
+    fleet_snapshots.publish(build_fleet_snapshot(mock_carpark_locations))
+    response = test_client.get("/readyz")
+    assert response.status_code == 200
+    assert response.json()["ready"] is True
+    assert response.json()["snapshot_age_seconds"] >= 0
+
+
+def test_healthz(test_client):
+    """
+    Test the /healthz endpoint.
+
+    This test verifies that the liveness probe answers without an API key, even when the service is
+    not ready, and reports the circuit state.
+    """
+    for _ in range(upstream_breaker.failure_threshold):
+        upstream_breaker.record_failure()
+
+    response = test_client.get("/healthz")
+
+    assert response.status_code == 200
+    assert response.json()["ready"] is False
+    assert response.json()["circuit_state"] == "open"
+    assert response.json()["sweeps_paused"] is False
+    assert response.json()["sweeps"] == {}
+
+
+def test_start_warmup(mock_carpark_locations):
+    """
+    Test the start_warmup function.
+
+    This test verifies that the fleet snapshot is loaded in the background, retried until the NSW API
+    serves it, and not loaded again once it is.
+    """
+    snapshot = build_fleet_snapshot(mock_carpark_locations)
+    with patch("app.services.health_service.fleet_snapshots.refresh", side_effect=[None, None, snapshot]) as refresh:
+        thread = start_warmup(retry_delay=0.01)
+        thread.join(timeout=5)
+        assert refresh.call_count == 3
+
+        fleet_snapshots.publish(snapshot)
+        assert start_warmup() is None
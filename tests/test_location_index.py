@@ -0,0 +1,116 @@
+# test the location index
+
+from app.services.location_index import LocationIndex
+from app.utils.distance import haversine_distance
+from benchmarks.microbench import generate_locations
+
+
+def brute_force(carparks, lat, lng, radius_km):
+    """
+    The nearby carparks computed without index: the haversine distance to every carpark
+    """
+    matches = []
+    for carpark in carparks:
+        location = carpark["location"]
+        distance = haversine_distance(lat, lng, location["latitude"], location["longitude"])
+        if distance <= radius_km:
+            matches.append((distance, carpark["facility_id"]))
+    return sorted(matches)
+
+
+def test_within_matches_brute_force():
+    """
+    Test the LocationIndex.within method.
+
+    This test verifies that the carparks within a radius, and their distances, are the ones found by computing
+    the distance to every carpark.
+    """
+    carparks = generate_locations(2000)["carparks"]
+    index = LocationIndex(carparks)
+
+    for lat, lng, radius_km in [(-33.8688, 151.2093, 5), (-33.8170, 151.0034, 20), (-33.5, 150.7, 0.5), (0, 0, 10)]:
+        expected = brute_force(carparks, lat, lng, radius_km)
+        matches = index.within(lat, lng, radius_km)
+
+        assert [facility_id for _, facility_id, _ in matches] == [facility_id for _, facility_id in expected]
+        for (distance, _, _), (expected_distance, _) in zip(matches, expected):
+            assert abs(distance - expected_distance) < 1e-9
+
+
+def test_within_many_matches_within():
+    """
+    Test the LocationIndex.within_many method.
+
+    This test verifies that a batch of overlapping origins, each with its own radius, gets the same results
+    as one query per origin, in the order of the origins.
+    """
+    index = LocationIndex(generate_locations(2000)["carparks"])
+    origins = [(-33.8170 + i * 0.005, 151.0034 + i * 0.02, 1 + i % 3) for i in range(10)]
+    origins.append((-33.9, 151.0, 0))
+
+    assert index.within_many(origins) == [index.within(*origin) for origin in origins]
+    assert index.within_many([]) == []
+
+
+def test_nearest_matches_brute_force():
+    """
+    Test the LocationIndex.nearest method.
+
+    This test verifies that the k nearest carparks are the k first of the distances to every carpark,
+    within the optional maximum distance, and that a k larger than the fleet returns the whole fleet.
+    """
+    carparks = generate_locations(2000)["carparks"]
+    index = LocationIndex(carparks)
+
+    for lat, lng, k in [(-33.8688, 151.2093, 5), (-33.4, 150.6, 20), (-35.0, 149.0, 3), (-33.8, 151.0, 1)]:
+        expected = brute_force(carparks, lat, lng, float("inf"))[:k]
+        matches = index.nearest(lat, lng, k)
+
+        assert [facility_id for _, facility_id, _ in matches] == [facility_id for _, facility_id in expected]
+
+    capped = index.nearest(-33.8688, 151.2093, 50, radius_km=2)
+    assert [facility_id for _, facility_id, _ in capped] == [
+        facility_id for _, facility_id in brute_force(carparks, -33.8688, 151.2093, 2)
+    ][:50]
+    assert len(LocationIndex(carparks[:10]).nearest(-33.8688, 151.2093, 50)) == 10
+    assert LocationIndex([]).nearest(-33.8688, 151.2093, 5) == []
+
+
+def test_queries_filter_carparks():
+    """
+    Test the include filter of the LocationIndex queries.
+
+    This test verifies that the rejected carparks are skipped by the radius, batch and k nearest queries,
+    the k nearest query still returning k carparks.
+    """
+    carparks = generate_locations(2000)["carparks"]
+    index = LocationIndex(carparks)
+
+    def even(facility_id):
+        return int(facility_id) % 2 == 0
+
+    within = index.within(-33.8688, 151.2093, 10, include=even)
+    assert within == [match for match in index.within(-33.8688, 151.2093, 10) if even(match[1])]
+    assert index.within_many([(-33.8688, 151.2093, 10)], include=even) == [within]
+
+    nearest = index.nearest(-33.8688, 151.2093, 5, include=even)
+    expected = [facility_id for _, facility_id in brute_force(carparks, -33.8688, 151.2093, 100) if even(facility_id)]
+    assert [facility_id for _, facility_id, _ in nearest] == expected[:5]
+
+
+def test_location_index_skips_invalid_carparks():
+    """
+    Test the LocationIndex class with invalid locations.
+
+    This test verifies that the carparks without a valid location are skipped.
+    """
+    carparks = [
+        {"facility_id": "1", "name": "valid", "location": {"latitude": -33.8, "longitude": 151.0}},
+        {"facility_id": "2", "name": "missing", "location": None},
+        {"facility_id": "3", "name": "invalid", "location": {"latitude": "n/a", "longitude": 151.0}},
+    ]
+
+    index = LocationIndex(carparks)
+
+    assert len(index) == 1
+    assert index.within(-33.8, 151.0, 1) == [(0.0, "1", "valid")]
@@ -0,0 +1,90 @@
+# test the metrics.py
+# check if the counters and histograms render in the Prometheus text format
+# check if the caches and the /metrics endpoint are instrumented
+
+import pytest
+
+from app.core.metrics import MetricsRegistry, cache_requests_total
+from app.services.cache_service import MeteredTTLCache
+
+
+def test_counter_render():
+    """
+    Test the Counter metric.
+
+    This test verifies that a labelled counter is increased and rendered with its labels.
+    """
+    registry = MetricsRegistry()
+    counter = registry.counter("test_total", "A test counter", labelnames=("status",))
+
+    counter.inc(status=429)
+    counter.inc(2, status=429)
+
+    assert counter.value(status=429) == 3
+    assert 'test_total{status="429"} 3' in registry.render()
+
+
+def test_counter_rejects_wrong_labels():
+    """
+    Test the Counter metric.
+
+    This test verifies that a counter rejects label sets that do not match its label names.
+    """
+    registry = MetricsRegistry()
+    counter = registry.counter("test_total", "A test counter", labelnames=("status",))
+
+    with pytest.raises(ValueError):
+        counter.inc(outcome="ok")
+
+
+def test_histogram_render():
+    """
+    Test the Histogram metric.
+
+    This test verifies that the buckets are rendered cumulatively, with the sum and count of observations.
+    """
+    registry = MetricsRegistry()
+    histogram = registry.histogram("test_seconds", "A test histogram", buckets=(0.1, 1.0))
+
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    text = registry.render()
+    assert 'test_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_seconds_bucket{le="1.0"} 2' in text
+    assert 'test_seconds_bucket{le="+Inf"} 3' in text
+    assert "test_seconds_count 3" in text
+    assert histogram.count() == 3
+
+
+def test_metered_ttl_cache_hits_and_misses():
+    """
+    Test the MeteredTTLCache.
+
+    This test verifies that cache lookups are counted as hits and misses.
+    """
+    cache = MeteredTTLCache("test_cache", maxsize=10, ttl=60)
+    hits = cache_requests_total.value(cache="test_cache", result="hit")
+    misses = cache_requests_total.value(cache="test_cache", result="miss")
+
+    with pytest.raises(KeyError):
+        cache["key"]
+    cache["key"] = "value"
+    assert cache["key"] == "value"
+
+    assert cache_requests_total.value(cache="test_cache", result="hit") == hits + 1
+    assert cache_requests_total.value(cache="test_cache", result="miss") == misses + 1
+
+
+def test_metrics_endpoint(test_client):
+    """
+    Test the /metrics endpoint.
+
+    This test verifies that the metrics page is served in the Prometheus text format.
+    """
+    response = test_client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE nsw_upstream_request_duration_seconds histogram" in response.text
@@ -0,0 +1,92 @@
+# test the occupancy forecast profiles
+
+from datetime import datetime
+
+import pytz
+
+from app.services.occupancy_forecast import OccupancyForecaster, OccupancyProfile, week_slot
+from app.services.occupancy_history import OccupancyHistory
+
+SYDNEY = pytz.timezone("Australia/Sydney")
+# a Thursday at 08:00
+THURSDAY_8AM = SYDNEY.localize(datetime(2025, 6, 12, 8, 0, 0)).timestamp()
+WEEK = 7 * 24 * 3600
+
+
+def test_week_slot():
+    """
+    Test the week_slot function.
+
+    This test verifies that the slot is computed in Sydney time, from Monday 00:00.
+    """
+    assert week_slot(SYDNEY.localize(datetime(2025, 6, 9, 0, 0, 0)).timestamp()) == 0
+    assert week_slot(THURSDAY_8AM) == 3 * 96 + 32
+    assert week_slot(THURSDAY_8AM + 14 * 60) == 3 * 96 + 32
+    assert week_slot(SYDNEY.localize(datetime(2025, 6, 15, 23, 59, 0)).timestamp()) == 7 * 96 - 1
+
+
+def test_profile_forecast_with_trend():
+    """
+    Test the OccupancyProfile class.
+
+    This test verifies that the forecast is the slot mean of the past weeks, adjusted by the
+    recent trend which fades out with the horizon, and the last reading for an empty slot.
+    """
+    profile = OccupancyProfile(trend_time_constant=3600)
+    # the last 3 Thursdays at 08:30, the carpark had 80 cars
+    for week in range(3, 0, -1):
+        profile.update(THURSDAY_8AM + 1800 - week * WEEK, 80, 100)
+
+    # no reading yet for Thursday 08:00
+    assert profile.forecast(THURSDAY_8AM) == {"occupancy": 80, "samples": 0}
+
+    # today at 08:30 the carpark is busier than usual: 90 cars
+    profile.update(THURSDAY_8AM + 1800, 90, 100)
+    assert profile.residual == 10
+    nearly_now = profile.forecast(THURSDAY_8AM + 1800 + 60)
+    next_week = profile.forecast(THURSDAY_8AM + 1800 + WEEK)
+    assert nearly_now["samples"] == 4
+    assert nearly_now["occupancy"] > next_week["occupancy"]
+    # the slot mean (82.5) with a faded out trend
+    assert next_week["occupancy"] == 82
+
+
+def test_profile_weights_weeks_not_readings():
+    """
+    Test the OccupancyProfile class with frequent readings.
+
+    This test verifies that the readings of a slot in the same week count as one week,
+    so that polling every minute does not erase the past weeks from the slot mean.
+    """
+    profile = OccupancyProfile(max_weight=8)
+    # 4 past Thursdays at 08:00 with 40 cars
+    for week in range(4, 0, -1):
+        profile.update(THURSDAY_8AM - week * WEEK, 40, 100)
+    # today, 15 readings of 80 cars, one per minute
+    for minute in range(15):
+        profile.update(THURSDAY_8AM + minute * 60, 80, 100)
+
+    slot = week_slot(THURSDAY_8AM)
+    assert profile.weeks[slot] == 4
+    assert profile.counts[slot] == 19
+    # one week of 80 among 5 weeks: 40 + (80 - 40) / 5
+    assert profile.slot_mean(slot) == 48
+    assert profile.forecast(THURSDAY_8AM + WEEK)["occupancy"] == 48
+
+
+def test_forecaster_rebuild_from_history():
+    """
+    Test the OccupancyForecaster class.
+
+    This test verifies that the profiles can be rebuilt from the occupancy history.
+    """
+    history = OccupancyHistory(capacity=10)
+    for week in range(3, 0, -1):
+        history.record("111", {"spots": "100", "occupancy": {"total": "70"}, "MessageDate": None})
+        buffer = history.get("111")
+        buffer.timestamps[buffer.physical_index(buffer.size - 1)] = THURSDAY_8AM - week * WEEK
+
+    forecaster = OccupancyForecaster()
+    assert forecaster.rebuild(history) == 1
+    assert forecaster.forecast("111", THURSDAY_8AM) == {"occupancy": 70, "samples": 3, "spots": 100}
+    assert forecaster.forecast("222", THURSDAY_8AM) is None
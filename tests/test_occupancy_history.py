@@ -0,0 +1,63 @@
+# test the occupancy history ring buffers
+
+from app.services.occupancy_history import OccupancyHistory, OccupancyRingBuffer
+
+
+def test_ring_buffer_overwrites_oldest():
+    """
+    Test the OccupancyRingBuffer class.
+
+    This test verifies that the oldest readings are overwritten once the buffer is full,
+    and that a reading which is not newer than the last one is ignored.
+    """
+    buffer = OccupancyRingBuffer(capacity=3)
+    for minute in range(5):
+        assert buffer.append(minute * 60.0, minute) is True
+    assert buffer.append(240.0, 99) is False
+
+    assert buffer.size == 3
+    points = buffer.downsample(0, 1000, 60)
+    assert [point["occupancy"] for point in points] == [2, 3, 4]
+
+
+def test_ring_buffer_downsample():
+    """
+    Test the OccupancyRingBuffer class.
+
+    This test verifies that the readings in the range are aggregated into clock-aligned buckets.
+    """
+    buffer = OccupancyRingBuffer(capacity=100)
+    # one reading per minute, occupancy = minute
+    for minute in range(60):
+        buffer.append(minute * 60.0, minute)
+
+    points = buffer.downsample(10 * 60, 39 * 60, 15 * 60)
+
+    assert [point["timestamp"] for point in points] == [0, 900, 1800]
+    assert points[0] == {"timestamp": 0, "occupancy": 12, "min_occupancy": 10, "max_occupancy": 14}
+    assert points[2]["min_occupancy"] == 30 and points[2]["max_occupancy"] == 39
+
+
+def test_occupancy_history_record_and_persist(tmp_path, mock_carpark_details):
+    """
+    Test the OccupancyHistory class.
+
+    This test verifies that the readings of the detail payloads are recorded once
+    per MessageDate, and survive a save and load.
+
+    Parameters:
+        tmp_path: the pytest temporary directory
+        mock_carpark_details: the mock carpark details
+    """
+    history = OccupancyHistory(capacity=10)
+    assert history.record("111", mock_carpark_details) is True
+    assert history.record("111", mock_carpark_details) is False
+    assert history.record("111", {**mock_carpark_details, "MessageDate": "2025-06-12T10:05:00"}) is True
+    assert history.record("222", {"spots": "10"}) is False
+
+    assert history.save(str(tmp_path)) == 1
+    loaded = OccupancyHistory(capacity=1)
+    assert loaded.load(str(tmp_path)) == 1
+    buffer = loaded.get("111")
+    assert buffer.size == 1 and buffer.spots == 100
+    assert buffer.last_timestamp == history.get("111").last_timestamp
@@ -0,0 +1,128 @@
+# test the adaptive polling scheduler and the background poller
+
+from datetime import datetime
+from unittest.mock import patch
+
+import pytz
+
+from app.services.cache_service import last_known_details
+from app.services.polling_scheduler import (
+    BackgroundPoller,
+    PollingScheduler,
+    get_polled_details,
+    polling_scheduler,
+    time_of_day_factor,
+)
+
+SYDNEY = pytz.timezone("Australia/Sydney")
+# a Thursday, during the morning peak
+PEAK_TIME = SYDNEY.localize(datetime(2025, 6, 12, 8, 0, 0))
+
+
+def details(occupancy, spots=100):
+    return {"spots": str(spots), "occupancy": {"total": str(occupancy)}}
+
+
+def test_time_of_day_factor():
+    """
+    Test the time_of_day_factor function.
+
+    This test verifies that the weekday peaks get the whole budget, the night a small share.
+    """
+    assert time_of_day_factor(PEAK_TIME) == 1.0
+    assert time_of_day_factor(SYDNEY.localize(datetime(2025, 6, 12, 3, 0, 0))) == 0.1
+    assert time_of_day_factor(SYDNEY.localize(datetime(2025, 6, 12, 12, 0, 0))) == 0.5
+    # Saturday morning
+    assert time_of_day_factor(SYDNEY.localize(datetime(2025, 6, 14, 8, 0, 0))) == 0.5
+
+
+def test_polling_scheduler_fits_the_budget():
+    """
+    Test the PollingScheduler class.
+
+    This test verifies that a busy or looked up facility is polled more often than a static one,
+    and that the total polling rate never exceeds the budget.
+    """
+    scheduler = PollingScheduler(requests_per_second=0.5, min_interval=1, max_interval=3600)
+    scheduler.sync(str(i) for i in range(100))
+    now = 1_000_000.0
+    for facility_id in ("0", "1", "2"):
+        scheduler.record_poll(facility_id, details(10), now=now)
+    # 0 fills up quickly, 1 is looked up a lot, 2 does not change
+    scheduler.record_poll("0", details(60), now=now + 1800)
+    scheduler.record_poll("1", details(10), now=now + 1800)
+    scheduler.record_poll("2", details(10), now=now + 1800)
+    for _ in range(20):
+        scheduler.record_demand("1", now=now + 1800)
+    scheduler.reschedule(now=now + 1800, local_time=PEAK_TIME)
+
+    intervals = {facility_id: scheduler.get(facility_id).interval for facility_id in ("0", "1", "2")}
+    assert intervals["0"] < intervals["2"]
+    assert intervals["1"] < intervals["2"]
+    total_rate = sum(1 / scheduler.get(str(i)).interval for i in range(100))
+    assert total_rate <= 0.5 + 1e-9
+
+    # facilities never polled are due first, then the polled ones once their interval elapsed
+    due = scheduler.due(now=now + 1800)
+    assert "0" not in due and len(due) == 97
+
+    # facilities which are no longer in the fleet are dropped
+    scheduler.sync(["0", "1"])
+    assert len(scheduler) == 2 and "2" not in scheduler
+
+
+def test_background_poller_run_once(mock_all_carparks_response, mock_carpark_details):
+    """
+    Test the BackgroundPoller class.
+
+    This test verifies that the poller skips the no-update carparks, polls the others
+    and that the polled details are served while they are within their interval.
+    """
+    scheduler = PollingScheduler(requests_per_second=1000, min_interval=60, max_interval=3600)
+    poller = BackgroundPoller(scheduler)
+    with (
+        patch("app.services.polling_scheduler.get_all_carpark_ids", return_value=mock_all_carparks_response),
+        patch("app.services.polling_scheduler.get_no_update_carparks", return_value={"222"}),
+        patch("app.services.polling_scheduler.get_carpark_details", return_value=mock_carpark_details) as mock_get,
+    ):
+        assert poller.run_once() == 2
+        assert sorted(call.args[0] for call in mock_get.call_args_list) == ["111", "333"]
+        # nothing is due right after the polls
+        assert poller.run_once() == 0
+
+    assert {row["facility_id"] for row in scheduler.freshness()} == {"111", "333"}
+
+
+def test_get_polled_details(mock_carpark_details):
+    """
+    Test the get_polled_details function.
+
+    This test verifies that the polled details are only served within the refresh interval,
+    and never older than the maximum age served.
+    """
+    assert get_polled_details("111") is None
+    polling_scheduler.sync(["111"])
+    polling_scheduler.get("111").interval = 60
+    last_known_details.put("111", mock_carpark_details)
+    fetched_at = last_known_details.get("111").fetched_at
+    assert get_polled_details("111", now=fetched_at + 30) == mock_carpark_details
+    assert get_polled_details("111", now=fetched_at + 61) is None
+
+    polling_scheduler.get("111").interval = 3600
+    assert get_polled_details("111", now=fetched_at + 50, max_age=60) == mock_carpark_details
+    assert get_polled_details("111", now=fetched_at + 61, max_age=60) is None
+
+
+def test_background_poller_paused():
+    """
+    Test the BackgroundPoller class.
+
+    This test verifies that nothing is polled while the sweeps are paused.
+    """
+    from app.services.sweep_progress import sweep_progress
+
+    poller = BackgroundPoller(PollingScheduler(requests_per_second=100))
+    sweep_progress.pause()
+    with patch("app.services.polling_scheduler.get_carpark_details") as get_carpark_details:
+        assert poller.run_once() == 0
+    get_carpark_details.assert_not_called()
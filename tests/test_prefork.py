@@ -0,0 +1,260 @@
+# test the preforking server
+
+import gc
+import json
+import os
+from unittest.mock import MagicMock, call, patch
+
+from app.core import prefork
+from app.core.master_channel import master_channel
+from app.core.prefork import PreforkServer, runs_background_tasks, warm_snapshot
+from app.services.availability_service import availability_store
+from app.services.cache_service import carpark_locations_cache, last_known_details
+from app.services.change_log import change_log
+from app.services.fleet_snapshot import build_fleet_snapshot, fleet_snapshots
+from app.services.nsw_transport_api import record_reading
+from app.services.occupancy_history import occupancy_history
+from app.services.sweep_progress import sweep_progress
+
+
+def test_runs_background_tasks():
+    """
+    Test the runs_background_tasks function.
+
+    This test verifies that the background tasks run in the single process, or in the first worker only.
+    """
+    assert runs_background_tasks()
+    with patch.object(prefork, "worker_index", 0):
+        assert runs_background_tasks()
+    with patch.object(prefork, "worker_index", 1):
+        assert not runs_background_tasks()
+
+
+def test_warm_snapshot(mock_carpark_locations):
+    """
+    Test the warm_snapshot function.
+
+    This test verifies that the in-process fleet caches are cleared before building the snapshot,
+    and that a stale snapshot (NSW API unavailable) is not reported as fresh.
+    """
+    carpark_locations_cache["old"] = "snapshot"
+    with patch("app.core.prefork.get_carpark_locations", return_value=mock_carpark_locations):
+        assert warm_snapshot()
+    assert "old" not in carpark_locations_cache
+    assert len(fleet_snapshots.current().index) == len(mock_carpark_locations["carparks"])
+
+    with patch("app.core.prefork.get_carpark_locations", return_value={**mock_carpark_locations, "stale": True}):
+        assert not warm_snapshot()
+    with patch("app.core.prefork.get_carpark_locations", return_value=None):
+        assert not warm_snapshot()
+
+    carpark_locations_cache["old"] = "snapshot"
+    sweep_progress.pause()
+    with patch("app.core.prefork.get_carpark_locations") as get_carpark_locations:
+        assert not warm_snapshot()
+    get_carpark_locations.assert_not_called()
+    assert "old" in carpark_locations_cache
+
+
+def test_reap_restarts_dead_workers():
+    """
+    Test the PreforkServer.reap method.
+
+    This test verifies that a worker which exited is replaced with the same index, and that the
+    workers are not replaced while the server is stopping.
+    """
+    server = PreforkServer(app=None, workers=2)
+    server.children = {101: 0, 102: 1}
+    with patch("app.core.prefork.os.waitpid", side_effect=[(102, 9), (0, 0)]):
+        with patch.object(server, "spawn") as spawn:
+            server.reap()
+    spawn.assert_called_once_with(1)
+    assert server.children == {101: 0}
+
+    server._stopping = True
+    with patch("app.core.prefork.os.waitpid", side_effect=[(101, 0), (0, 0)]):
+        with patch.object(server, "spawn") as spawn:
+            server.reap()
+    spawn.assert_not_called()
+
+
+def test_publish_forks_a_new_generation():
+    """
+    Test the PreforkServer.publish method.
+
+    This test verifies that the new generation is forked before the previous one is stopped.
+    """
+    server = PreforkServer(app=None, workers=2, startup_grace=0)
+    server.children = {101: 0, 102: 1}
+    events = MagicMock()
+
+    with patch.object(server, "fork_generation", side_effect=events.fork_generation):
+        with patch.object(server, "retire", side_effect=events.retire):
+            server.publish()
+    assert events.mock_calls == [call.fork_generation(), call.retire({101: 0, 102: 1})]
+
+
+def test_fork_generation_unfreezes_the_gc():
+    """
+    Test the PreforkServer.fork_generation method.
+
+    This test verifies that the objects frozen for the forked workers are unfrozen in the master,
+    so that the snapshots of the previous generations can be collected.
+    """
+    server = PreforkServer(app=None, workers=2)
+    with patch.object(server, "spawn") as spawn:
+        server.fork_generation()
+    assert spawn.call_count == 2
+    assert gc.get_freeze_count() == 0
+
+
+def test_master_records_the_readings_of_the_workers():
+    """
+    Test the occupancy readings sent by a forked worker.
+
+    This test verifies that a worker sends the readings it fetches to the master instead of recording
+    them, and that the master records them in the occupancy history.
+    """
+    details = {"spots": "100", "occupancy": {"total": "40", "loop": "1"}, "MessageDate": "2024-01-01T10:00:00"}
+    master_channel.open()
+    try:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                master_channel.attach_worker()
+                record_reading("1", details)
+            finally:
+                os._exit(0 if occupancy_history.get("1") is None else 1)
+        assert os.waitpid(pid, 0)[1] == 0
+        messages = master_channel.receive(timeout=5)
+        assert [message["kind"] for message in messages] == ["reading"]
+        PreforkServer(app=None).handle_messages(messages)
+    finally:
+        master_channel.close()
+    buffer = occupancy_history.get("1")
+    assert buffer.spots == 100
+    assert buffer.last_occupancy == 40
+
+
+def test_master_applies_the_admin_actions_of_the_workers(test_client, mock_carpark_details):
+    """
+    Test the admin actions handled by a forked worker.
+
+    This test verifies that the worker sends them to the master, which applies them and publishes a single
+    new generation of workers for all of them, and that a warmup is refreshed by the master instead.
+    """
+    last_known_details.put("111", mock_carpark_details)
+    master_channel.open()
+    try:
+        with patch("app.core.security.ADMIN_API_TOKEN", "admin-token"):
+            pid = os.fork()
+            if pid == 0:
+                exit_code = 1
+                try:
+                    master_channel.attach_worker()
+                    with patch("app.api.v1.endpoints.admin.start_warmup") as start_warmup:
+                        for path in ("/admin/sweeps/pause", "/admin/facilities/111/invalidate", "/admin/warmup"):
+                            assert test_client.post(path, headers={"X-Admin-Token": "admin-token"}).status_code < 300
+                    start_warmup.assert_not_called()
+                    exit_code = 0
+                finally:
+                    os._exit(exit_code)
+        assert os.waitpid(pid, 0)[1] == 0
+        messages = master_channel.receive(timeout=5)
+    finally:
+        master_channel.close()
+    assert [message["action"] for message in messages] == ["pause", "invalidate_facility", "warmup"]
+
+    server = PreforkServer(app=None, startup_grace=0)
+    server.handle_messages(messages)
+    assert sweep_progress.paused
+    assert last_known_details.get("111") is None
+    with patch.object(server, "fork_generation") as fork_generation:
+        with patch("app.core.prefork.get_carpark_locations") as get_carpark_locations:
+            server.run_requested()
+    # The refresh is skipped while the sweeps are paused, the actions are still published
+    get_carpark_locations.assert_not_called()
+    fork_generation.assert_called_once_with()
+
+    server.handle_messages([{"kind": "admin", "action": "resume"}])
+    assert not sweep_progress.paused
+
+
+def test_workers_answer_a_cursor_alike(mock_carpark_locations):
+    """
+    Test the change feed of the forked workers.
+
+    This test verifies that two workers of a generation answer the same cursor with the same versions and
+    changes of the master, even after republishing their own availabilities, so that a client may hit either.
+    """
+    fleet_snapshots.publish(build_fleet_snapshot(mock_carpark_locations))
+    cursor = change_log.cursor()
+    availability_store.update("111", {"spots": "100", "occupancy": {"total": "60"}})
+    fleet_snapshots.publish(build_fleet_snapshot(mock_carpark_locations))
+    reader, writer = os.pipe()
+
+    def answer(sockets):
+        # Run by each worker instead of the uvicorn server
+        availability_store.update("111", {"spots": "100", "occupancy": {"total": str(os.getpid() % 100)}})
+        fleet_snapshots.get()
+        changes = change_log.changes(cursor)
+        os.write(writer, (json.dumps(changes) + "\n").encode())
+
+    server = PreforkServer(app=None, workers=2)
+    with patch("app.core.prefork.uvicorn.Server") as uvicorn_server:
+        uvicorn_server.return_value.run.side_effect = answer
+        server.fork_generation()
+    for pid in list(server.children):
+        assert os.waitpid(pid, 0)[1] == 0
+    os.close(writer)
+    with os.fdopen(reader) as answers:
+        first, second = [json.loads(line) for line in answers]
+
+    assert first == second
+    assert first["version"] == change_log.cursor(2)
+    assert first["full_resync"] is False
+    assert [facility[0] for facility in first["changed"]] == ["111"]
+    assert first["changed"][0][5] == 40
+
+
+def test_refresh_publishes_fresh_snapshots_only():
+    """
+    Test the PreforkServer.refresh method.
+
+    This test verifies that the workers are only re-forked when a fresh snapshot was built.
+    """
+    server = PreforkServer(app=None)
+    server._refresh_requested = True
+    with patch.object(server, "publish") as publish:
+        with patch("app.core.prefork.warm_snapshot", return_value=False):
+            server.refresh()
+        publish.assert_not_called()
+        with patch("app.core.prefork.warm_snapshot", return_value=True):
+            server.refresh()
+        publish.assert_called_once()
+    assert not server._refresh_requested
+
+
+def test_share_upstream_budget():
+    """
+    Test the share_upstream_budget function.
+
+    This test verifies that each process gets an equal share of the NSW budget, rounded down
+    and at least 1 request per second, and that the poller budget follows the share.
+    """
+    from app.services.nsw_transport_api import upstream_throttle
+    from app.services.polling_scheduler import polling_scheduler
+
+    rate, poll_rate = upstream_throttle.requests_per_second, polling_scheduler.requests_per_second
+    try:
+        assert prefork.share_upstream_budget(3, requests_per_second=5) == 1
+        assert upstream_throttle.requests_per_second == 1
+        assert upstream_throttle.background_limit == 1
+        assert prefork.share_upstream_budget(2, requests_per_second=10) == 5
+        assert upstream_throttle.requests_per_second == 5
+        assert upstream_throttle.background_limit == 4
+        assert polling_scheduler.requests_per_second == 5 * prefork.POLL_BUDGET_FRACTION
+        assert prefork.share_upstream_budget(8, requests_per_second=5) == 1
+    finally:
+        upstream_throttle.set_rate(rate)
+        polling_scheduler.requests_per_second = poll_rate
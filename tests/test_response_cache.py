@@ -0,0 +1,54 @@
+# test the encoded response cache
+
+from app.services.response_cache import ResponseCache, encode_body, etag_matches
+
+
+def test_encode_body():
+    """
+    Test the encode_body function.
+
+    This test verifies that the ETag is quoted and only depends on the content of the body.
+    """
+    encoded = encode_body(b'{"facility_id":"111"}')
+    assert encoded.body == b'{"facility_id":"111"}'
+    assert encoded.etag.startswith('"') and encoded.etag.endswith('"')
+    assert encode_body(b'{"facility_id":"111"}').etag == encoded.etag
+    assert encode_body(b'{"facility_id":"112"}').etag != encoded.etag
+
+
+def test_etag_matches():
+    """
+    Test the etag_matches function.
+
+    This test verifies that an If-None-Match header matches the ETag it lists, weak or not, and any ETag with '*'.
+    """
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('"def", W/"abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"def"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+    assert not etag_matches("", '"abc"')
+
+
+def test_response_cache_is_built_once_per_details():
+    """
+    Test the ResponseCache class.
+
+    This test verifies that a response is served for the details payload it was built from, or a payload
+    of the same content (the same details fetched again), and not for changed details, stale details
+    or a forgotten facility.
+    """
+    cache = ResponseCache("test_responses")
+    details = {"spots": "100", "occupancy": {"total": "10"}}
+    assert cache.get("111", details) is None
+
+    encoded = cache.put("111", details, b"{}")
+    assert cache.get("111", details) is encoded
+    assert cache.get("111", details, stale=True) is None
+    assert cache.get("111", {"occupancy": {"total": "10"}, "spots": "100"}) is encoded
+    assert cache.get("111", {"spots": "100", "occupancy": {"total": "11"}}) is None
+    assert cache.get("112", details) is None
+
+    cache.forget("111")
+    assert cache.get("111", details) is None
+    assert len(cache) == 0
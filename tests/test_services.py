@@ -4,8 +4,9 @@
 # check if the functions could handle the error
 # check if the functions could get the correct result
 
+import threading
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -14,6 +15,7 @@ import requests
 
 from app.core import config
 from app.services import nsw_transport_api
+from app.services.cache_service import last_known_details
 from app.services.nsw_transport_api import (
     available_status,
     fetch_no_update_carparks,
@@ -22,74 +24,121 @@ from app.services.nsw_transport_api import (
     get_no_update_carparks,
     is_carpark_no_update,
 )
+from app.services.retry_policy import RetryPolicy, parse_retry_after
+from app.services.staleness_tracker import staleness_tracker
+from app.services.sweep_progress import sweep_progress
+from app.services.upstream_throttle import (
+    BACKGROUND,
+    INTERACTIVE,
+    PriorityThrottle,
+    current_priority,
+    upstream_priority,
+)
+from app.utils.time_utils import get_local_time
 
 
-def test_reset_request_counter():
+def test_throttle_resets_in_new_second():
     """
-    Test the reset_request_counter function.
-    This function is used to reset the request counter if we're in a new second.
+    Test the PriorityThrottle class.
+    The throttle allows MAX_REQUESTS_PER_SECOND requests in each second.
 
-    This test verifies that the request counter is reset when enough time has passed.
-    (Because the request counter is a global variable, we need to use the nsw_transport_api module to access it.)
+    This test verifies that the request count is reset when we're in a new second.
     """
-    # mock the request_count to 5
-    nsw_transport_api.request_count = 5
-    # mock the last_request_time to 100.0
-    nsw_transport_api.last_request_time = 100.0
+    throttle = PriorityThrottle(requests_per_second=5)
+    throttle._window = 100
+    throttle.request_count = 5
 
     # mock the time.time() to 101.0
-    with patch("app.services.nsw_transport_api.time.time", return_value=101.0):
-        nsw_transport_api.reset_request_counter()
+    with patch("app.services.upstream_throttle.time.time", return_value=101.0):
+        waited = throttle.acquire(INTERACTIVE)
 
-    # verify the request_count and last_request_time
-    assert nsw_transport_api.request_count == 0
-    assert nsw_transport_api.last_request_time == 101.0
+    # verify the request count is reset, then counts this request
+    assert throttle.request_count == 1
+    assert waited < 0.5
 
 
-def test_reset_request_counter_same_second():
+def test_throttle_same_second():
     """
-    Test the reset_request_counter function.
+    Test the PriorityThrottle class.
 
-    This test verifies that the request counter is not reset when in the same second.
-    (Because the request counter is a global variable, we need to use the nsw_transport_api module to access it.)
+    This test verifies that the request count is not reset when in the same second.
     """
-    # mock the request_count to 5
-    nsw_transport_api.request_count = 4
-    # mock the last_request_time to 100.0
-    nsw_transport_api.last_request_time = 100.0
+    throttle = PriorityThrottle(requests_per_second=5)
+    throttle._window = 100
+    throttle.request_count = 3
 
     # Mock time.time() to return a time in the same second
-    with patch("app.services.nsw_transport_api.time.time", return_value=100.5):
-        nsw_transport_api.reset_request_counter()
+    with patch("app.services.upstream_throttle.time.time", return_value=100.5):
+        throttle.acquire(INTERACTIVE)
 
     # Counter should not be reset
-    assert nsw_transport_api.request_count == 4
-    assert nsw_transport_api.last_request_time == 100.0
+    assert throttle.request_count == 4
 
 
-def test_wait_for_next_second_calls_sleep():
+def test_throttle_waits_for_next_second():
     """
-    Test the wait_for_next_second function.
+    Test the PriorityThrottle class.
 
-    This test verifies that the wait_for_next_second function calls the sleep function.
+    This test verifies that a request waits for the next second once the limit is hit.
     """
-    # mock the time.time() to 100.3
-    fake_time = 100.3
-    expected_sleep_time = 1.0 - (fake_time - int(fake_time))  # 0.7
+    throttle = PriorityThrottle(requests_per_second=2)
+    for _ in range(2):
+        throttle.acquire(INTERACTIVE)
+    start = time.time()
+    throttle.acquire(INTERACTIVE)
 
-    # mock the time.time() to 100.3
-    with (
-        patch("app.services.nsw_transport_api.time.time", return_value=fake_time),
-        patch("app.services.nsw_transport_api.time.sleep") as mock_sleep,
-    ):
+    # the third request of the second is sent in the next second
+    assert int(time.time()) > int(start)
+    assert throttle.request_count == 1
 
-        nsw_transport_api.wait_for_next_second()
 
-        # verify the sleep function is called once, and the parameter is 0.7 (approximately)
-        mock_sleep.assert_called_once()
-        # (args, kwargs)
-        args, _ = mock_sleep.call_args
-        assert pytest.approx(args[0], 0.001) == expected_sleep_time
+def test_throttle_keeps_reserved_capacity_for_interactive():
+    """
+    Test the PriorityThrottle class.
+
+    This test verifies that background requests leave the reserved capacity to
+    the interactive requests, and that a waiting interactive request is served
+    before the waiting background requests.
+    """
+    throttle = PriorityThrottle(requests_per_second=3, interactive_reserved=1)
+    # wait for the start of a second, so that the whole test runs in the same windows
+    time.sleep(1.0 - (time.time() % 1.0))
+    throttle.acquire(BACKGROUND)
+    throttle.acquire(BACKGROUND)
+    # the reserved slot is still free for an interactive request
+    assert throttle.acquire(INTERACTIVE) < 0.5
+    assert throttle.request_count == 3
+
+    # the window is full: queue background requests, then an interactive request
+    order = []
+
+    def send(priority):
+        throttle.acquire(priority)
+        order.append(priority)
+
+    background = [threading.Thread(target=send, args=(BACKGROUND,)) for _ in range(3)]
+    for thread in background:
+        thread.start()
+    time.sleep(0.05)
+    interactive = threading.Thread(target=send, args=(INTERACTIVE,))
+    interactive.start()
+    for thread in background + [interactive]:
+        thread.join()
+
+    assert order[0] == INTERACTIVE
+    assert order.count(BACKGROUND) == 3
+
+
+def test_upstream_priority_context():
+    """
+    Test the upstream_priority context manager.
+
+    This test verifies that the requests are interactive unless sent in a background block.
+    """
+    assert current_priority() == INTERACTIVE
+    with upstream_priority(BACKGROUND):
+        assert current_priority() == BACKGROUND
+    assert current_priority() == INTERACTIVE
 
 
 def test_make_api_request_success(mock_url, mock_headers, mock_success_response):
@@ -106,15 +155,11 @@ def test_make_api_request_success(mock_url, mock_headers, mock_success_response)
     """
     # mock the requests.get function
     # mock the get request to return the mock response
-    # mock the reset_request_counter as null function,do nothing
-    # mock the wait_for_next_second as null function,do nothing
     with (
         patch(
             "app.services.nsw_transport_api.requests.get",
             return_value=mock_success_response,
         ),
-        patch("app.services.nsw_transport_api.reset_request_counter"),
-        patch("app.services.nsw_transport_api.wait_for_next_second"),
     ):
 
         result = nsw_transport_api.make_api_request(mock_url, mock_headers)
@@ -147,13 +192,14 @@ def test_make_api_request_rate_limit(mock_url, mock_headers, mock_success_respon
             "app.services.nsw_transport_api.requests.get",
             side_effect=[mock_response_429, mock_success_response],
         ),
-        patch("app.services.nsw_transport_api.reset_request_counter"),
-        patch("app.services.nsw_transport_api.wait_for_next_second"),
+        patch("app.services.nsw_transport_api.time.sleep") as mock_sleep,
     ):
 
         result = nsw_transport_api.make_api_request(mock_url, mock_headers)
 
         assert result == {"result": "ok"}
+        # backed off once before the retry
+        mock_sleep.assert_called_once()
 
 
 def test_make_api_request_throttle_limit_and_reset(mock_url, mock_headers, mock_success_response):
@@ -170,9 +216,9 @@ def test_make_api_request_throttle_limit_and_reset(mock_url, mock_headers, mock_
     """
 
     # mock the request_count to the max requests per second (5 requests per second)
-    nsw_transport_api.request_count = config.MAX_REQUESTS_PER_SECOND
-    # mock the last_request_time to the time 2 seconds ago
-    nsw_transport_api.last_request_time = time.time() - 2
+    nsw_transport_api.upstream_throttle.request_count = config.MAX_REQUESTS_PER_SECOND
+    # mock the window to the second 2 seconds ago
+    nsw_transport_api.upstream_throttle._window = int(time.time()) - 2
 
     # patch the requests.get function to return the mock response
     with patch(
@@ -182,7 +228,7 @@ def test_make_api_request_throttle_limit_and_reset(mock_url, mock_headers, mock_
         result = nsw_transport_api.make_api_request(mock_url, mock_headers)
 
         assert result == {"result": "ok"}
-        assert nsw_transport_api.request_count == 1
+        assert nsw_transport_api.upstream_throttle.request_count == 1
 
 
 def test_make_api_request_error_returns_none(mock_url, mock_headers):
@@ -196,9 +242,12 @@ def test_make_api_request_error_returns_none(mock_url, mock_headers):
         mock_headers: the mock headers
     """
     # mock the requests.get function to raise a RequestException
-    with patch(
-        "app.services.nsw_transport_api.requests.get",
-        side_effect=requests.exceptions.RequestException("Network Error"),
+    with (
+        patch(
+            "app.services.nsw_transport_api.requests.get",
+            side_effect=requests.exceptions.RequestException("Network Error"),
+        ),
+        patch("app.services.nsw_transport_api.time.sleep"),
     ):
         result = nsw_transport_api.make_api_request(mock_url, mock_headers)
         assert result is None
@@ -267,14 +316,21 @@ def test_get_carpark_details_retry_success(mock_carpark_details, mock_url, mock_
         mock_url: the mock url
         mock_headers: the mock headers
     """
+    # First request fails with a 503, the second one returns the details
+    mock_response_503 = MagicMock()
+    mock_response_503.status_code = 503
+    mock_response_503.headers = {}
+    mock_response_503.raise_for_status.side_effect = requests.exceptions.HTTPError(response=mock_response_503)
+    mock_response_200 = MagicMock()
+    mock_response_200.status_code = 200
+    mock_response_200.json.return_value = mock_carpark_details
 
-    # First call returns None, second call returns response
-    # mock the make_api_request function to return None, then return the mock response
     with (
         patch(
-            "app.services.nsw_transport_api.make_api_request",
-            side_effect=[None, mock_carpark_details],
+            "app.services.nsw_transport_api.requests.get",
+            side_effect=[mock_response_503, mock_response_200],
         ),
+        patch("app.services.nsw_transport_api.time.sleep"),
         patch("app.services.nsw_transport_api.get_facility_url", return_value=mock_url),
         patch("app.services.nsw_transport_api.get_nsw_headers", return_value=mock_headers),
     ):
@@ -284,6 +340,88 @@ def test_get_carpark_details_retry_success(mock_carpark_details, mock_url, mock_
         assert result == mock_carpark_details
 
 
+def test_get_carpark_details_not_found_not_retried(mock_url, mock_headers):
+    """
+    Test the get_carpark_details function.
+
+    This test verifies that a 404 (non-retryable error) is not retried.
+
+    Parameters:
+        mock_url: the mock url
+        mock_headers: the mock headers
+    """
+    mock_response_404 = MagicMock()
+    mock_response_404.status_code = 404
+    mock_response_404.raise_for_status.side_effect = requests.exceptions.HTTPError(response=mock_response_404)
+
+    with (
+        patch("app.services.nsw_transport_api.requests.get", return_value=mock_response_404) as mock_get,
+        patch("app.services.nsw_transport_api.time.sleep") as mock_sleep,
+        patch("app.services.nsw_transport_api.get_facility_url", return_value=mock_url),
+        patch("app.services.nsw_transport_api.get_nsw_headers", return_value=mock_headers),
+    ):
+
+        result = nsw_transport_api.get_carpark_details("999", retry_count=3)
+
+    assert result is None
+    assert mock_get.call_count == 1
+    mock_sleep.assert_not_called()
+
+
+def test_make_api_request_honours_retry_after(mock_url, mock_headers, mock_success_response):
+    """
+    Test the make_api_request function.
+
+    This test verifies that the backoff is never shorter than the Retry-After header of a 429.
+
+    Parameters:
+        mock_url: the mock url
+        mock_headers: the mock headers
+        mock_success_response: the mock success response
+    """
+    mock_response_429 = MagicMock()
+    mock_response_429.status_code = 429
+    mock_response_429.headers = {"Retry-After": "3"}
+
+    with (
+        patch(
+            "app.services.nsw_transport_api.requests.get",
+            side_effect=[mock_response_429, mock_success_response],
+        ),
+        patch("app.services.nsw_transport_api.time.sleep") as mock_sleep,
+    ):
+        result = nsw_transport_api.make_api_request(mock_url, mock_headers)
+
+    assert result == {"result": "ok"}
+    assert mock_sleep.call_args[0][0] >= 3
+
+
+def test_make_api_request_stops_at_deadline(mock_url, mock_headers):
+    """
+    Test the make_api_request function.
+
+    This test verifies that no retry is started when the backoff would exceed the deadline.
+
+    Parameters:
+        mock_url: the mock url
+        mock_headers: the mock headers
+    """
+    mock_response_429 = MagicMock()
+    mock_response_429.status_code = 429
+    mock_response_429.headers = {"Retry-After": "60"}
+    policy = RetryPolicy(max_attempts=3, deadline=5)
+
+    with (
+        patch("app.services.nsw_transport_api.requests.get", return_value=mock_response_429) as mock_get,
+        patch("app.services.nsw_transport_api.time.sleep") as mock_sleep,
+    ):
+        result = nsw_transport_api.make_api_request(mock_url, mock_headers, retry_policy=policy)
+
+    assert result is None
+    assert mock_get.call_count == 1
+    mock_sleep.assert_not_called()
+
+
 def test_get_carpark_details_all_fail(mock_url, mock_headers):
     """
     Test the get_carpark_details function.
@@ -437,6 +575,42 @@ def test_fetch_no_update_carparks_no_stale(mock_all_carparks_response, mock_sydn
         assert result == set()
 
 
+def test_fetch_no_update_carparks_incremental(mock_all_carparks_response, mock_sydney_local_time):
+    """
+    Test the fetch_no_update_carparks function.
+
+    This test verifies that a second sweep only fetches the no-update carparks,
+    and that a recent carpark is fetched again once it could have become no-update.
+
+    Parameters:
+        mock_all_carparks_response: the mock all carpark ids response
+        mock_sydney_local_time: the mock sydney local time
+    """
+    sydney = pytz.timezone("Australia/Sydney")
+    current_time = sydney.localize(datetime.fromisoformat(mock_sydney_local_time))
+    # 111 and 333 updated an hour ago, 222 two days ago
+    message_dates = {"111": "2025-06-12T10:00:00", "222": "2025-06-10T10:00:00", "333": "2025-06-12T10:00:00"}
+
+    with patch("app.services.nsw_transport_api.get_carpark_details") as mock_get:
+        mock_get.side_effect = lambda fid: {"facility_id": fid, "MessageDate": message_dates[fid]}
+
+        assert fetch_no_update_carparks(mock_all_carparks_response, current_time) == {"222"}
+        assert mock_get.call_count == 3
+
+        # an hour later, only the no-update carpark can have changed
+        mock_get.reset_mock()
+        message_dates["222"] = "2025-06-12T12:00:00"
+        one_hour_later = sydney.localize(datetime.fromisoformat("2025-06-12T12:08:35"))
+        assert fetch_no_update_carparks(mock_all_carparks_response, one_hour_later) == set()
+        assert [call.args[0] for call in mock_get.call_args_list] == ["222"]
+
+        # the next day, 111 and 333 are 24 hours old and must be checked again
+        mock_get.reset_mock()
+        next_day = sydney.localize(datetime.fromisoformat("2025-06-13T10:30:00"))
+        assert fetch_no_update_carparks(mock_all_carparks_response, next_day) == {"111", "333"}
+        assert sorted(call.args[0] for call in mock_get.call_args_list) == ["111", "333"]
+
+
 def test_get_no_update_carparks_cache(mock_all_carparks_response):
     """
     Test the get_no_update_carparks function.
@@ -511,6 +685,55 @@ def test_get_carpark_locations_cache(mock_carpark_details, mock_all_carparks_res
         assert mock_no_update_carparks.call_count == 1
 
 
+def test_get_carpark_locations_renew(mock_carpark_details, mock_all_carparks_response):
+    """
+    Test the get_carpark_locations function with renew.
+
+    This test verifies that the locations are swept again even if they are cached, and that the new ones
+    are cached, unless the sweeps are paused.
+    """
+    nsw_transport_api._build_carpark_locations.cache_clear()
+    with (
+        patch("app.services.nsw_transport_api.get_carpark_details", return_value=mock_carpark_details) as details,
+        patch("app.services.nsw_transport_api.get_all_carpark_ids", return_value=mock_all_carparks_response),
+        patch("app.services.nsw_transport_api.get_no_update_carparks", return_value={"222", "333"}),
+        patch("app.services.nsw_transport_api.staleness_tracker.seen_within", return_value=False),
+    ):
+        first = get_carpark_locations()
+        renewed = get_carpark_locations(renew=True)
+        assert renewed == first and renewed is not first
+        assert get_carpark_locations() is renewed
+        assert details.call_count == 2
+
+        sweep_progress.pause()
+        assert get_carpark_locations(renew=True) is renewed
+        assert details.call_count == 2
+
+
+def test_get_carpark_locations_skips_recently_seen(mock_carpark_details, mock_all_carparks_response):
+    """
+    Test the locations sweep.
+
+    This test verifies that a carpark fetched recently (e.g. by the no-update sweep) is located from its
+    last known details without a request, and that the others are fetched.
+    """
+    nsw_transport_api._build_carpark_locations.cache_clear()
+    current_time = get_local_time()
+    staleness_tracker.update("111", current_time, False, current_time)
+    last_known_details.put("111", mock_carpark_details)
+    staleness_tracker.update("222", current_time, False, current_time - timedelta(days=2))
+
+    with (
+        patch("app.services.nsw_transport_api.get_carpark_details", return_value=mock_carpark_details) as mock_details,
+        patch("app.services.nsw_transport_api.get_all_carpark_ids", return_value=mock_all_carparks_response),
+        patch("app.services.nsw_transport_api.get_no_update_carparks", return_value={"333"}),
+    ):
+        locations = get_carpark_locations()
+
+    assert [carpark["facility_id"] for carpark in locations["carparks"]] == ["111", "222"]
+    assert [call.args[0] for call in mock_details.call_args_list] == ["222"]
+
+
 def test_available_status():
     """
     Test the available_status function.
@@ -520,3 +743,163 @@ def test_available_status():
     assert available_status(100, 80) == "Available"
     assert available_status(100, 99) == "Almost Full"
     assert available_status(100, 100) == "Full"
+
+
+def test_make_api_request_circuit_open(mock_url, mock_headers):
+    """
+    Test the make_api_request function.
+
+    This test verifies that no request is sent while the circuit breaker is open.
+
+    Parameters:
+        mock_url: the mock url
+        mock_headers: the mock headers
+    """
+    for _ in range(nsw_transport_api.upstream_breaker.failure_threshold):
+        nsw_transport_api.upstream_breaker.record_failure()
+
+    with patch("app.services.nsw_transport_api.requests.get") as mock_get:
+        result = nsw_transport_api.make_api_request(mock_url, mock_headers)
+
+    assert result is None
+    mock_get.assert_not_called()
+
+
+def test_make_api_request_not_found_keeps_circuit_closed(mock_url, mock_headers):
+    """
+    Test the make_api_request function.
+
+    This test verifies that a 404 (unknown facility) does not count as an upstream failure.
+
+    Parameters:
+        mock_url: the mock url
+        mock_headers: the mock headers
+    """
+    mock_response_404 = MagicMock()
+    mock_response_404.status_code = 404
+    mock_response_404.raise_for_status.side_effect = requests.exceptions.HTTPError(response=mock_response_404)
+
+    with patch("app.services.nsw_transport_api.requests.get", return_value=mock_response_404):
+        for _ in range(nsw_transport_api.upstream_breaker.failure_threshold):
+            assert nsw_transport_api.make_api_request(mock_url, mock_headers) is None
+
+    assert nsw_transport_api.upstream_breaker.state == "closed"
+
+
+def test_get_carpark_details_serves_last_known(mock_carpark_details):
+    """
+    Test the get_carpark_details and get_last_known_details functions.
+
+    This test verifies that successfully fetched details are kept as the last known snapshot.
+
+    Parameters:
+        mock_carpark_details: the mock carpark details
+    """
+    with patch("app.services.nsw_transport_api.make_api_request", return_value=mock_carpark_details):
+        nsw_transport_api.get_carpark_details("111")
+
+    with patch("app.services.nsw_transport_api.make_api_request", return_value=None):
+        assert nsw_transport_api.get_carpark_details("111", retry_count=1) is None
+
+    assert nsw_transport_api.get_last_known_details("111") == mock_carpark_details
+    assert nsw_transport_api.get_last_known_details("222") is None
+
+
+def test_get_carpark_locations_serves_stale(mock_carpark_locations):
+    """
+    Test the get_carpark_locations function.
+
+    This test verifies that the last known locations are served, flagged as stale,
+    when the NSW API is unavailable and the cache has expired.
+
+    Parameters:
+        mock_carpark_locations: the mock carpark locations
+    """
+    nsw_transport_api.last_known_fleet.put("carpark_locations", mock_carpark_locations)
+
+    with patch(
+        "app.services.nsw_transport_api._build_carpark_locations",
+        side_effect=nsw_transport_api.UpstreamUnavailableError("down"),
+    ):
+        result = get_carpark_locations()
+
+    assert result == {**mock_carpark_locations, "stale": True}
+
+
+def test_parse_retry_after():
+    """
+    Test the parse_retry_after function.
+
+    This test verifies that both the delay-seconds and the HTTP date formats are parsed.
+    """
+    assert parse_retry_after("2") == 2.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("not a date") is None
+    with patch("app.services.retry_policy.time.time", return_value=1445412470.0):
+        # Wed, 21 Oct 2015 07:28:00 GMT is 10 seconds after the mocked time
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 10.0
+
+
+def test_retry_policy_backoff_full_jitter():
+    """
+    Test the RetryPolicy.backoff method.
+
+    This test verifies that the backoff is drawn between 0 and the exponential cap, bounded by max_delay.
+    """
+    policy = RetryPolicy(base_delay=0.5, max_delay=4)
+
+    with patch("app.services.retry_policy.random.uniform", side_effect=lambda low, high: high) as mock_uniform:
+        assert policy.backoff(0) == 0.5
+        assert policy.backoff(2) == 2.0
+        assert policy.backoff(10) == 4
+        assert policy.backoff(0, retry_after=3) == 3
+
+    assert all(call.args[0] == 0 for call in mock_uniform.call_args_list)
+
+
+def test_retry_policy_requires_an_attempt():
+    """
+    Test the RetryPolicy class.
+
+    This test verifies that a policy without any attempt is rejected, instead of failing on its first request.
+    """
+    with pytest.raises(ValueError):
+        RetryPolicy(max_attempts=0)
+    with pytest.raises(ValueError):
+        RetryPolicy().with_max_attempts(0)
+
+
+def test_get_carpark_locations_single_flight(mock_carpark_details, mock_all_carparks_response):
+    """
+    Test the get_carpark_locations function with concurrent callers.
+
+    This test verifies that the callers arriving while a locations sweep runs wait for its result
+    instead of sweeping again.
+    """
+    nsw_transport_api._build_carpark_locations.cache_clear()
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_details(facility_id):
+        started.set()
+        release.wait(timeout=5)
+        return mock_carpark_details
+
+    with (
+        patch("app.services.nsw_transport_api.get_carpark_details", side_effect=slow_details) as mock_details,
+        patch("app.services.nsw_transport_api.get_all_carpark_ids", return_value=mock_all_carparks_response),
+        patch("app.services.nsw_transport_api.get_no_update_carparks", return_value={"222", "333"}),
+    ):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(get_carpark_locations())) for _ in range(3)]
+        threads[0].start()
+        assert started.wait(timeout=5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join(timeout=5)
+
+    assert mock_details.call_count == 1
+    assert len(results) == 3
+    assert all(result == results[0] for result in results)
@@ -0,0 +1,38 @@
+# test the staleness tracker
+
+from datetime import datetime, timedelta
+
+import pytz
+
+from app.services.staleness_tracker import StalenessTracker
+
+
+def test_staleness_tracker_next_check(mock_sydney_local_time):
+    """
+    Test the StalenessTracker class.
+
+    This test verifies that a recent facility is not due before MessageDate + 24 hours,
+    while a no-update facility or a facility without MessageDate is due on every sweep.
+
+    Parameters:
+        mock_sydney_local_time: the mock sydney local time
+    """
+    sydney = pytz.timezone("Australia/Sydney")
+    now = sydney.localize(datetime.fromisoformat(mock_sydney_local_time))
+    tracker = StalenessTracker(no_update_hours=24)
+
+    assert tracker.is_due("111", now) is True
+
+    tracker.update("111", now - timedelta(hours=1), False, now)
+    assert tracker.get("111").next_check_at == now + timedelta(hours=23)
+    assert tracker.is_due("111", now + timedelta(hours=22)) is False
+    assert tracker.is_due("111", now + timedelta(hours=23)) is True
+
+    tracker.update("222", now - timedelta(hours=48), True, now)
+    tracker.update("333", None, True, now)
+    assert tracker.is_due("222", now) is True
+    assert tracker.is_due("333", now) is True
+
+    tracker.forget("111")
+    assert tracker.is_due("111", now) is True
+    assert len(tracker) == 2
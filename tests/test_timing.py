@@ -0,0 +1,123 @@
+# test the timing.py
+# check if the phases are timed and returned in the Server-Timing header
+# check if slow requests are profiled to disk
+
+import os
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+from app.api.v1.endpoints.carpark import verify_api_key
+from app.core.timing import RequestTimings, SamplingProfiler, _current_profiler, profiled_frame
+from app.main import app
+
+
+def test_request_timings_nested_phases_are_exclusive():
+    """
+    Test the RequestTimings class.
+
+    This test verifies that the time spent in a nested phase is not counted again in the outer phase.
+    """
+    timings = RequestTimings()
+
+    with patch("app.core.timing.time.perf_counter", side_effect=[0.0, 1.0, 3.0, 4.0]):
+        timings.start("cache")
+        timings.start("upstream")
+        timings.stop()
+        timings.stop()
+
+    assert timings.phases == {"upstream": 2.0, "cache": 2.0}
+    assert timings.server_timing(4.0) == "upstream;dur=2000.0, cache;dur=2000.0, total;dur=4000.0"
+
+
+async def test_server_timing_header(async_test_client, mock_carpark_locations, mock_headers, mock_api_key):
+    """
+    Test the timing middleware.
+
+    This test verifies that the nearby endpoint returns its phase breakdown in the Server-Timing header.
+
+    Parameters:
+        async_test_client: the async test client
+        mock_carpark_locations: the mock carpark locations
+        mock_headers: the mock headers
+        mock_api_key: the mock api key
+    """
+    app.dependency_overrides[verify_api_key] = lambda: mock_api_key
+
+    with patch(
+        "app.services.fleet_snapshot.get_carpark_locations",
+        return_value=mock_carpark_locations,
+    ):
+        response = await async_test_client.get(
+            "/carparks/nearby?lat=-33.8145&lng=151.0096&radius_km=1",
+            headers=mock_headers,
+        )
+
+    assert response.status_code == 200
+    server_timing = response.headers["Server-Timing"]
+    for phase in ("cache", "compute", "serialize", "total"):
+        assert f"{phase};dur=" in server_timing
+
+    app.dependency_overrides = {}
+
+
+async def test_slow_request_profile_written(async_test_client, tmp_path):
+    """
+    Test the timing middleware.
+
+    This test verifies that a sampled request slower than the threshold has its profile written to disk.
+
+    Parameters:
+        async_test_client: the async test client
+        tmp_path: the temporary directory for the profiles
+    """
+    with (
+        patch("app.core.timing.PROFILE_SAMPLE_RATE", 1.0),
+        patch("app.core.timing.PROFILE_SLOW_REQUEST_MS", 0),
+        patch("app.core.timing.PROFILE_INTERVAL_MS", 1),
+        patch("app.core.timing.PROFILE_DIR", str(tmp_path)),
+    ):
+        response = await async_test_client.get("/metrics")
+
+    assert response.status_code == 200
+    profiles = os.listdir(tmp_path)
+    assert len(profiles) == 1
+    assert profiles[0].endswith("-metrics-{}.collapsed".format(os.getpid()))
+
+
+def test_sampling_profiler_samples_the_request_only():
+    """
+    Test the SamplingProfiler class.
+
+    This test verifies that only the stacks running through a frame tracked by the profiled request are sampled,
+    not those of the other threads serving other requests.
+    """
+    done = threading.Event()
+
+    def other_request():
+        while not done.is_set():
+            sum(range(1000))
+
+    def profiled_request():
+        with profiled_frame(sys._getframe()):
+            deadline = time.monotonic() + 0.2
+            while time.monotonic() < deadline:
+                sum(range(1000))
+
+    other = threading.Thread(target=other_request)
+    other.start()
+    profiler = SamplingProfiler(0.001)
+    token = _current_profiler.set(profiler)
+    try:
+        profiler.start()
+        profiled_request()
+        profiler.stop()
+    finally:
+        _current_profiler.reset(token)
+        done.set()
+        other.join()
+
+    assert profiler.samples
+    assert all("profiled_request" in stack for stack in profiler.samples)
+    assert not any("other_request" in stack for stack in profiler.samples)
@@ -5,7 +5,7 @@ from pytz import timezone as pytz_timezone
 
 from app.services.nsw_transport_api import available_status
 from app.utils.distance import haversine_distance
-from app.utils.time_utils import get_local_time, parse_message_date
+from app.utils.time_utils import get_local_time, parse_local_datetime, parse_message_date
 
 
 def test_haversine_distance():
@@ -55,3 +55,68 @@ def test_parse_message_date(mock_sydney_local_time):
     # check if the timezone is Australia/Sydney
     assert result.tzinfo is not None
     assert result.tzinfo.zone == "Australia/Sydney"
+
+
+def test_parse_message_date_dst_transitions():
+    """
+    Test parse_message_date around the Sydney DST transitions.
+
+    This test verifies that the repeated hour (clocks going back) is read as its first, daylight saving,
+    occurrence, and that the skipped hour (clocks going forward) is read as standard time.
+    """
+    # 2025-04-06: 03:00 AEDT -> 02:00 AEST, 02:30 happens twice
+    ambiguous = parse_message_date("2025-04-06T02:30:00")
+    assert ambiguous.utcoffset().total_seconds() == 11 * 3600
+    assert ambiguous < parse_message_date("2025-04-06T03:30:00")
+
+    # 2025-10-05: 02:00 AEST -> 03:00 AEDT, 02:30 does not exist
+    skipped = parse_message_date("2025-10-05T02:30:00")
+    assert skipped.strftime("%H:%M") == "03:30"
+    assert skipped.utcoffset().total_seconds() == 11 * 3600
+
+
+def test_parse_message_date_formats():
+    """
+    Test parse_message_date with other and invalid inputs.
+
+    This test verifies that an explicit UTC offset is honoured, and that invalid dates give None.
+    """
+    result = parse_message_date("2025-06-12T01:08:35+00:00")
+    assert result.strftime("%Y-%m-%d %H:%M:%S") == "2025-06-12 11:08:35"
+    assert result.tzinfo.zone == "Australia/Sydney"
+
+    assert parse_message_date("12/06/2025 11:08") is None
+    assert parse_message_date(None) is None
+
+
+def test_parse_message_date_memoized(mock_sydney_local_time):
+    """
+    Test parse_message_date memoization.
+
+    This test verifies that a repeated MessageDate is parsed once.
+    """
+    parse_local_datetime.cache_clear()
+
+    first = parse_message_date(mock_sydney_local_time)
+    second = parse_message_date(mock_sydney_local_time)
+
+    assert first is second
+    assert parse_local_datetime.cache_info().hits == 1
+
+
+def test_parse_message_date_matches_pytz():
+    """
+    Test parse_message_date against pytz.
+
+    This test verifies that the cached offsets give the same result as pytz, every 10 minutes
+    of the two DST transition days (except the skipped and repeated hours, tested above).
+    """
+    sydney = pytz_timezone("Australia/Sydney")
+    for day in ("2025-04-06", "2025-10-05"):
+        for minutes in range(0, 24 * 60, 10):
+            date_str = "{}T{:02d}:{:02d}:00".format(day, minutes // 60, minutes % 60)
+            if minutes // 60 == 2:
+                continue
+            expected = sydney.localize(datetime.fromisoformat(date_str), is_dst=None)
+            assert parse_message_date(date_str) == expected
+            assert parse_message_date(date_str).utcoffset() == expected.utcoffset()
@@ -0,0 +1,46 @@
+# test the zone parsing
+
+from app.services.zone_service import Zone, ZoneCache, parse_zones
+
+
+def test_parse_zones(mock_carpark_details):
+    """
+    Test the parse_zones function.
+
+    This test verifies that the zones are parsed, skipping the invalid ones,
+    and that details without zones have no zones.
+
+    Parameters:
+        mock_carpark_details: the mock carpark details
+    """
+    details = {
+        **mock_carpark_details,
+        "zones": [
+            {"zone_id": "1", "zone_name": "Level 1", "spots": "60", "occupancy": {"total": "60"}},
+            {"zone_id": "2", "zone_name": "Level 2", "spots": "40", "occupancy": {"total": "0"}},
+            {"zone_id": "3", "zone_name": "Broken", "spots": "n/a", "occupancy": {"total": "1"}},
+        ],
+    }
+
+    assert parse_zones(details) == (Zone("1", "Level 1", 60, 60), Zone("2", "Level 2", 40, 0))
+    assert parse_zones(mock_carpark_details) == ()
+
+
+def test_zone_cache_parses_once_per_snapshot(mock_carpark_details):
+    """
+    Test the ZoneCache class.
+
+    This test verifies that the zones of the same details payload are parsed once,
+    and parsed again for a refreshed payload.
+
+    Parameters:
+        mock_carpark_details: the mock carpark details
+    """
+    cache = ZoneCache()
+    details = {**mock_carpark_details, "zones": [{"zone_id": "1", "spots": "10", "occupancy": {"total": "5"}}]}
+
+    zones = cache.get("111", details)
+    assert cache.get("111", details) is zones
+
+    refreshed = {**details, "zones": [{"zone_id": "1", "spots": "10", "occupancy": {"total": "7"}}]}
+    assert cache.get("111", refreshed)[0].occupancy == 7